@@ -12,10 +12,14 @@ enum Config {
     // To configure: Copy Secrets.swift.example to Secrets.swift and add your IP
     static let baseURL = Secrets.backendURL
     
+    // Room node to control when baseURL points at a gateway, e.g. "bedroom"; nil talks to baseURL directly
+    static let node: String? = nil
+    
     // API endpoints
     enum API {
-        static let ac = "/ac"
-        static let light = "/light"
+        static let prefix = Config.node.map { "/nodes/\($0)" } ?? ""
+        static let ac = prefix + "/ac"
+        static let light = prefix + "/light"
     }
 }
 
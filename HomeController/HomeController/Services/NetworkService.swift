@@ -27,6 +27,8 @@ class NetworkService {
         var request = URLRequest(url: url)
         request.httpMethod = "POST"
         request.setValue("application/json", forHTTPHeaderField: "Content-Type")
+        // One key per button press: retries of this request are answered from the server cache
+        request.setValue(UUID().uuidString, forHTTPHeaderField: "Idempotency-Key")
         
         let (data, response) = try await URLSession.shared.data(for: request)
         
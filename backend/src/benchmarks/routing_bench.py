@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Route count vs startup/latency benchmark
+
+Builds one app per size with the manifest-driven `/{device}/{action}`
+handler and one with a GET and a POST route per action (the previous
+hand-written style), then measures app build time and request latency for
+the last registered action. Transmission is stubbed out.
+
+Run from backend/src:
+    python -m benchmarks.routing_bench [--sizes 10,100,1000] [--actions 10]
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+from fastapi import APIRouter, FastAPI
+
+from services.device_registry import DeviceRegistry
+from services.state_store import DeviceStateStore
+from services.tx_scheduler import TransmitScheduler
+
+CODE = "pulse 9000\nspace 4500\npulse 560\n"
+
+
+class StubTransmitter:
+    name = "stub"
+
+    async def send(self, pulses, carrier=None, source=None):
+        return None
+
+
+def _write_manifest(root: Path, devices: int, actions: int) -> Path:
+    manifest = {"devices": {}}
+    for d in range(devices):
+        name = f"dev{d}"
+        codes_dir = root / name
+        codes_dir.mkdir()
+        for a in range(actions):
+            (codes_dir / f"{name}_code{a}.txt").write_text(CODE)
+        manifest["devices"][name] = {
+            "resources_path": str(codes_dir),
+            "carrier": 38000,
+            "actions": {f"button/{a}": f"code{a}" for a in range(actions)}
+        }
+    path = root / "devices.json"
+    path.write_text(json.dumps(manifest))
+    return path
+
+
+def _build_registry_app(manifest: Path, root: Path):
+    registry = DeviceRegistry.from_file(
+        str(manifest),
+        scheduler=TransmitScheduler(StubTransmitter(), frame_gap=0),
+        state_store=DeviceStateStore(str(root / "state.json"))
+    )
+    app = FastAPI()
+
+    @app.api_route("/{device}/{action:path}", methods=["GET", "POST"])
+    async def run_device_action(device: str, action: str):
+        return await registry.lookup(device, action).handler()
+
+    return app, registry
+
+
+def _build_explicit_app(registry: DeviceRegistry):
+    """One GET and one POST route per action, like the old hand-written routers"""
+    app = FastAPI()
+    router = APIRouter()
+    for (device, route), entry in registry._dispatch.items():
+        def make(entry=entry):
+            async def handler():
+                return await entry.handler()
+            return handler
+        router.add_api_route(f"/{device}/{route}", make(), methods=["GET"])
+        router.add_api_route(f"/{device}/{route}", make(), methods=["POST"])
+    app.include_router(router)
+    return app, router
+
+
+async def _latency(app: FastAPI, path: str, requests: int) -> float:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        for _ in range(10):
+            await client.post(path)
+        started = time.perf_counter()
+        for _ in range(requests):
+            response = await client.post(path)
+            assert response.status_code == 200, response.text
+        return (time.perf_counter() - started) / requests
+
+
+def run(sizes: list[int], actions: int, requests: int) -> list[dict]:
+    results = []
+    for devices in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            manifest = _write_manifest(root, devices, actions)
+
+            started = time.perf_counter()
+            registry_app, registry = _build_registry_app(manifest, root)
+            registry_startup = time.perf_counter() - started
+
+            started = time.perf_counter()
+            explicit_app, explicit_router = _build_explicit_app(registry)
+            explicit_startup = time.perf_counter() - started + registry_startup
+
+            path = f"/dev{devices - 1}/button/{actions - 1}"
+            results.append({
+                "devices": devices,
+                "actions": devices * actions,
+                "registry_routes": 1,
+                "explicit_routes": len(explicit_router.routes),
+                "registry_startup_ms": round(registry_startup * 1000, 3),
+                "explicit_startup_ms": round(explicit_startup * 1000, 3),
+                "registry_latency_us": round(asyncio.run(_latency(registry_app, path, requests)) * 1e6, 1),
+                "explicit_latency_us": round(asyncio.run(_latency(explicit_app, path, requests)) * 1e6, 1)
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10,100,1000", help="comma separated device counts")
+    parser.add_argument("--actions", type=int, default=10, help="actions per device")
+    parser.add_argument("--requests", type=int, default=200, help="timed requests per app")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    for result in run(sizes, args.actions, args.requests):
+        json.dump(result, sys.stdout)
+        sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
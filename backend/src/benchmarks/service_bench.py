@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Service-layer microbenchmarks
+
+Runs LightService, ACService and the routers in-process with the transmitter
+swapped for a stub, and times each hot path on its own:
+
+    path_resolution    manifest dispatch lookup
+    code_lookup        cached CodeLibrary.get
+    code_rescan        CodeLibrary.rescan with nothing changed
+    code_parse         parse_mode2 of a two-frame AC recording
+    response_build     pydantic response validation and JSON encoding
+    response_cached    cached /ac/status body and ETag with no state change,
+                       the per-request work left once a body is cached
+    dispatch_light     LightService.set_light_mode through the scheduler
+    dispatch_ac        ACService.set_ac_mode through the scheduler
+    spawn_ir_ctl       IrCtlTransmitter.send against a no-op ir-ctl script
+    http_light         POST /light/on through the ASGI app
+    http_ac_status     GET /ac/status through the ASGI app
+
+Results are printed as one JSON document. --save stores them as a baseline
+and --compare exits with status 1 when any case's median is more than
+--threshold times its baseline.
+
+Run from backend/src:
+    python -m benchmarks.service_bench [--number 2000] [--compare benchmarks/baselines.json]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import stat
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BASELINES = Path(__file__).resolve().parent / "baselines.json"
+
+LIGHT_CODES = ("all_bright", "bright", "dark", "off", "on")
+AC_CODES = (
+    "aircon_on", "heater_on", "off",
+    "aircon_temp_up", "heater_temp_up", "heater_temp_down",
+    "timer_on", "timer_up", "timer_down",
+)
+
+
+class StubTransmitter:
+    name = "stub"
+
+    async def send(self, pulses, carrier=None, source=None):
+        return None
+
+
+def _prepare_environment(root: Path) -> None:
+    """Point env.py at throwaway codes and a no-op ir-ctl; must run before the app is imported"""
+    bin_dir = root / "bin"
+    bin_dir.mkdir()
+    ir_ctl = bin_dir / "ir-ctl"
+    ir_ctl.write_text("#!/bin/sh\nexit 0\n")
+    ir_ctl.chmod(ir_ctl.stat().st_mode | stat.S_IXUSR)
+
+    os.environ.update({
+        "IR_CODE_DIR": str(root),
+        "IR_LIGHT_RESOURCES_PATH": str(root),
+        "IR_AC_RESOURCES_PATH": str(root),
+        "TRANSMITTER_DEVICE": str(root / "lirc0"),
+        "TRANSMITTER_BACKEND": "ir-ctl",
+        "TRANSMIT_FRAME_GAP_MS": "0",
+        "ADMISSION_GLOBAL_RATE": "0",
+        "ADMISSION_CLIENT_RATE": "0",
+        "ADMISSION_MAX_QUEUE": "0",
+        "STATE_SNAPSHOT_FILE": str(root / "state.json"),
+        "SCENES_FILE": str(root / "scenes.json"),
+        "PATH": f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}",
+    })
+    os.environ.pop("IR_CODE_LIBRARY", None)
+    os.environ.pop("DEVICE_MANIFEST", None)
+
+    from services.ir_protocol import AEHA, DecodedSignal, encode
+    from services.transmitter import format_mode2
+
+    frames = [bytes.fromhex("2302cb26010000"), bytes.fromhex("2302cb26010020581000000000000000000068")]
+    recording = format_mode2(encode(DecodedSignal(AEHA, frames, unit=430, frame_gap=13000)))
+    for name in LIGHT_CODES:
+        (root / f"light_{name}.txt").write_text(recording)
+    for name in AC_CODES:
+        (root / f"ac_{name}.txt").write_text(recording)
+
+
+def _summarize(samples: list[float], number: int) -> dict:
+    per_op = [sample / number * 1e6 for sample in samples]
+    return {
+        "median_us": round(statistics.median(per_op), 3),
+        "min_us": round(min(per_op), 3),
+        "ops": number * len(samples)
+    }
+
+
+def _time_sync(fn, number: int, repeat: int) -> dict:
+    fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append(time.perf_counter() - started)
+    return _summarize(samples, number)
+
+
+async def _time_async(fn, number: int, repeat: int) -> dict:
+    await fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            await fn()
+        samples.append(time.perf_counter() - started)
+    return _summarize(samples, number)
+
+
+def run(number: int, repeat: int, only=None) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        _prepare_environment(root)
+
+        # Imported here so env.py sees the benchmark environment
+        import httpx
+        from main import app
+        from models.ac_model import ACMode, ACStatusResponse
+        from models.light_model import LightMode, LightResponse
+        from routers.ac_router import ac_service, status_body
+        from routers.device_router import registry
+        from routers.light_router import light_service
+        from services.state_store import get_state_store
+        from services.transmitter import IrCtlTransmitter, parse_mode2
+        from services.tx_scheduler import get_scheduler
+
+        # Per-request INFO logs would dominate the HTTP cases
+        logging.getLogger().setLevel(logging.WARNING)
+        logging.getLogger("httpx").setLevel(logging.WARNING)
+        get_scheduler().transmitter = StubTransmitter()
+        recording_path = root / "ac_aircon_on.txt"
+        recording = recording_path.read_text()
+        pulses = parse_mode2(recording)
+        ir_ctl = IrCtlTransmitter(str(root / "lirc0"))
+        response = {"mode": "on", "success": True, "message": "Light set to on mode successfully",
+                    "queue_wait_ms": 0.012}
+
+        sync_cases = {
+            "path_resolution": lambda: registry.lookup("ac", "heater/temp/down"),
+            "code_lookup": lambda: light_service.codes.get(LightMode.ON),
+            "code_rescan": light_service.codes.rescan,
+            "code_parse": lambda: parse_mode2(recording),
+            "response_build": lambda: (
+                LightResponse(**response).model_dump_json(),
+                ACStatusResponse.model_validate(ac_service.get_status()).model_dump_json()
+            ),
+            "response_cached": status_body.get,
+        }
+
+        def async_cases(client) -> dict:
+            return {
+                "dispatch_light": (lambda: light_service.set_light_mode(LightMode.ON), number),
+                "dispatch_ac": (lambda: ac_service.set_ac_mode(ACMode.OFF), number),
+                "spawn_ir_ctl": (lambda: ir_ctl.send(pulses, 38000, source=recording_path), max(number // 50, 5)),
+                "http_light": (lambda: client.post("/light/on"), max(number // 10, 5)),
+                "http_ac_status": (lambda: client.get("/ac/status"), max(number // 10, 5)),
+            }
+
+        results = {}
+        for name, fn in sync_cases.items():
+            if only is None or name in only:
+                results[name] = _time_sync(fn, number, repeat)
+
+        async def run_async():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                for name, (fn, count) in async_cases(client).items():
+                    if only is None or name in only:
+                        results[name] = await _time_async(fn, count, repeat)
+            await get_state_store().flush()
+
+        asyncio.run(run_async())
+        return results
+
+
+def compare(results: dict, baselines: dict, threshold: float) -> list[dict]:
+    """Cases whose median is more than `threshold` times their baseline"""
+    regressions = []
+    for name, result in results.items():
+        baseline = baselines.get(name)
+        if baseline is None:
+            continue
+        ratio = result["median_us"] / baseline["median_us"]
+        if ratio > threshold:
+            regressions.append({"case": name, "ratio": round(ratio, 2),
+                                "median_us": result["median_us"], "baseline_us": baseline["median_us"]})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=2000, help="calls per timed repeat")
+    parser.add_argument("--repeat", type=int, default=5, help="timed repeats per case")
+    parser.add_argument("--only", help="comma separated case names")
+    parser.add_argument("--save", metavar="FILE", nargs="?", const=str(BASELINES), help="write results as baselines")
+    parser.add_argument("--compare", metavar="FILE", nargs="?", const=str(BASELINES), help="compare with baselines")
+    parser.add_argument("--threshold", type=float, default=1.5, help="allowed median / baseline ratio")
+    args = parser.parse_args()
+
+    only = set(args.only.split(",")) if args.only else None
+    results = run(args.number, args.repeat, only)
+    output = {"python": sys.version.split()[0], "cases": results}
+
+    status = 0
+    if args.compare:
+        baselines = json.loads(Path(args.compare).read_text())["cases"]
+        output["regressions"] = compare(results, baselines, args.threshold)
+        status = 1 if output["regressions"] else 0
+    if args.save:
+        Path(args.save).write_text(json.dumps(output, indent=2) + "\n")
+
+    json.dump(output, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
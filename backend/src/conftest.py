@@ -0,0 +1,96 @@
+"""
+Shared pytest setup for the backend.
+
+The services read their configuration from env.py at import time, so the
+environment has to point at a throwaway IR code directory before any of the
+application modules are imported.
+"""
+
+import asyncio
+import os
+import stat
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# test_api.py is a smoke script for a live server, not a pytest module
+collect_ignore = ["test_api.py"]
+
+SAMPLE_MODE2 = "pulse 9000\nspace 4500\npulse 560\nspace 560\npulse 560\nspace 1690\npulse 560\n"
+
+_ir_code_dir = Path(tempfile.mkdtemp(prefix="ir_codes_"))
+_bin_dir = _ir_code_dir / "bin"
+_bin_dir.mkdir()
+
+for _name in ("all_bright", "bright", "dark", "off", "on"):
+    (_ir_code_dir / f"light_{_name}.txt").write_text(SAMPLE_MODE2)
+for _name in (
+    "aircon_on", "heater_on", "off",
+    "aircon_temp_up", "heater_temp_up", "heater_temp_down",
+    "timer_on", "timer_up", "timer_down",
+):
+    (_ir_code_dir / f"ac_{_name}.txt").write_text(SAMPLE_MODE2)
+
+# Stand-in for ir-ctl: optionally sleeps and fails based on env variables
+_fake_ir_ctl = _bin_dir / "ir-ctl"
+_fake_ir_ctl.write_text(
+    "#!/bin/sh\n"
+    "sleep \"${FAKE_IR_CTL_DELAY:-0}\"\n"
+    "exit \"${FAKE_IR_CTL_EXIT:-0}\"\n"
+)
+_fake_ir_ctl.chmod(_fake_ir_ctl.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+os.environ["IR_CODE_DIR"] = str(_ir_code_dir)
+os.environ["IR_LIGHT_RESOURCES_PATH"] = str(_ir_code_dir)
+os.environ["IR_AC_RESOURCES_PATH"] = str(_ir_code_dir)
+os.environ["TRANSMITTER_DEVICE"] = str(_ir_code_dir / "lirc0")
+os.environ["RECEIVER_DEVICE"] = str(_ir_code_dir / "lirc1")
+os.environ["TRANSMITTER_BACKEND"] = "ir-ctl"
+os.environ["TRANSMIT_FRAME_GAP_MS"] = "5"
+# Admission limits are exercised by their own tests with dedicated controllers
+for _name in ("ADMISSION_GLOBAL_RATE", "ADMISSION_CLIENT_RATE", "ADMISSION_MAX_QUEUE"):
+    os.environ[_name] = "0"
+os.environ["PATH"] = f"{_bin_dir}{os.pathsep}{os.environ.get('PATH', '')}"
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+
+@pytest.fixture
+def ir_code_dir() -> Path:
+    return _ir_code_dir
+
+
+class FakeTransmitter:
+    """Records every frame with its start and end time; optionally slow or failing"""
+
+    name = "fake"
+
+    def __init__(self, airtime: float = 0.0, fail: bool = False):
+        self.airtime = airtime
+        self.fail = fail
+        self.frames = []
+        self.active = 0
+        self.max_active = 0
+
+    async def send(self, pulses, carrier=None, source=None):
+        loop = asyncio.get_running_loop()
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        started = loop.time()
+        try:
+            if self.airtime:
+                await asyncio.sleep(self.airtime)
+            if self.fail:
+                from services.transmitter import TransmitterError
+                raise TransmitterError("fake transmitter failure")
+            self.frames.append((pulses.tolist(), carrier, started, loop.time()))
+        finally:
+            self.active -= 1
+
+
+@pytest.fixture
+def fake_transmitter():
+    """Factory for FakeTransmitter instances"""
+    return FakeTransmitter
@@ -7,4 +7,98 @@ IR_CODE_DIR = os.getenv('IR_CODE_DIR')
 IR_LIGHT_RESOURCES_PATH = os.getenv('IR_LIGHT_RESOURCES_PATH')
 IR_AC_RESOURCES_PATH = os.getenv('IR_AC_RESOURCES_PATH')
 TRANSMITTER_DEVICE = os.getenv('TRANSMITTER_DEVICE')
-RECEIVER_DEVICE = os.getenv('RECEIVER_DEVICE')
\ No newline at end of file
+# Additional emitters as name=device pairs, e.g. "living=/dev/lirc0,bedroom=/dev/lirc2";
+# manifest devices pick one with their "emitter" key
+TRANSMITTER_DEVICES = os.getenv('TRANSMITTER_DEVICES')
+RECEIVER_DEVICE = os.getenv('RECEIVER_DEVICE')
+
+# Transmitter backend: "lirc" writes to the device directly, "ir-ctl" spawns ir-ctl,
+# "auto" uses lirc when the device can be opened and falls back to ir-ctl,
+# "simulated" only waits for the airtime of each frame, "daemon" sends through the transmitter daemon
+TRANSMITTER_BACKEND = os.getenv('TRANSMITTER_BACKEND', 'auto')
+
+# Simulated backend: overhead per frame, share of frames that fail or time out, how long a
+# timeout hangs and an optional random seed for repeatable runs
+SIMULATED_OVERHEAD_MS = float(os.getenv('SIMULATED_OVERHEAD_MS', '0'))
+SIMULATED_FAILURE_RATE = float(os.getenv('SIMULATED_FAILURE_RATE', '0'))
+SIMULATED_TIMEOUT_RATE = float(os.getenv('SIMULATED_TIMEOUT_RATE', '0'))
+SIMULATED_TIMEOUT_S = float(os.getenv('SIMULATED_TIMEOUT_S', '10'))
+SIMULATED_SEED = int(os.getenv('SIMULATED_SEED')) if os.getenv('SIMULATED_SEED') else None
+
+# Transmitter daemon (TRANSMITTER_BACKEND=daemon): its Unix socket, the backend the daemon itself
+# drives the emitters with, and the connections each worker keeps open to it
+TRANSMITTER_SOCKET = os.getenv('TRANSMITTER_SOCKET')
+TRANSMITTER_DAEMON_BACKEND = os.getenv('TRANSMITTER_DAEMON_BACKEND', 'auto')
+TRANSMITTER_POOL_SIZE = int(os.getenv('TRANSMITTER_POOL_SIZE', '4'))
+
+# Lock file that elects the one worker running schedules and gateway health checks
+PRIMARY_LOCK_FILE = os.getenv('PRIMARY_LOCK_FILE')
+
+# Minimum silence between two IR frames sent by the transmitter scheduler
+TRANSMIT_FRAME_GAP_MS = int(os.getenv('TRANSMIT_FRAME_GAP_MS', '100'))
+
+# JSON file that stores named scenes for the batch endpoint
+SCENES_FILE = os.getenv('SCENES_FILE')
+
+# AC setpoint tracking used to compute absolute temperature/timer press sequences
+AC_TEMP_MIN = int(os.getenv('AC_TEMP_MIN', '16'))
+AC_TEMP_MAX = int(os.getenv('AC_TEMP_MAX', '30'))
+AC_AIRCON_DEFAULT_TEMP = int(os.getenv('AC_AIRCON_DEFAULT_TEMP', '26'))
+AC_HEATER_DEFAULT_TEMP = int(os.getenv('AC_HEATER_DEFAULT_TEMP', '22'))
+AC_TIMER_DEFAULT_HOURS = int(os.getenv('AC_TIMER_DEFAULT_HOURS', '1'))
+AC_TIMER_MAX_HOURS = int(os.getenv('AC_TIMER_MAX_HOURS', '12'))
+
+# JSON snapshot of the tracked device state, restored on startup
+STATE_SNAPSHOT_FILE = os.getenv('STATE_SNAPSHOT_FILE')
+
+# JSON manifest describing devices, their actions, code files and carrier
+DEVICE_MANIFEST = os.getenv('DEVICE_MANIFEST')
+
+# Events buffered per /ws client before the oldest are dropped
+EVENT_QUEUE_SIZE = int(os.getenv('EVENT_QUEUE_SIZE', '100'))
+
+# Optional binary IR code library (see services/ir_library.py) used instead of mode2 files
+IR_CODE_LIBRARY = os.getenv('IR_CODE_LIBRARY')
+
+# Learning new codes from RECEIVER_DEVICE: captures to average and how long to wait for them
+LEARN_CAPTURES = int(os.getenv('LEARN_CAPTURES', '3'))
+LEARN_TIMEOUT_S = float(os.getenv('LEARN_TIMEOUT_S', '15'))
+
+# Loopback verification: check every frame against its echo on RECEIVER_DEVICE, the most copies
+# a mode command is sent with up front and the resends after a missed echo
+TRANSMIT_VERIFY = os.getenv('TRANSMIT_VERIFY', '0').lower() in ('1', 'true', 'yes')
+VERIFY_MAX_REPEATS = int(os.getenv('VERIFY_MAX_REPEATS', '3'))
+VERIFY_MAX_RESENDS = int(os.getenv('VERIFY_MAX_RESENDS', '2'))
+
+# Responses kept for repeated Idempotency-Key requests: seconds after completion and maximum entries
+IDEMPOTENCY_TTL_S = float(os.getenv('IDEMPOTENCY_TTL_S', '60'))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv('IDEMPOTENCY_MAX_ENTRIES', '1024'))
+
+# JSON file that stores timed and recurring device actions
+SCHEDULES_FILE = os.getenv('SCHEDULES_FILE')
+
+# Gateway mode: downstream nodes as name=url pairs, e.g. "living=http://10.0.0.2:8000,bedroom=http://10.0.0.3:8000",
+# seconds between health checks and the timeout of forwarded requests
+GATEWAY_NODES = os.getenv('GATEWAY_NODES')
+GATEWAY_HEALTH_INTERVAL_S = float(os.getenv('GATEWAY_HEALTH_INTERVAL_S', '5'))
+GATEWAY_TIMEOUT_S = float(os.getenv('GATEWAY_TIMEOUT_S', '5'))
+
+# SQLite command history with hourly and daily usage rollups, and the seconds commands are
+# buffered before they are written in one transaction
+HISTORY_DB = os.getenv('HISTORY_DB')
+HISTORY_FLUSH_S = float(os.getenv('HISTORY_FLUSH_S', '2'))
+
+# Logging: level, "text" or "json" lines, requests kept for /debug/requests and the duration
+# from which a request is logged as slow
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+REQUEST_LOG_SIZE = int(os.getenv('REQUEST_LOG_SIZE', '200'))
+REQUEST_SLOW_MS = float(os.getenv('REQUEST_SLOW_MS', '500'))
+
+# Admission control for commands: token buckets (per second, burst) for all clients together and
+# for each client, and the most commands a device may have waiting; 0 disables a limit
+ADMISSION_GLOBAL_RATE = float(os.getenv('ADMISSION_GLOBAL_RATE', '20'))
+ADMISSION_GLOBAL_BURST = float(os.getenv('ADMISSION_GLOBAL_BURST', '40'))
+ADMISSION_CLIENT_RATE = float(os.getenv('ADMISSION_CLIENT_RATE', '5'))
+ADMISSION_CLIENT_BURST = float(os.getenv('ADMISSION_CLIENT_BURST', '10'))
+ADMISSION_MAX_QUEUE = int(os.getenv('ADMISSION_MAX_QUEUE', '20'))
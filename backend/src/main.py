@@ -1,18 +1,77 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, Request
+from fastapi.exception_handlers import http_exception_handler
 from fastapi.responses import JSONResponse
-from routers import light_router, ac_router
+from starlette.exceptions import HTTPException as StarletteHTTPException
+from routers import (
+    light_router,
+    ac_router,
+    batch_router,
+    debug_router,
+    device_router,
+    gateway_router,
+    history_router,
+    learn_router,
+    metrics_router,
+    schedule_router,
+    transmitter_router,
+    ws_router
+)
+from services.admission import AdmissionRejectedError
+from services.gateway import get_gateway
+from services.history import get_history_store
+from services.idempotency import IdempotencyMiddleware
+from services.json_response import CachedJSON
+from services.metrics import HTTP_EXCEPTIONS, MetricsMiddleware
+from services.primary_worker import get_primary_lock
+from services.request_log import RequestLogMiddleware, configure_logging
+from services.state_store import get_state_store
 import logging
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Log records are written by a background thread, never on the event loop
+configure_logging()
 logger = logging.getLogger(__name__)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Reload IR codes that are re-recorded while the server is running
+    code_libraries = device_router.registry.code_libraries()
+    for library in code_libraries:
+        library.start_watching()
+    # With several workers only one fires schedules and polls gateway nodes
+    primary = get_primary_lock().acquire()
+    if primary:
+        schedule_router.action_scheduler.start()
+    else:
+        logger.info("Another worker is primary; schedules and gateway health checks run there")
+    if get_gateway():
+        get_gateway().start(poll=primary)
+    yield
+    if get_gateway():
+        await get_gateway().stop()
+    await schedule_router.action_scheduler.stop()
+    for library in code_libraries:
+        library.stop_watching()
+    await get_state_store().flush()
+    await get_history_store().flush()
+    get_primary_lock().release()
+
+
 app = FastAPI(
     title="Home Controller API",
     description="API for controlling home devices via IR",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# Repeated command requests with the same Idempotency-Key are answered from a cache
+app.add_middleware(IdempotencyMiddleware)
+# Request counts, latency histograms and in-flight requests for /metrics
+app.add_middleware(MetricsMiddleware)
+# Request ids and the ring buffer behind /debug/requests (outermost)
+app.add_middleware(RequestLogMiddleware)
+
 
 # Custom exception classes
 class LightResourceNotFoundError(Exception):
@@ -26,8 +85,17 @@ class IRTransmissionError(Exception):
 
 
 # Global exception handlers
+@app.exception_handler(StarletteHTTPException)
+async def counted_http_exception_handler(request: Request, exc: StarletteHTTPException):
+    # Routers raise HTTPException while handling a service error; count the original type
+    cause = exc.__context__ if exc.__context__ is not None else exc
+    HTTP_EXCEPTIONS.inc(type(cause).__name__)
+    return await http_exception_handler(request, exc)
+
+
 @app.exception_handler(LightResourceNotFoundError)
 async def light_resource_not_found_handler(request: Request, exc: LightResourceNotFoundError):
+    HTTP_EXCEPTIONS.inc(type(exc).__name__)
     logger.error(f"Light resource not found: {exc}")
     return JSONResponse(
         status_code=404,
@@ -40,6 +108,7 @@ async def light_resource_not_found_handler(request: Request, exc: LightResourceN
 
 @app.exception_handler(IRTransmissionError)
 async def ir_transmission_error_handler(request: Request, exc: IRTransmissionError):
+    HTTP_EXCEPTIONS.inc(type(exc).__name__)
     logger.error(f"IR transmission error: {exc}")
     return JSONResponse(
         status_code=500,
@@ -50,8 +119,24 @@ async def ir_transmission_error_handler(request: Request, exc: IRTransmissionErr
     )
 
 
+@app.exception_handler(AdmissionRejectedError)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejectedError):
+    HTTP_EXCEPTIONS.inc(type(exc).__name__)
+    logger.warning(f"Rejected: {exc}")
+    return JSONResponse(
+        status_code=429,
+        content={
+            "detail": str(exc),
+            "error_type": "AdmissionRejectedError",
+            "retry_after_s": round(exc.retry_after, 3)
+        },
+        headers={"Retry-After": exc.retry_after_header}
+    )
+
+
 @app.exception_handler(ValueError)
 async def value_error_handler(request: Request, exc: ValueError):
+    HTTP_EXCEPTIONS.inc(type(exc).__name__)
     logger.error(f"Value error: {exc}")
     return JSONResponse(
         status_code=400,
@@ -65,17 +150,49 @@ async def value_error_handler(request: Request, exc: ValueError):
 # Include routers
 app.include_router(light_router.router)
 app.include_router(ac_router.router)
-
-
-@app.get("/")
-def read_root():
+app.include_router(batch_router.router)
+app.include_router(transmitter_router.router)
+app.include_router(learn_router.router)
+app.include_router(schedule_router.router)
+app.include_router(history_router.router)
+app.include_router(metrics_router.router)
+app.include_router(debug_router.router)
+app.include_router(ws_router.router)
+# Gateway mode: forward /nodes/{node}/light and /ac requests to other Home Controllers
+if get_gateway():
+    app.include_router(gateway_router.router)
+# Generic /{device}/{action} dispatch must come after every fixed route
+app.include_router(device_router.router)
+
+
+def _root() -> dict:
+    endpoints = {
+        "docs": "/docs",
+        "light_control": "/light",
+        "ac_control": "/ac",
+        "batch": "/batch",
+        "scenes": "/scenes",
+        "devices": "/devices",
+        "learn": "/learn/{device}/{action}",
+        "schedules": "/schedules",
+        "history": "/history/usage",
+        "transmitter_status": "/transmitter/status",
+        "metrics": "/metrics",
+        "debug_requests": "/debug/requests",
+        "websocket": "/ws"
+    }
+    if get_gateway():
+        endpoints["nodes"] = "/nodes"
     return {
         "message": "Home Controller API",
         "status": "running",
-        "endpoints": {
-            "docs": "/docs",
-            "light_control": "/light",
-            "ac_control": "/ac"
-        }
+        "endpoints": endpoints
     }
 
+
+root_body = CachedJSON(_root)
+
+
+@app.get("/")
+def read_root(request: Request):
+    return root_body.response(request)
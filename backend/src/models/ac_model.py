@@ -1,4 +1,5 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from typing import Dict, Optional
 from enum import Enum
 
 
@@ -20,14 +21,39 @@ class ACTimerControl(str, Enum):
     TIMER_DOWN = "timer_down"
 
 
+class ACState(BaseModel):
+    mode: Optional[ACMode] = None
+    setpoints: Dict[ACMode, int] = Field(default_factory=dict)
+    timer_hours: Optional[int] = None
+    updated_at: Optional[float] = None
+
+
 class ACResponse(BaseModel):
     action: str
     success: bool
     message: str
+    queue_wait_ms: Optional[float] = None
+
+
+class ACSetpointResponse(ACResponse):
+    presses: int
+    value: int
+
+
+class ACStateRequest(BaseModel):
+    mode: ACMode
+    temperature: Optional[int] = None
+    timer_hours: Optional[int] = None
+
+
+class ACStateResponse(ACResponse):
+    state: ACState
 
 
 class ACStatusResponse(BaseModel):
     available_modes: list[str]
     available_temp_controls: list[str]
     available_timer_controls: list[str]
+    state: ACState
+    full_state_frames: bool = False
 
@@ -0,0 +1,35 @@
+from pydantic import BaseModel, Field
+from typing import Optional
+from enum import Enum
+
+
+class BatchDevice(str, Enum):
+    LIGHT = "light"
+    AC = "ac"
+
+
+class BatchStep(BaseModel):
+    device: BatchDevice
+    action: str
+
+
+class BatchRequest(BaseModel):
+    steps: list[BatchStep] = Field(min_length=1)
+
+
+class BatchStepResult(BaseModel):
+    device: str
+    action: str
+    success: bool
+    message: str
+
+
+class BatchResponse(BaseModel):
+    success: bool
+    steps: list[BatchStepResult]
+    queue_wait_ms: Optional[float] = None
+
+
+class Scene(BaseModel):
+    name: str
+    steps: list[BatchStep]
@@ -0,0 +1,30 @@
+from pydantic import BaseModel
+from typing import Optional
+
+
+class TransmitRecord(BaseModel):
+    code: str
+    emitter: str
+    backend: str
+    repeat: int
+    queue_wait_ms: float
+    airtime_ms: float
+    verified: Optional[bool] = None
+
+
+class RequestRecord(BaseModel):
+    id: str
+    time: float
+    method: str
+    path: str
+    route: Optional[str] = None
+    client: Optional[str] = None
+    status: int
+    duration_ms: float
+    transmits: list[TransmitRecord] = []
+
+
+class RequestLogResponse(BaseModel):
+    size: int
+    slow_ms: float
+    requests: list[RequestRecord]
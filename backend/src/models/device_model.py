@@ -0,0 +1,17 @@
+from pydantic import BaseModel
+from typing import Optional
+
+
+class DeviceResponse(BaseModel):
+    device: str
+    action: str
+    success: bool
+    message: str
+    queue_wait_ms: Optional[float] = None
+
+
+class DeviceInfo(BaseModel):
+    name: str
+    carrier: Optional[int] = None
+    emitter: Optional[str] = None
+    actions: list[str]
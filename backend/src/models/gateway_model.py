@@ -0,0 +1,29 @@
+from pydantic import BaseModel, Field
+from typing import Optional
+from models.batch_model import BatchStep, BatchStepResult
+
+
+class NodeStatus(BaseModel):
+    name: str
+    url: str
+    healthy: bool
+    latency_ms: Optional[float] = None
+    last_check: Optional[float] = None
+    last_error: Optional[str] = None
+
+
+class GatewayBatchStep(BatchStep):
+    node: str
+
+
+class GatewayBatchRequest(BaseModel):
+    steps: list[GatewayBatchStep] = Field(min_length=1)
+
+
+class GatewayStepResult(BatchStepResult):
+    node: str
+
+
+class GatewayBatchResponse(BaseModel):
+    success: bool
+    steps: list[GatewayStepResult]
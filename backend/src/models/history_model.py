@@ -0,0 +1,26 @@
+from pydantic import BaseModel
+from typing import Dict, Literal, Optional
+
+
+class HistoryEvent(BaseModel):
+    time: float
+    device: str
+    action: str
+    mode: Optional[str] = None
+
+
+class UsageRow(BaseModel):
+    device: str
+    mode: str
+    start: float
+    seconds: float
+    switches: int
+
+
+class UsageResponse(BaseModel):
+    bucket: Literal["hour", "day"]
+    start: float
+    end: float
+    rows: list[UsageRow]
+    # Seconds per device and mode over the whole range
+    totals: Dict[str, Dict[str, float]]
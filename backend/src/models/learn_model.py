@@ -0,0 +1,13 @@
+from pydantic import BaseModel
+
+
+class LearnResponse(BaseModel):
+    device: str
+    action: str
+    success: bool
+    message: str
+    file: str
+    captures: int
+    used: int
+    rejected: int
+    durations: int
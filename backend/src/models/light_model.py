@@ -1,4 +1,5 @@
 from pydantic import BaseModel
+from typing import Optional
 from enum import Enum
 
 
@@ -10,8 +11,18 @@ class LightMode(str, Enum):
     ON = "on"
 
 
+class LightState(BaseModel):
+    mode: Optional[LightMode] = None
+    updated_at: Optional[float] = None
+
+
 class LightResponse(BaseModel):
     mode: str
     success: bool
     message: str
+    queue_wait_ms: Optional[float] = None
+
 
+class LightStatusResponse(BaseModel):
+    available_modes: list[str]
+    state: LightState
@@ -0,0 +1,22 @@
+from pydantic import BaseModel, Field
+from typing import Optional
+
+
+class ScheduleRequest(BaseModel):
+    device: str
+    action: str
+    # Exactly one of: epoch seconds, seconds from now, or a 5-field cron expression
+    at: Optional[float] = None
+    in_seconds: Optional[float] = Field(None, gt=0)
+    cron: Optional[str] = None
+
+
+class Schedule(BaseModel):
+    id: str
+    device: str
+    action: str
+    at: Optional[float] = None
+    cron: Optional[str] = None
+    next_run: Optional[float] = None
+    last_run: Optional[float] = None
+    last_result: Optional[str] = None
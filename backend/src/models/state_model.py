@@ -0,0 +1,16 @@
+from pydantic import BaseModel, Field
+from typing import Dict, Optional
+from models.ac_model import ACState
+from models.light_model import LightState
+
+
+class DeviceState(BaseModel):
+    last_action: Optional[str] = None
+    updated_at: Optional[float] = None
+
+
+class DeviceStates(BaseModel):
+    ac: ACState = Field(default_factory=ACState)
+    light: LightState = Field(default_factory=LightState)
+    # Manifest devices without a dedicated service
+    devices: Dict[str, DeviceState] = Field(default_factory=dict)
@@ -0,0 +1,32 @@
+from pydantic import BaseModel
+from typing import Dict, Optional
+
+
+class EmitterStatus(BaseModel):
+    emitter: str
+    device: Optional[str] = None
+    backend: str
+    queue_depth: int
+    in_flight: int
+    transmitted: int
+    coalesced: int
+    last_wait_ms: float
+    max_wait_ms: float
+
+
+class LinkStatus(BaseModel):
+    repeats: int
+    commands: int
+    verified: int
+    resent: int
+    failed: int
+    unverified: int
+    frames: int
+    miss_rate: Optional[float] = None
+
+
+class TransmitterStatusResponse(EmitterStatus):
+    # The top-level fields describe the default emitter
+    emitters: list[EmitterStatus]
+    # Loopback echo statistics by device; None when verification is off
+    verification: Optional[Dict[str, LinkStatus]] = None
@@ -0,0 +1,63 @@
+from fastapi import APIRouter, HTTPException, Request
+from models.batch_model import BatchRequest, BatchResponse, Scene
+from routers.ac_router import ac_service
+from routers.light_router import light_service
+from services.admission import client_host, get_admission_controller
+from services.batch_service import (
+    BatchService,
+    BatchValidationError,
+    SceneNotFoundError
+)
+
+router = APIRouter(tags=["batch"])
+
+# Initialize the batch service on top of the device services
+batch_service = BatchService(light_service, ac_service)
+
+
+@router.post("/batch", response_model=BatchResponse)
+async def run_batch(body: BatchRequest, request: Request):
+    """Run an ordered list of light and AC actions in one transmission"""
+    devices = [step.device.value for step in body.steps]
+    try:
+        with get_admission_controller().admit_all(devices, client_host(request)):
+            return await batch_service.run(body.steps)
+    except BatchValidationError as e:
+        raise HTTPException(status_code=400, detail=e.errors)
+
+
+@router.get("/scenes", response_model=list[Scene])
+async def get_scenes():
+    """Get all stored scenes"""
+    return batch_service.get_scenes()
+
+
+@router.put("/scenes/{name}", response_model=Scene)
+async def save_scene(name: str, scene: BatchRequest):
+    """Store a named scene"""
+    try:
+        return await batch_service.save_scene(name, scene.steps)
+    except BatchValidationError as e:
+        raise HTTPException(status_code=400, detail=e.errors)
+
+
+@router.delete("/scenes/{name}", status_code=204)
+async def delete_scene(name: str):
+    """Delete a named scene"""
+    try:
+        await batch_service.delete_scene(name)
+    except SceneNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.post("/scenes/{name}", response_model=BatchResponse)
+async def run_scene(name: str, request: Request):
+    """Run a stored scene"""
+    try:
+        devices = [step.device.value for step in batch_service.get_scene(name)]
+        with get_admission_controller().admit_all(devices, client_host(request)):
+            return await batch_service.run_scene(name)
+    except SceneNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except BatchValidationError as e:
+        raise HTTPException(status_code=400, detail=e.errors)
@@ -0,0 +1,18 @@
+from typing import Optional
+from fastapi import APIRouter, Query
+from models.debug_model import RequestLogResponse
+from services.request_log import get_request_log
+
+router = APIRouter(prefix="/debug", tags=["debug"])
+
+
+@router.get("/requests", response_model=RequestLogResponse)
+async def get_requests(limit: Optional[int] = Query(None, ge=1),
+                       min_ms: float = Query(0, ge=0)):
+    """Get the most recent requests, newest first, with their timings and transmits"""
+    log = get_request_log()
+    return {
+        "size": log.entries.maxlen,
+        "slow_ms": log.slow_ms,
+        "requests": log.recent(limit, min_ms)
+    }
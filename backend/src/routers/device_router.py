@@ -0,0 +1,47 @@
+from fastapi import APIRouter, HTTPException, Request
+from models.device_model import DeviceInfo
+from routers.ac_router import ac_service
+from routers.light_router import light_service
+from services.admission import client_host, get_admission_controller
+from services.device_registry import (
+    DeviceRegistry,
+    RESOURCE_NOT_FOUND_ERRORS,
+    TRANSMISSION_ERRORS,
+    UnknownDeviceActionError
+)
+from services.json_response import CachedJSON, FastJSONResponse
+
+router = APIRouter(tags=["devices"])
+
+# Build the dispatch table from the device manifest
+registry = DeviceRegistry.from_file(builtin_services={"light": light_service, "ac": ac_service})
+# Per-device rate limits and queue bounds from the manifest
+get_admission_controller().configure_devices(registry.limits)
+
+# The device list only changes when a manifest is loaded
+devices_body = CachedJSON(registry.get_devices, lambda: (len(registry), len(registry.services)))
+
+
+@router.get("/devices", response_model=list[DeviceInfo])
+async def get_devices(request: Request):
+    """Get every device in the manifest and its actions"""
+    return devices_body.response(request)
+
+
+# Registered last: the fixed /light and /ac routes take precedence
+@router.api_route("/{device}/{action:path}", methods=["GET", "POST"])
+async def run_device_action(device: str, action: str, request: Request):
+    """Send the IR code for a device action (GET or POST)"""
+    try:
+        entry = registry.lookup(device, action)
+        # Over-limit requests raise AdmissionRejectedError, answered with 429 by main
+        with get_admission_controller().admit(device, client_host(request)):
+            result = await entry.handler()
+        # Results are plain dicts; encode them directly instead of through jsonable_encoder
+        return FastJSONResponse(result)
+    except UnknownDeviceActionError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except RESOURCE_NOT_FOUND_ERRORS as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except TRANSMISSION_ERRORS as e:
+        raise HTTPException(status_code=500, detail=str(e))
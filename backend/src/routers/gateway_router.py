@@ -0,0 +1,58 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response
+from models.gateway_model import GatewayBatchRequest, GatewayBatchResponse, NodeStatus
+from services.gateway import (
+    DROPPED_RESPONSE_HEADERS,
+    FORWARDED_HEADERS,
+    PROXIED_PREFIXES,
+    GatewayValidationError,
+    NodeNotFoundError,
+    NodeTimeoutError,
+    NodeUnavailableError,
+    get_gateway
+)
+
+# Only included in gateway mode (GATEWAY_NODES is set)
+router = APIRouter(prefix="/nodes", tags=["gateway"])
+
+
+@router.get("", response_model=list[NodeStatus])
+async def get_nodes():
+    """Get every downstream node and its health"""
+    return get_gateway().get_nodes()
+
+
+@router.post("/batch", response_model=GatewayBatchResponse)
+async def run_gateway_batch(request: GatewayBatchRequest):
+    """Run light and AC actions on several nodes, every node's steps concurrently"""
+    try:
+        return await get_gateway().run_batch(request.steps)
+    except GatewayValidationError as e:
+        raise HTTPException(status_code=400, detail=e.errors)
+
+
+@router.api_route("/{node}/{path:path}", methods=["GET", "POST", "PUT"])
+async def forward_to_node(node: str, path: str, request: Request):
+    """Forward a /light or /ac request to a node"""
+    if path.split("/", 1)[0] not in PROXIED_PREFIXES:
+        raise HTTPException(status_code=404, detail=f"Path '/{path}' is not forwarded to nodes")
+    try:
+        response = await get_gateway().forward(
+            node, request.method, "/" + path,
+            query=request.url.query.encode("latin-1"),
+            body=await request.body(),
+            headers={name: value for name, value in request.headers.items() if name in FORWARDED_HEADERS}
+        )
+    except NodeNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except NodeUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except NodeTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    # Passes on Retry-After, ETag and Cache-Control, so 429s and conditional GETs work through the gateway
+    forwarded = Response(response.content, response.status_code)
+    forwarded.raw_headers.extend(
+        (name.encode("latin-1"), value.encode("latin-1"))
+        for name, value in response.headers.multi_items() if name not in DROPPED_RESPONSE_HEADERS
+    )
+    return forwarded
@@ -0,0 +1,35 @@
+import time
+from typing import Literal, Optional
+from fastapi import APIRouter, HTTPException, Query
+from models.history_model import HistoryEvent, UsageResponse
+from services.history import HistoryError, get_history_store
+
+router = APIRouter(prefix="/history", tags=["history"])
+
+# Range used when a query gives no start
+DEFAULT_EVENTS_RANGE_S = 24 * 3600
+DEFAULT_USAGE_RANGE_S = 7 * 24 * 3600
+
+
+@router.get("/events", response_model=list[HistoryEvent])
+async def get_events(device: Optional[str] = None, start: Optional[float] = None, end: Optional[float] = None,
+                     limit: int = Query(100, ge=1, le=10000)):
+    """Get the commands sent between two epoch times (default: the last day), newest first"""
+    end = end if end is not None else time.time()
+    start = start if start is not None else end - DEFAULT_EVENTS_RANGE_S
+    try:
+        return await get_history_store().get_events(device, start, end, limit)
+    except HistoryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/usage", response_model=UsageResponse)
+async def get_usage(device: Optional[str] = None, start: Optional[float] = None, end: Optional[float] = None,
+                    bucket: Literal["hour", "day"] = "day"):
+    """Get the seconds each device spent in each mode per hour or day (default: the last week)"""
+    end = end if end is not None else time.time()
+    start = start if start is not None else end - DEFAULT_USAGE_RANGE_S
+    try:
+        return await get_history_store().get_usage(device, start, end, bucket)
+    except HistoryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -0,0 +1,39 @@
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query
+from models.learn_model import LearnResponse
+from routers.device_router import registry
+from services.device_registry import UnknownDeviceActionError
+from services.learn_service import (
+    LearnBusyError,
+    LearnError,
+    LearnService,
+    LearnTimeoutError
+)
+
+router = APIRouter(prefix="/learn", tags=["learn"])
+
+# Records codes from RECEIVER_DEVICE into the libraries of the manifest devices
+learn_service = LearnService(registry)
+
+
+@router.post("/{device}/{action:path}", response_model=LearnResponse)
+async def learn_action(
+    device: str,
+    action: str,
+    captures: Optional[int] = Query(None, ge=2, le=20),
+    timeout: Optional[float] = Query(None, gt=0, le=120)
+):
+    """Capture a button several times and store the averaged code for a device action"""
+    try:
+        result = await learn_service.learn(device, action, captures, timeout)
+        return result
+    except UnknownDeviceActionError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except LearnBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except LearnTimeoutError as e:
+        raise HTTPException(status_code=408, detail=str(e))
+    except LearnError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except OSError as e:
+        raise HTTPException(status_code=503, detail=f"Receiver unavailable: {e}")
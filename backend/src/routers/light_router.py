@@ -1,140 +1,27 @@
-from fastapi import APIRouter, HTTPException
-from models.light_model import LightMode, LightResponse
-from services.light_service import (
-    LightService,
-    LightResourceNotFoundError,
-    IRTransmissionError
-)
+from fastapi import APIRouter, Request
+from models.light_model import LightStatusResponse
+from services.json_response import CachedJSON
+from services.light_service import LightService
 
 router = APIRouter(prefix="/light", tags=["light"])
 
 # Initialize the light service
+# Mode commands are dispatched from the device manifest by device_router
 light_service = LightService()
 
+# Read-only bodies are encoded once and re-encoded only when the light state changes
+modes_body = CachedJSON(light_service.get_available_modes)
+status_body = CachedJSON(light_service.get_status, lambda: light_service.state_store.version)
+
 
 @router.get("/modes", response_model=list[str])
-async def get_available_modes():
+async def get_available_modes(request: Request):
     """Get list of available light modes"""
-    return light_service.get_available_modes()
-
-
-@router.get("/all-bright", response_model=LightResponse)
-async def set_light_all_bright():
-    """Set light to all bright mode"""
-    try:
-        result = light_service.set_light_mode(LightMode.ALL_BRIGHT)
-        return result
-    except LightResourceNotFoundError as e:
-        raise HTTPException(status_code=404, detail=str(e))
-    except IRTransmissionError as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-@router.get("/bright", response_model=LightResponse)
-async def set_light_bright():
-    """Set light to bright mode"""
-    try:
-        result = light_service.set_light_mode(LightMode.BRIGHT)
-        return result
-    except LightResourceNotFoundError as e:
-        raise HTTPException(status_code=404, detail=str(e))
-    except IRTransmissionError as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-@router.get("/dark", response_model=LightResponse)
-async def set_light_dark():
-    """Set light to dark mode"""
-    try:
-        result = light_service.set_light_mode(LightMode.DARK)
-        return result
-    except LightResourceNotFoundError as e:
-        raise HTTPException(status_code=404, detail=str(e))
-    except IRTransmissionError as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-@router.get("/off", response_model=LightResponse)
-async def set_light_off():
-    """Turn light off"""
-    try:
-        result = light_service.set_light_mode(LightMode.OFF)
-        return result
-    except LightResourceNotFoundError as e:
-        raise HTTPException(status_code=404, detail=str(e))
-    except IRTransmissionError as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-@router.get("/on", response_model=LightResponse)
-async def set_light_on():
-    """Turn light on"""
-    try:
-        result = light_service.set_light_mode(LightMode.ON)
-        return result
-    except LightResourceNotFoundError as e:
-        raise HTTPException(status_code=404, detail=str(e))
-    except IRTransmissionError as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-# POST endpoints
-@router.post("/all-bright", response_model=LightResponse)
-async def post_light_all_bright():
-    """Set light to all bright mode (POST)"""
-    try:
-        result = light_service.set_light_mode(LightMode.ALL_BRIGHT)
-        return result
-    except LightResourceNotFoundError as e:
-        raise HTTPException(status_code=404, detail=str(e))
-    except IRTransmissionError as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-@router.post("/bright", response_model=LightResponse)
-async def post_light_bright():
-    """Set light to bright mode (POST)"""
-    try:
-        result = light_service.set_light_mode(LightMode.BRIGHT)
-        return result
-    except LightResourceNotFoundError as e:
-        raise HTTPException(status_code=404, detail=str(e))
-    except IRTransmissionError as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-@router.post("/dark", response_model=LightResponse)
-async def post_light_dark():
-    """Set light to dark mode (POST)"""
-    try:
-        result = light_service.set_light_mode(LightMode.DARK)
-        return result
-    except LightResourceNotFoundError as e:
-        raise HTTPException(status_code=404, detail=str(e))
-    except IRTransmissionError as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-@router.post("/off", response_model=LightResponse)
-async def post_light_off():
-    """Turn light off (POST)"""
-    try:
-        result = light_service.set_light_mode(LightMode.OFF)
-        return result
-    except LightResourceNotFoundError as e:
-        raise HTTPException(status_code=404, detail=str(e))
-    except IRTransmissionError as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    return modes_body.response(request)
 
 
-@router.post("/on", response_model=LightResponse)
-async def post_light_on():
-    """Turn light on (POST)"""
-    try:
-        result = light_service.set_light_mode(LightMode.ON)
-        return result
-    except LightResourceNotFoundError as e:
-        raise HTTPException(status_code=404, detail=str(e))
-    except IRTransmissionError as e:
-        raise HTTPException(status_code=500, detail=str(e))
+@router.get("/status", response_model=LightStatusResponse)
+async def get_light_status(request: Request):
+    """Get available light modes and the last-known state"""
+    return status_body.response(request)
 
@@ -0,0 +1,11 @@
+from fastapi import APIRouter
+from fastapi.responses import Response
+from services.metrics import CONTENT_TYPE, REGISTRY
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Export every metric in the Prometheus text format"""
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
@@ -0,0 +1,40 @@
+from fastapi import APIRouter, HTTPException
+from models.schedule_model import Schedule, ScheduleRequest
+from routers.device_router import registry
+from services.action_scheduler import (
+    ActionScheduler,
+    ScheduleError,
+    ScheduleNotFoundError
+)
+from services.device_registry import UnknownDeviceActionError
+
+router = APIRouter(prefix="/schedules", tags=["schedules"])
+
+# Runs manifest device actions at a time or on a cron schedule
+action_scheduler = ActionScheduler(registry)
+
+
+@router.get("", response_model=list[Schedule])
+async def get_schedules():
+    """Get every schedule ordered by next run"""
+    return action_scheduler.get_schedules()
+
+
+@router.post("", response_model=Schedule, status_code=201)
+async def add_schedule(request: ScheduleRequest):
+    """Run a device action once (`at` / `in_seconds`) or on a cron expression"""
+    try:
+        return action_scheduler.add(request.device, request.action, request.at, request.in_seconds, request.cron)
+    except UnknownDeviceActionError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ScheduleError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.delete("/{schedule_id}", status_code=204)
+async def delete_schedule(schedule_id: str):
+    """Delete a schedule"""
+    try:
+        action_scheduler.remove(schedule_id)
+    except ScheduleNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
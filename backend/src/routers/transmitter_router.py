@@ -0,0 +1,17 @@
+from fastapi import APIRouter
+from models.transmitter_model import TransmitterStatusResponse
+from services.loopback import get_verifier
+from services.tx_scheduler import get_scheduler, get_schedulers
+
+router = APIRouter(prefix="/transmitter", tags=["transmitter"])
+
+
+@router.get("/status", response_model=TransmitterStatusResponse)
+async def get_transmitter_status():
+    """Get the transmit queue depth and wait times of every emitter, and loopback echo statistics"""
+    verifier = get_verifier()
+    return {
+        **get_scheduler().stats(),
+        "emitters": [scheduler.stats() for scheduler in get_schedulers().values()],
+        "verification": verifier.get_stats() if verifier is not None else None
+    }
@@ -0,0 +1,115 @@
+import asyncio
+import json
+import logging
+from typing import Awaitable, Callable
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from routers.device_router import registry
+from services.admission import AdmissionRejectedError, client_host, get_admission_controller
+from services.device_registry import (
+    RESOURCE_NOT_FOUND_ERRORS,
+    TRANSMISSION_ERRORS,
+    UnknownDeviceActionError
+)
+from services.event_bus import get_event_bus
+from services.metrics import REGISTRY
+from services.state_store import get_state_store
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["websocket"])
+
+REGISTRY.gauge("websocket_clients", "Connected /ws clients", function=lambda: get_event_bus().subscribers)
+
+
+async def _run_command(websocket: WebSocket, send: Callable[[str], Awaitable[None]], command: dict) -> None:
+    """Dispatch one command frame through the device manifest and send its result"""
+    command_id = command.get("id")
+    try:
+        entry = registry.lookup(str(command.get("device")), str(command.get("action")))
+        with get_admission_controller().admit(entry.device, client_host(websocket)):
+            result = await entry.handler()
+        reply = {"type": "result", "id": command_id, "ok": True, "result": result}
+    except AdmissionRejectedError as e:
+        reply = {"type": "result", "id": command_id, "ok": False, "status": 429, "detail": str(e),
+                 "retry_after_s": round(e.retry_after, 3)}
+    except UnknownDeviceActionError as e:
+        reply = {"type": "result", "id": command_id, "ok": False, "status": 404, "detail": str(e)}
+    except RESOURCE_NOT_FOUND_ERRORS as e:
+        reply = {"type": "result", "id": command_id, "ok": False, "status": 404, "detail": str(e)}
+    except TRANSMISSION_ERRORS as e:
+        reply = {"type": "result", "id": command_id, "ok": False, "status": 500, "detail": str(e)}
+    except Exception:
+        # A malformed command must still get an answer for its id
+        logger.exception(f"WebSocket command {command_id!r} failed")
+        reply = {"type": "result", "id": command_id, "ok": False, "status": 500, "detail": "Internal server error"}
+    try:
+        await send(json.dumps(reply, default=str, separators=(",", ":")))
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+
+
+async def _forward_events(send: Callable[[str], Awaitable[None]], queue: asyncio.Queue) -> None:
+    while True:
+        await send(await queue.get())
+
+
+@router.websocket("/ws")
+async def websocket_endpoint(websocket: WebSocket):
+    """
+    Persistent command and event channel
+
+    Clients send `{"id": 1, "device": "light", "action": "on"}` frames and get
+    a `result` frame with the same id. Every client receives a `snapshot` of
+    all device state on connect, then `state` and `transmitted` events as
+    they happen, including changes made by other clients or over HTTP.
+    """
+    await websocket.accept()
+    events = get_event_bus()
+    queue = events.subscribe()
+    forwarder = None
+    commands: set[asyncio.Task] = set()
+    # Events, results and errors come from several tasks; a frame must go out whole
+    writer = asyncio.Lock()
+
+    async def send(text: str) -> None:
+        async with writer:
+            await websocket.send_text(text)
+
+    try:
+        await send(json.dumps({
+            "type": "snapshot",
+            "state": get_state_store().states.model_dump(mode="json")
+        }, separators=(",", ":")))
+        forwarder = asyncio.create_task(_forward_events(send, queue))
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            if message.get("text") is None:
+                await send('{"type":"error","detail":"Frames must be text, not binary"}')
+                continue
+            try:
+                command = json.loads(message["text"])
+            except json.JSONDecodeError:
+                await send('{"type":"error","detail":"Frames must be JSON objects"}')
+                continue
+            if not isinstance(command, dict):
+                await send('{"type":"error","detail":"Frames must be JSON objects"}')
+                continue
+            if command.get("type") == "ping":
+                await send('{"type":"pong"}')
+                continue
+            # Commands run concurrently; the transmit scheduler orders them
+            task = asyncio.create_task(_run_command(websocket, send, command))
+            commands.add(task)
+            task.add_done_callback(commands.discard)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        events.unsubscribe(queue)
+        # Commands already dispatched still run; their replies are dropped
+        pending = set(commands)
+        if forwarder is not None:
+            forwarder.cancel()
+            pending.add(forwarder)
+        await asyncio.gather(*pending, return_exceptions=True)
@@ -1,9 +1,32 @@
+import asyncio
 import os
-import subprocess
-from pathlib import Path
-from typing import Dict, Union
+import time
+from typing import Dict, Optional, Union
 from models.ac_model import ACMode, ACTempControl, ACTimerControl
-from env import IR_CODE_DIR, IR_AC_RESOURCES_PATH, TRANSMITTER_DEVICE
+from env import (
+    IR_CODE_DIR,
+    IR_AC_RESOURCES_PATH,
+    TRANSMITTER_DEVICE,
+    AC_TEMP_MIN,
+    AC_TEMP_MAX,
+    AC_AIRCON_DEFAULT_TEMP,
+    AC_HEATER_DEFAULT_TEMP,
+    AC_TIMER_DEFAULT_HOURS,
+    AC_TIMER_MAX_HOURS
+)
+from services.code_library import CodeLibrary, IRCode
+from services.history import HistoryStore, get_history_store
+from services.ir_library import IRLibraryError
+from services.ir_protocol import DecodedSignal, FrameLayout, ProtocolError, decode, encode
+from services.state_store import DeviceStateStore, get_state_store
+from services.transmitter import TransmitterError, join_pulse_trains
+from services.tx_scheduler import (
+    PRIORITY_ADJUST,
+    PRIORITY_MODE,
+    TransmitReceipt,
+    TransmitScheduler,
+    get_scheduler
+)
 
 
 class ACResourceNotFoundError(Exception):
@@ -21,8 +44,24 @@ class IRTransmissionError(Exception):
         super().__init__(f"Failed to transmit IR signal for action '{action}': {details}")
 
 
+class ACStateError(Exception):
+    """Raised when the tracked AC state does not allow the requested setpoint"""
+    pass
+
+
+class ACProtocolError(Exception):
+    """Raised when full-state frames are not configured or the template cannot be decoded"""
+    pass
+
+
 class ACService:
-    def __init__(self):
+    # Carrier frequency in Hz, None keeps the transmitter default
+    carrier: Optional[int] = None
+    # Frame layout for full-state frames, None sends relative presses
+    layout: Optional[FrameLayout] = None
+
+    def __init__(self, transmitter=None, scheduler: Optional[TransmitScheduler] = None,
+                 state_store: Optional[DeviceStateStore] = None, history: Optional[HistoryStore] = None):
         self.ir_code_dir = IR_CODE_DIR
         self.resources_path = IR_AC_RESOURCES_PATH
         self.transmitter_device = TRANSMITTER_DEVICE
@@ -34,66 +73,110 @@ class ACService:
             raise ValueError("IR_CODE_DIR environment variable is not set")
         if not self.transmitter_device:
             raise ValueError("TRANSMITTER_DEVICE environment variable is not set")
+        
+        if scheduler is None:
+            scheduler = TransmitScheduler(transmitter) if transmitter else get_scheduler()
+        self.scheduler = scheduler
+        self.transmitter = scheduler.transmitter
+        self.codes = CodeLibrary(self.resources_path, "ac", [ACMode, ACTempControl, ACTimerControl])
+        
+        # Last-known state, updated after every successful transmission
+        self.state_store = state_store or get_state_store()
+        self.state = self.state_store.ac
+        self.state.setpoints.setdefault(ACMode.AIRCON_ON, AC_AIRCON_DEFAULT_TEMP)
+        self.state.setpoints.setdefault(ACMode.HEATER_ON, AC_HEATER_DEFAULT_TEMP)
+        # Every command sent, for usage queries
+        self.history = history or get_history_store()
+        # (template code, decoded signal), refreshed when the recording changes
+        self._template: Optional[tuple[IRCode, DecodedSignal]] = None
+        # Serializes planning and sending of absolute setpoints, so concurrent
+        # requests never plan presses from the same tracked value
+        self._setpoint_lock: Optional[asyncio.Lock] = None
+        self._setpoint_loop: Optional[asyncio.AbstractEventLoop] = None
     
-    def _get_resource_file_path(self, action: Union[ACMode, ACTempControl, ACTimerControl]) -> Path:
-        """Get the full path to the AC resource file"""
-        filename = f"ac_{action.value}.txt"
-        file_path = Path(self.resources_path) / filename
+    def configure_protocol(self, spec: Optional[Dict[str, any]]) -> None:
+        """
+        Send absolute setpoints as full-state frames built from a layout
         
-        if not file_path.exists():
+        Raises:
+            ValueError: If the layout is invalid
+        """
+        self.layout = FrameLayout.from_spec(spec) if spec else None
+        self._template = None
+    
+    def _setpoint_guard(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if self._setpoint_loop is not loop:
+            # Locks belong to the loop that first waits on them
+            self._setpoint_loop = loop
+            self._setpoint_lock = asyncio.Lock()
+        return self._setpoint_lock
+    
+    def _get_code(self, action: Union[ACMode, ACTempControl, ACTimerControl]) -> IRCode:
+        """Get the cached IR code for the AC action"""
+        try:
+            return self.codes.get(action)
+        except KeyError:
             raise ACResourceNotFoundError(action.value)
-        
-        return file_path
+        except IRLibraryError as e:
+            raise IRTransmissionError(action.value, str(e))
     
-    def _transmit_ir_signal(self, resource_file: Path) -> None:
-        """Transmit IR signal using the resource file"""
+    async def _transmit_ir_signal(self, code: IRCode, priority: int = PRIORITY_MODE,
+                                  coalesce_key: Optional[str] = None, accumulate: bool = False) -> TransmitReceipt:
+        """
+        Queue the IR code on the shared transmitter and wait until it is sent
+        
+        Returns the scheduler receipt with the queue wait and the code sent.
+        """
         try:
-            # Validate that the resource file exists
-            if not resource_file.exists():
-                raise IRTransmissionError(
-                    resource_file.stem,
-                    "IR code file not found"
-                )
-            
-            # ir-ctl command: -d for device, --send for file transmission
-            cmd = [
-                "ir-ctl",
-                "-d", self.transmitter_device,
-                "--send", str(resource_file)
-            ]
-            
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=10,
-                check=True
-            )
-                
-        except subprocess.TimeoutExpired:
-            raise IRTransmissionError(
-                resource_file.stem,
-                "IR transmission timed out"
-            )
-        except subprocess.CalledProcessError as e:
-            raise IRTransmissionError(
-                resource_file.stem,
-                f"Command failed with code {e.returncode}: {e.stderr}"
-            )
-        except FileNotFoundError as e:
-            raise IRTransmissionError(
-                resource_file.stem,
-                f"IR transmission command not found: {str(e)}"
-            )
-        except Exception as e:
-            if isinstance(e, IRTransmissionError):
-                raise
-            raise IRTransmissionError(
-                resource_file.stem,
-                f"Unexpected error: {str(e)}"
+            return await self.scheduler.submit(
+                code, code.carrier or self.carrier, priority, coalesce_key, accumulate
             )
+        except TransmitterError as e:
+            raise IRTransmissionError(code.name, str(e))
+    
+    def record_transmitted(self, action: Union[ACMode, ACTempControl, ACTimerControl]) -> None:
+        """Update the tracked state and the history after an action was sent"""
+        state = self.state
+        if isinstance(action, ACMode):
+            state.mode = action
+            if action == ACMode.OFF:
+                state.timer_hours = None
+        elif action == ACTempControl.AIRCON_TEMP_UP:
+            self._step_setpoint(ACMode.AIRCON_ON, 1)
+        elif action == ACTempControl.HEATER_TEMP_UP:
+            self._step_setpoint(ACMode.HEATER_ON, 1)
+        elif action == ACTempControl.HEATER_TEMP_DOWN:
+            self._step_setpoint(ACMode.HEATER_ON, -1)
+        elif action == ACTimerControl.TIMER_ON:
+            state.timer_hours = AC_TIMER_DEFAULT_HOURS
+        elif action == ACTimerControl.TIMER_UP and state.timer_hours is not None:
+            state.timer_hours = min(state.timer_hours + 1, AC_TIMER_MAX_HOURS)
+        elif action == ACTimerControl.TIMER_DOWN and state.timer_hours is not None:
+            state.timer_hours = max(state.timer_hours - 1, 1)
+        state.updated_at = time.time()
+        self.state_store.changed("ac")
+        self.history.record("ac", action.value, action.value if isinstance(action, ACMode) else None)
     
-    def set_ac_mode(self, mode: ACMode) -> Dict[str, any]:
+    def _step_setpoint(self, mode: ACMode, delta: int) -> None:
+        setpoints = self.state.setpoints
+        setpoints[mode] = min(max(setpoints[mode] + delta, AC_TEMP_MIN), AC_TEMP_MAX)
+    
+    async def _transmit_sequence(self, actions: list) -> TransmitReceipt:
+        """Send a sequence of presses back to back as one burst"""
+        codes = [self._get_code(action) for action in actions]
+        gap_us = int(self.scheduler.frame_gap * 1_000_000)
+        burst = IRCode(
+            "+".join(code.name for code in codes),
+            join_pulse_trains([code.pulses for code in codes], gap_us),
+            carrier=codes[0].carrier
+        )
+        receipt = await self._transmit_ir_signal(burst, PRIORITY_ADJUST)
+        for action in actions:
+            self.record_transmitted(action)
+        return receipt
+    
+    async def set_ac_mode(self, mode: ACMode) -> Dict[str, any]:
         """
         Set the AC to a specific mode (aircon on, heater on, or off)
         
@@ -101,16 +184,23 @@ class ACService:
             ACResourceNotFoundError: If the resource file doesn't exist
             IRTransmissionError: If IR transmission fails
         """
-        resource_file = self._get_resource_file_path(mode)
-        self._transmit_ir_signal(resource_file)
+        code = self._get_code(mode)
+        # A newer mode request replaces one that is still queued
+        receipt = await self._transmit_ir_signal(code, coalesce_key="ac:mode")
         
+        if receipt.code_name != code.name:
+            message = f"AC mode {mode.value} was superseded by {receipt.code_name}"
+        else:
+            self.record_transmitted(mode)
+            message = f"AC set to {mode.value} mode successfully"
         return {
             "action": mode.value,
             "success": True,
-            "message": f"AC set to {mode.value} mode successfully"
+            "message": message,
+            "queue_wait_ms": round(receipt.wait * 1000, 3)
         }
     
-    def control_temperature(self, control: ACTempControl) -> Dict[str, any]:
+    async def control_temperature(self, control: ACTempControl) -> Dict[str, any]:
         """
         Control AC temperature
         
@@ -118,16 +208,21 @@ class ACService:
             ACResourceNotFoundError: If the resource file doesn't exist
             IRTransmissionError: If IR transmission fails
         """
-        resource_file = self._get_resource_file_path(control)
-        self._transmit_ir_signal(resource_file)
+        code = self._get_code(control)
+        # Repeated presses that are still queued go out as one burst
+        receipt = await self._transmit_ir_signal(
+            code, PRIORITY_ADJUST, coalesce_key=f"ac:{control.value}", accumulate=True
+        )
+        self.record_transmitted(control)
         
         return {
             "action": control.value,
             "success": True,
-            "message": f"Temperature control {control.value} executed successfully"
+            "message": f"Temperature control {control.value} executed successfully",
+            "queue_wait_ms": round(receipt.wait * 1000, 3)
         }
     
-    def control_timer(self, control: ACTimerControl) -> Dict[str, any]:
+    async def control_timer(self, control: ACTimerControl) -> Dict[str, any]:
         """
         Control AC timer
         
@@ -135,13 +230,244 @@ class ACService:
             ACResourceNotFoundError: If the resource file doesn't exist
             IRTransmissionError: If IR transmission fails
         """
-        resource_file = self._get_resource_file_path(control)
-        self._transmit_ir_signal(resource_file)
+        code = self._get_code(control)
+        # Repeated presses that are still queued go out as one burst
+        receipt = await self._transmit_ir_signal(
+            code, PRIORITY_ADJUST, coalesce_key=f"ac:{control.value}", accumulate=True
+        )
+        self.record_transmitted(control)
         
         return {
             "action": control.value,
             "success": True,
-            "message": f"Timer control {control.value} executed successfully"
+            "message": f"Timer control {control.value} executed successfully",
+            "queue_wait_ms": round(receipt.wait * 1000, 3)
+        }
+    
+    def _template_signal(self) -> DecodedSignal:
+        if self.layout is None:
+            raise ACProtocolError("No AC protocol layout is configured")
+        try:
+            code = self.codes.get(ACMode(self.layout.template))
+        except (KeyError, ValueError):
+            raise ACResourceNotFoundError(self.layout.template)
+        if self._template is None or self._template[0] is not code:
+            try:
+                self._template = (code, decode(code.pulses))
+            except ProtocolError as e:
+                raise ACProtocolError(f"Cannot decode template {code.name}: {e}")
+        return self._template[1]
+    
+    def encode_state(self, mode: ACMode, temperature: Optional[int] = None,
+                     timer_hours: Optional[int] = None) -> IRCode:
+        """
+        Build one frame carrying the whole AC state
+        
+        Layout fields receive: `mode` the mode name, `power` "on" or "off",
+        `temperature` the setpoint and `timer_hours` the timer (0 when off).
+        
+        Raises:
+            ACProtocolError: If no layout is configured or the template cannot be decoded
+            ACResourceNotFoundError: If the template recording doesn't exist
+            ValueError: If a value does not fit the layout
+        """
+        template = self._template_signal()
+        values = {}
+        for name in self.layout.fields:
+            if name == "mode":
+                values[name] = mode.value
+            elif name == "power":
+                values[name] = "off" if mode == ACMode.OFF else "on"
+            elif name == "temperature" and temperature is not None:
+                values[name] = temperature
+            elif name == "timer_hours":
+                values[name] = timer_hours or 0
+        signal = self.layout.build(template, **values)
+        return IRCode(
+            f"ac_state:{mode.value}:{temperature}:{timer_hours}", encode(signal),
+            carrier=signal.protocol.carrier
+        )
+    
+    async def set_state(self, mode: ACMode, temperature: Optional[int] = None,
+                        timer_hours: Optional[int] = None) -> Dict[str, any]:
+        """
+        Send mode, temperature and timer in a single full-state frame
+        
+        The temperature defaults to the tracked setpoint of the mode and the
+        timer to its tracked value.
+        
+        Raises:
+            ValueError: If a value is out of range
+            ACProtocolError: If no layout is configured
+            ACResourceNotFoundError: If the template recording doesn't exist
+            IRTransmissionError: If IR transmission fails
+        """
+        if temperature is not None and not AC_TEMP_MIN <= temperature <= AC_TEMP_MAX:
+            raise ValueError(f"Temperature must be between {AC_TEMP_MIN} and {AC_TEMP_MAX}")
+        if timer_hours is not None and not 0 <= timer_hours <= AC_TIMER_MAX_HOURS:
+            raise ValueError(f"Timer must be between 0 and {AC_TIMER_MAX_HOURS} hours")
+        if mode == ACMode.OFF:
+            temperature = None
+            timer_hours = 0
+        elif temperature is None:
+            temperature = self.state.setpoints[mode]
+        if timer_hours is None:
+            timer_hours = self.state.timer_hours
+        
+        code = self.encode_state(mode, temperature, timer_hours)
+        # A full-state frame supersedes any queued mode change and vice versa
+        receipt = await self._transmit_ir_signal(code, coalesce_key="ac:mode")
+        
+        if receipt.code_name != code.name:
+            message = f"AC state was superseded by {receipt.code_name}"
+        else:
+            state = self.state
+            state.mode = mode
+            if temperature is not None:
+                state.setpoints[mode] = temperature
+            state.timer_hours = timer_hours or None
+            state.updated_at = time.time()
+            self.state_store.changed("ac")
+            self.history.record("ac", "state", mode.value)
+            message = f"AC state set to {mode.value} in one frame"
+        return {
+            "action": "state",
+            "success": True,
+            "message": message,
+            "state": self.state,
+            "queue_wait_ms": round(receipt.wait * 1000, 3)
+        }
+    
+    def plan_temperature(self, celsius: int) -> list[ACTempControl]:
+        """
+        Work out the presses that move the current mode's setpoint to `celsius`
+        
+        Raises:
+            ValueError: If the temperature is out of range
+            ACStateError: If the AC is not known to be on, or the target needs a
+                button the current mode does not have
+        """
+        if not AC_TEMP_MIN <= celsius <= AC_TEMP_MAX:
+            raise ValueError(f"Temperature must be between {AC_TEMP_MIN} and {AC_TEMP_MAX}")
+        if self.state.mode not in self.state.setpoints:
+            raise ACStateError("AC must be on in aircon or heater mode to set a temperature")
+        
+        delta = celsius - self.state.setpoints[self.state.mode]
+        if self.state.mode == ACMode.AIRCON_ON:
+            if delta < 0:
+                raise ACStateError("Air conditioner temperature can only be raised")
+            return [ACTempControl.AIRCON_TEMP_UP] * delta
+        if delta >= 0:
+            return [ACTempControl.HEATER_TEMP_UP] * delta
+        return [ACTempControl.HEATER_TEMP_DOWN] * -delta
+    
+    def plan_timer(self, hours: int) -> list[ACTimerControl]:
+        """
+        Work out the presses that set the timer to `hours`
+        
+        Raises:
+            ValueError: If the hours are out of range
+            ACStateError: If the AC is not known to be on
+        """
+        if not 1 <= hours <= AC_TIMER_MAX_HOURS:
+            raise ValueError(f"Timer must be between 1 and {AC_TIMER_MAX_HOURS} hours")
+        if self.state.mode not in self.state.setpoints:
+            raise ACStateError("AC must be on to set a timer")
+        
+        presses = []
+        current = self.state.timer_hours
+        if current is None:
+            presses.append(ACTimerControl.TIMER_ON)
+            current = AC_TIMER_DEFAULT_HOURS
+        delta = hours - current
+        if delta >= 0:
+            presses += [ACTimerControl.TIMER_UP] * delta
+        else:
+            presses += [ACTimerControl.TIMER_DOWN] * -delta
+        return presses
+    
+    async def set_temperature(self, celsius: int) -> Dict[str, any]:
+        """
+        Set an absolute temperature in one transmission
+        
+        Sends a full-state frame when a protocol layout is configured, in which
+        case the aircon setpoint can be lowered too, and a burst of relative
+        presses otherwise.
+        
+        Raises:
+            ValueError: If the temperature is out of range
+            ACStateError: If the tracked state does not allow the setpoint
+            ACResourceNotFoundError: If a needed resource file doesn't exist
+            IRTransmissionError: If IR transmission fails
+        """
+        if self.layout is not None:
+            self._require_on(celsius, AC_TEMP_MIN, AC_TEMP_MAX, "Temperature", "set a temperature")
+            result = await self.set_state(self.state.mode, temperature=celsius)
+            return self._setpoint_result("temperature", celsius, result)
+        
+        async with self._setpoint_guard():
+            presses = self.plan_temperature(celsius)
+            wait = 0.0
+            if presses:
+                wait = (await self._transmit_sequence(presses)).wait
+        
+        return {
+            "action": "temperature",
+            "success": True,
+            "message": f"Temperature set to {celsius} with {len(presses)} presses",
+            "presses": len(presses),
+            "value": celsius,
+            "queue_wait_ms": round(wait * 1000, 3)
+        }
+    
+    async def set_timer(self, hours: int) -> Dict[str, any]:
+        """
+        Set an absolute timer in one transmission
+        
+        Sends a full-state frame when a protocol layout is configured and a
+        burst of relative presses otherwise.
+        
+        Raises:
+            ValueError: If the hours are out of range
+            ACStateError: If the tracked state does not allow the setpoint
+            ACResourceNotFoundError: If a needed resource file doesn't exist
+            IRTransmissionError: If IR transmission fails
+        """
+        if self.layout is not None:
+            self._require_on(hours, 1, AC_TIMER_MAX_HOURS, "Timer", "set a timer")
+            result = await self.set_state(self.state.mode, timer_hours=hours)
+            return self._setpoint_result("timer", hours, result)
+        
+        async with self._setpoint_guard():
+            presses = self.plan_timer(hours)
+            wait = 0.0
+            if presses:
+                wait = (await self._transmit_sequence(presses)).wait
+        
+        return {
+            "action": "timer",
+            "success": True,
+            "message": f"Timer set to {hours} hours with {len(presses)} presses",
+            "presses": len(presses),
+            "value": hours,
+            "queue_wait_ms": round(wait * 1000, 3)
+        }
+    
+    def _require_on(self, value: int, low: int, high: int, label: str, purpose: str) -> None:
+        if not low <= value <= high:
+            raise ValueError(f"{label} must be between {low} and {high}")
+        if self.state.mode not in self.state.setpoints:
+            raise ACStateError(f"AC must be on in aircon or heater mode to {purpose}")
+    
+    @staticmethod
+    def _setpoint_result(action: str, value: int, result: Dict[str, any]) -> Dict[str, any]:
+        return {
+            "action": action,
+            "success": True,
+            "message": result["message"],
+            "presses": 1,
+            "value": value,
+            "queue_wait_ms": result["queue_wait_ms"]
         }
     
     def get_available_modes(self) -> list[str]:
@@ -156,11 +482,13 @@ class ACService:
         """Get list of available timer controls"""
         return [control.value for control in ACTimerControl]
     
-    def get_status(self) -> Dict[str, list[str]]:
-        """Get all available AC controls"""
+    def get_status(self) -> Dict[str, any]:
+        """Get all available AC controls and the last-known state"""
         return {
             "available_modes": self.get_available_modes(),
             "available_temp_controls": self.get_available_temp_controls(),
-            "available_timer_controls": self.get_available_timer_controls()
+            "available_timer_controls": self.get_available_timer_controls(),
+            "state": self.state,
+            "full_state_frames": self.layout is not None
         }
 
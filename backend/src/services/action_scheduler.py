@@ -0,0 +1,349 @@
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import os
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Optional
+from pydantic import ValidationError
+from models.schedule_model import Schedule
+from env import IR_CODE_DIR, SCHEDULES_FILE
+from services.device_registry import UnknownDeviceActionError
+from services.request_log import start_background
+
+logger = logging.getLogger(__name__)
+
+# One-shot actions this late after a restart still run; older ones are dropped
+MISSED_GRACE_S = 300
+
+# Longest single wait, so wall-clock jumps are noticed
+MAX_WAIT_S = 60
+
+
+class ScheduleError(ValueError):
+    """Raised when a schedule has no valid time or an invalid cron expression"""
+    pass
+
+
+class ScheduleNotFoundError(Exception):
+    """Raised when a schedule id does not exist"""
+    def __init__(self, schedule_id: str):
+        self.schedule_id = schedule_id
+        super().__init__(f"Schedule not found: {schedule_id}")
+
+
+class CronExpression:
+    """
+    Standard 5-field cron expression: minute hour day-of-month month day-of-week
+
+    Fields accept `*`, numbers, ranges (`1-5`), lists (`1,3`) and steps
+    (`*/15`, `8-18/2`). Day of week runs 0-6 from Sunday, 7 is also Sunday.
+    As in cron, when both day fields are restricted either one may match.
+    Times are local.
+    """
+
+    RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    __slots__ = ("text", "minutes", "hours", "days", "months", "weekdays", "any_day", "any_weekday")
+
+    def __init__(self, text: str):
+        fields = text.split()
+        if len(fields) != 5:
+            raise ScheduleError(f"Cron expression needs 5 fields: {text!r}")
+        self.text = text
+        parsed = [self._parse(field, low, high) for field, (low, high) in zip(fields, self.RANGES)]
+        self.minutes, self.hours, self.days, self.months, weekdays = parsed
+        self.weekdays = {day % 7 for day in weekdays}
+        # Unrestricted however it is written, e.g. `*/1` or `0-6`
+        self.any_day = len(self.days) == 31
+        self.any_weekday = len(self.weekdays) == 7
+
+    @staticmethod
+    def _parse(field: str, low: int, high: int) -> frozenset:
+        values = set()
+        for part in field.split(","):
+            spec, _, step_text = part.partition("/")
+            try:
+                step = int(step_text) if step_text else 1
+                if spec == "*":
+                    start, end = low, high
+                elif "-" in spec:
+                    start, end = (int(value) for value in spec.split("-", 1))
+                else:
+                    start = int(spec)
+                    end = high if step_text else start
+            except ValueError:
+                raise ScheduleError(f"Invalid cron field {field!r}")
+            if step < 1 or not low <= start <= end <= high:
+                raise ScheduleError(f"Cron field {field!r} is outside {low}-{high}")
+            values.update(range(start, end + 1, step))
+        return frozenset(values)
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day = moment.day in self.days
+        # isoweekday: Monday 1 .. Sunday 7
+        weekday = moment.isoweekday() % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, timestamp: float) -> float:
+        """
+        First matching minute strictly after `timestamp`
+
+        Raises:
+            ScheduleError: If the expression never matches (e.g. 31 February)
+        """
+        moment = datetime.fromtimestamp(timestamp).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # Skips whole months, days and hours, so this is a few hundred steps at most
+        for _ in range(20000):
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment.timestamp()
+        raise ScheduleError(f"Cron expression {self.text!r} never matches")
+
+
+class Clock:
+    """Wall clock the scheduler sleeps on; tests substitute a fake one"""
+
+    def time(self) -> float:
+        return time.time()
+
+    async def wait(self, event: asyncio.Event, timeout: float) -> None:
+        """Return when `event` is set or `timeout` seconds have passed"""
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+class ActionScheduler:
+    """
+    Runs manifest device actions at a time or on a cron schedule
+
+    Pending runs sit in a heap keyed by their next fire time, so adding,
+    removing and firing cost O(log n) however many schedules exist; removed
+    or rescheduled heap entries are skipped lazily. Each run dispatches
+    through the device registry like an HTTP request and is started as its
+    own task, so a slow transmission never delays other schedules. Recurring
+    schedules compute their next run from the scheduled time rather than the
+    time the run finished, so they do not drift.
+
+    Schedules are saved to a JSON file (written behind, atomically) and
+    reloaded on startup.
+    """
+
+    def __init__(self, registry, schedules_file: Optional[str] = None, clock: Optional[Clock] = None):
+        self.registry = registry
+        if schedules_file is None:
+            schedules_file = SCHEDULES_FILE or str(Path(IR_CODE_DIR) / "schedules.json")
+        self.schedules_file = Path(schedules_file)
+        self.clock = clock or Clock()
+        self.schedules: Dict[str, Schedule] = {}
+        self._crons: Dict[str, CronExpression] = {}
+        self._heap: list[tuple[float, int, str]] = []
+        self._sequence = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._runner: Optional[asyncio.Task] = None
+        self._running: set[asyncio.Task] = set()
+        self._save_task: Optional[asyncio.Task] = None
+        self._dirty = False
+        self.fired = 0
+        self._load()
+
+    # ========== SCHEDULES ==========
+
+    def add(self, device: str, action: str, at: Optional[float] = None,
+            in_seconds: Optional[float] = None, cron: Optional[str] = None) -> Schedule:
+        """
+        Schedule a device action once (`at` / `in_seconds`) or on a cron expression
+
+        Raises:
+            UnknownDeviceActionError: If the manifest has no such action
+            ScheduleError: If not exactly one time is given or the cron expression is invalid
+        """
+        self.registry.lookup(device, action)
+        if sum(value is not None for value in (at, in_seconds, cron)) != 1:
+            raise ScheduleError("Give exactly one of at, in_seconds or cron")
+        if in_seconds is not None:
+            at = self.clock.time() + in_seconds
+        schedule = Schedule(id=uuid.uuid4().hex[:12], device=device, action=action, at=at, cron=cron)
+        if cron is not None:
+            # Stored only once it is known to match, so a rejected cron leaves nothing behind
+            expression = CronExpression(cron)
+            schedule.next_run = expression.next_after(self.clock.time())
+            self._crons[schedule.id] = expression
+        else:
+            schedule.next_run = at
+        self.schedules[schedule.id] = schedule
+        self._push(schedule)
+        self._changed()
+        return schedule
+
+    def remove(self, schedule_id: str) -> None:
+        """
+        Delete a schedule
+
+        Raises:
+            ScheduleNotFoundError: If the schedule does not exist
+        """
+        if self.schedules.pop(schedule_id, None) is None:
+            raise ScheduleNotFoundError(schedule_id)
+        self._crons.pop(schedule_id, None)
+        self._changed()
+
+    def get_schedules(self) -> list[Schedule]:
+        """Get every schedule ordered by next run"""
+        return sorted(self.schedules.values(), key=lambda schedule: schedule.next_run or 0)
+
+    def _push(self, schedule: Schedule) -> None:
+        heapq.heappush(self._heap, (schedule.next_run, next(self._sequence), schedule.id))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    # ========== RUNNING ==========
+
+    def start(self) -> None:
+        """Start the runner task on the current event loop"""
+        if self._runner is None or self._runner.done():
+            self._wakeup = asyncio.Event()
+            self._runner = start_background(asyncio.get_running_loop(), self.run())
+
+    async def stop(self) -> None:
+        """Stop the runner and save pending changes"""
+        if self._runner is not None:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+        if self._save_task is not None and not self._save_task.done():
+            await self._save_task
+        if self._dirty:
+            self.save()
+
+    async def run(self) -> None:
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        while True:
+            now = self.clock.time()
+            while self._heap and self._heap[0][0] <= now:
+                fire_at, _, schedule_id = heapq.heappop(self._heap)
+                schedule = self.schedules.get(schedule_id)
+                if schedule is None or schedule.next_run != fire_at:
+                    # Removed or rescheduled after this entry was pushed
+                    continue
+                self._fire(schedule, fire_at)
+            self._wakeup.clear()
+            delay = self._heap[0][0] - now if self._heap else MAX_WAIT_S
+            await self.clock.wait(self._wakeup, min(delay, MAX_WAIT_S))
+
+    def _fire(self, schedule: Schedule, fire_at: float) -> None:
+        self.fired += 1
+        schedule.last_run = fire_at
+        cron = self._crons.get(schedule.id)
+        if cron is not None:
+            # Minute boundaries from the scheduled time, so late runs never shift later ones;
+            # runs missed while the loop was blocked are skipped rather than sent in a burst
+            schedule.next_run = cron.next_after(max(fire_at, self.clock.time()))
+            self._push(schedule)
+        else:
+            schedule.next_run = None
+            self.schedules.pop(schedule.id, None)
+        task = asyncio.get_running_loop().create_task(self._execute(schedule))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+        self._changed()
+
+    async def _execute(self, schedule: Schedule) -> None:
+        try:
+            await self.registry.lookup(schedule.device, schedule.action).handler()
+            schedule.last_result = "ok"
+        except Exception as e:
+            logger.error(f"Scheduled {schedule.device} {schedule.action} failed: {e}")
+            schedule.last_result = f"{type(e).__name__}: {e}"
+        self._changed()
+
+    # ========== PERSISTENCE ==========
+
+    def _load(self) -> None:
+        try:
+            data = json.loads(self.schedules_file.read_text())
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable schedules file {self.schedules_file}: {e}")
+            return
+
+        now = self.clock.time()
+        for item in data:
+            try:
+                schedule = Schedule.model_validate(item)
+                self.registry.lookup(schedule.device, schedule.action)
+                if schedule.cron is not None:
+                    self._crons[schedule.id] = CronExpression(schedule.cron)
+                    # Runs missed while the server was down are skipped
+                    if schedule.next_run is None or schedule.next_run < now:
+                        schedule.next_run = self._crons[schedule.id].next_after(now)
+                elif schedule.next_run is None or schedule.next_run < now - MISSED_GRACE_S:
+                    logger.warning(f"Dropping missed schedule {schedule.id} for {schedule.device} {schedule.action}")
+                    continue
+            except (ValidationError, ScheduleError, UnknownDeviceActionError) as e:
+                logger.warning(f"Ignoring invalid schedule {item}: {e}")
+                continue
+            self.schedules[schedule.id] = schedule
+            self._push(schedule)
+
+    def _serialize(self) -> str:
+        return json.dumps([schedule.model_dump() for schedule in self.schedules.values()], indent=2)
+
+    def _write(self, data: str) -> None:
+        self.schedules_file.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.schedules_file.parent, prefix=".schedules_")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(data)
+            os.replace(tmp_path, self.schedules_file)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def _changed(self) -> None:
+        self._dirty = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.save()
+            return
+        # Many runs firing together cost one write
+        if self._save_task is None or self._save_task.done():
+            self._save_task = start_background(loop, self._write_behind())
+
+    async def _write_behind(self) -> None:
+        while self._dirty:
+            self._dirty = False
+            try:
+                await asyncio.to_thread(self._write, self._serialize())
+            except OSError as e:
+                logger.error(f"Failed to write schedules {self.schedules_file}: {e}")
+                return
+
+    def save(self) -> None:
+        """Write the schedules synchronously"""
+        self._dirty = False
+        self._write(self._serialize())
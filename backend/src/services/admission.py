@@ -0,0 +1,215 @@
+import math
+import time
+from collections import OrderedDict
+from contextlib import ExitStack
+from typing import Dict, Iterable, Optional
+from env import (
+    ADMISSION_CLIENT_BURST,
+    ADMISSION_CLIENT_RATE,
+    ADMISSION_GLOBAL_BURST,
+    ADMISSION_GLOBAL_RATE,
+    ADMISSION_MAX_QUEUE
+)
+from services.metrics import REGISTRY
+
+# Client buckets kept; an idle client's bucket is full anyway, so dropping it is harmless
+MAX_CLIENTS = 1024
+
+# Suggested wait when a device already has `max_queue` requests waiting
+QUEUE_FULL_RETRY_S = 1.0
+
+ADMISSION_REJECTED = REGISTRY.counter(
+    "admission_rejected_total", "Commands refused with 429 by reason and device", ("reason", "device")
+)
+
+
+class AdmissionRejectedError(Exception):
+    """Raised when a command is over a rate limit or its device's queue is full"""
+    def __init__(self, device: str, reason: str, retry_after: float):
+        self.device = device
+        self.reason = reason
+        self.retry_after = retry_after
+        super().__init__(f"Too many requests for {device} ({reason} limit), retry in {retry_after:.2f}s")
+
+    @property
+    def retry_after_header(self) -> str:
+        """Whole seconds for the Retry-After header, at least 1"""
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class TokenBucket:
+    """
+    `rate` tokens per second, holding at most `burst`
+
+    A rate of 0 or less disables the bucket.
+    """
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = self.burst
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token is available; 0 when one is available now"""
+        if self.rate <= 0:
+            return 0.0
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        if self.rate > 0:
+            self.tokens -= 1
+
+
+class DeviceLimits:
+    """Per-device bucket and bound on commands waiting for the transmitter"""
+
+    __slots__ = ("bucket", "max_queue", "pending")
+
+    def __init__(self, bucket: Optional[TokenBucket], max_queue: int):
+        self.bucket = bucket
+        self.max_queue = max_queue
+        self.pending = 0
+
+
+class Admission:
+    """A granted slot; leaving the `with` block frees the device queue slot"""
+
+    __slots__ = ("limits",)
+
+    def __init__(self, limits: DeviceLimits):
+        self.limits = limits
+
+    def __enter__(self) -> "Admission":
+        return self
+
+    def __exit__(self, *exc_info) -> bool:
+        self.limits.pending -= 1
+        return False
+
+
+class AdmissionController:
+    """
+    Token buckets and bounded queues in front of the transmit path
+
+    A command is admitted only if the global bucket, the client's bucket and
+    the device's bucket (when the manifest sets one) all have a token and the
+    device has fewer than `max_queue` commands waiting or transmitting.
+    Otherwise it is refused at once with the time after which a retry can
+    succeed, instead of queueing behind a burst. Tokens are only taken when
+    every check passes.
+    """
+
+    def __init__(self, global_rate: float = ADMISSION_GLOBAL_RATE, global_burst: float = ADMISSION_GLOBAL_BURST,
+                 client_rate: float = ADMISSION_CLIENT_RATE, client_burst: float = ADMISSION_CLIENT_BURST,
+                 max_queue: int = ADMISSION_MAX_QUEUE, clock=time.monotonic):
+        self.clock = clock
+        self.client_rate = client_rate
+        self.client_burst = client_burst
+        self.max_queue = max_queue
+        self.global_bucket = TokenBucket(global_rate, global_burst, clock())
+        self._clients: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._devices: Dict[str, DeviceLimits] = {}
+
+    def configure(self, device: str, limits: Optional[Dict[str, float]]) -> None:
+        """
+        Set a device's limits from its manifest `limits` entry (`rate`, `burst`, `max_queue`)
+
+        Raises:
+            ValueError: If the entry has unknown keys
+        """
+        limits = limits or {}
+        unknown = set(limits) - {"rate", "burst", "max_queue"}
+        if unknown:
+            raise ValueError(f"Device '{device}' has unknown limits: {', '.join(sorted(unknown))}")
+        bucket = None
+        if limits.get("rate"):
+            bucket = TokenBucket(limits["rate"], limits.get("burst", limits["rate"]), self.clock())
+        self._devices[device] = DeviceLimits(bucket, int(limits.get("max_queue", self.max_queue)))
+
+    def configure_devices(self, limits: Dict[str, Optional[Dict[str, float]]]) -> None:
+        """Configure every device of a manifest, keyed by device name"""
+        for device, device_limits in limits.items():
+            self.configure(device, device_limits)
+
+    def _device(self, device: str) -> DeviceLimits:
+        limits = self._devices.get(device)
+        if limits is None:
+            limits = self._devices[device] = DeviceLimits(None, self.max_queue)
+        return limits
+
+    def _client(self, client: str, now: float) -> TokenBucket:
+        bucket = self._clients.get(client)
+        if bucket is None:
+            bucket = self._clients[client] = TokenBucket(self.client_rate, self.client_burst, now)
+            if len(self._clients) > MAX_CLIENTS:
+                self._clients.popitem(last=False)
+        else:
+            self._clients.move_to_end(client)
+        return bucket
+
+    def admit(self, device: str, client: Optional[str] = None) -> Admission:
+        """
+        Reserve a queue slot and a token for a command, to be used in a `with` block
+
+        Raises:
+            AdmissionRejectedError: If a bucket is empty or the device queue is full
+        """
+        now = self.clock()
+        limits = self._device(device)
+        if limits.max_queue > 0 and limits.pending >= limits.max_queue:
+            self._reject(device, "queue", QUEUE_FULL_RETRY_S)
+
+        checks = [("global", self.global_bucket), ("client", self._client(client or "unknown", now))]
+        if limits.bucket is not None:
+            checks.append(("device", limits.bucket))
+        delays = [(bucket.delay(now), reason) for reason, bucket in checks]
+        delay, reason = max(delays)
+        if delay > 0:
+            self._reject(device, reason, delay)
+        for _, bucket in checks:
+            bucket.take()
+
+        limits.pending += 1
+        return Admission(limits)
+
+    def admit_all(self, devices: Iterable[str], client: Optional[str] = None) -> ExitStack:
+        """
+        Admit one command per device, e.g. for a batch; slots already taken are freed on rejection
+
+        Raises:
+            AdmissionRejectedError: If any device is over its limits
+        """
+        with ExitStack() as stack:
+            for device in dict.fromkeys(devices):
+                stack.enter_context(self.admit(device, client))
+            return stack.pop_all()
+
+    @staticmethod
+    def _reject(device: str, reason: str, retry_after: float) -> None:
+        ADMISSION_REJECTED.inc(reason, device)
+        raise AdmissionRejectedError(device, reason, retry_after)
+
+    def pending(self, device: str) -> int:
+        """Commands for a device that are waiting or transmitting"""
+        return self._device(device).pending
+
+
+def client_host(connection) -> Optional[str]:
+    """Client address of a request or websocket, the key of its token bucket"""
+    return connection.client.host if connection.client else None
+
+
+_shared_controller: Optional[AdmissionController] = None
+
+
+def get_admission_controller() -> AdmissionController:
+    """Get the process-wide admission controller"""
+    global _shared_controller
+    if _shared_controller is None:
+        _shared_controller = AdmissionController()
+    return _shared_controller
@@ -0,0 +1,257 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+from enum import Enum
+from pathlib import Path
+from typing import Dict, Optional
+from models.ac_model import ACMode, ACTempControl, ACTimerControl
+from models.batch_model import BatchDevice, BatchStep
+from models.light_model import LightMode
+from env import IR_CODE_DIR, SCENES_FILE
+from services.code_library import IRCode
+from services.transmitter import DEFAULT_CARRIER, TransmitterError, join_pulse_trains
+
+
+class BatchValidationError(ValueError):
+    """Raised when one or more steps of a batch cannot be resolved"""
+    def __init__(self, errors: list[str]):
+        self.errors = errors
+        super().__init__("Invalid batch: " + "; ".join(errors))
+
+
+class SceneNotFoundError(Exception):
+    """Raised when a named scene does not exist"""
+    def __init__(self, name: str):
+        self.name = name
+        super().__init__(f"Scene not found: {name}")
+
+
+class ResolvedStep:
+    """A batch step matched to its IR code"""
+
+    __slots__ = ("step", "action", "code", "carrier")
+
+    def __init__(self, step: BatchStep, action: Enum, code: IRCode, carrier: int):
+        self.step = step
+        self.action = action
+        self.code = code
+        self.carrier = carrier
+
+
+class BatchService:
+    """
+    Runs ordered light and AC actions as pre-concatenated pulse trains
+
+    All steps are validated before anything is sent. Consecutive steps that
+    share a carrier are joined into a single train with the scheduler's
+    inter-frame gap between them, so a scene normally costs one transmit.
+    Steps for devices on different emitters are sent in parallel, keeping
+    their order on each emitter.
+    """
+
+    def __init__(self, light_service, ac_service, scenes_file: Optional[str] = None):
+        self.light_service = light_service
+        self.ac_service = ac_service
+        self._devices = {
+            BatchDevice.LIGHT: (light_service, [LightMode]),
+            BatchDevice.AC: (ac_service, [ACMode, ACTempControl, ACTimerControl]),
+        }
+        if scenes_file is None:
+            scenes_file = SCENES_FILE or str(Path(IR_CODE_DIR) / "scenes.json")
+        self.scenes_file = Path(scenes_file)
+        self._scenes = self._load_scenes()
+        # Snapshots are written from worker threads; an older one never replaces a newer one
+        self._write_lock = threading.Lock()
+        self._version = 0
+        self._written = 0
+
+    def _resolve_action(self, step: BatchStep) -> Optional[Enum]:
+        _, action_enums = self._devices[step.device]
+        for action_enum in action_enums:
+            try:
+                return action_enum(step.action)
+            except ValueError:
+                continue
+        return None
+
+    def resolve(self, steps: list[BatchStep]) -> list[ResolvedStep]:
+        """
+        Match every step to its IR code
+
+        Raises:
+            BatchValidationError: If any step has an unknown action or no recording
+        """
+        resolved = []
+        errors = []
+        for index, step in enumerate(steps):
+            service, _ = self._devices[step.device]
+            action = self._resolve_action(step)
+            if action is None:
+                errors.append(f"step {index}: unknown {step.device.value} action '{step.action}'")
+                continue
+            try:
+                code = service.codes.get(action)
+            except KeyError:
+                errors.append(f"step {index}: no IR code recorded for {step.device.value} '{step.action}'")
+                continue
+            resolved.append(ResolvedStep(step, action, code, code.carrier or service.carrier or DEFAULT_CARRIER))
+        if errors:
+            raise BatchValidationError(errors)
+        return resolved
+
+    async def run(self, steps: list[BatchStep]) -> Dict[str, any]:
+        """
+        Validate and transmit a batch, reporting the outcome of every step
+
+        Raises:
+            BatchValidationError: If any step is invalid; nothing is sent
+        """
+        resolved = self.resolve(steps)
+
+        # Consecutive steps are joined per emitter; other emitters' steps do not split a group
+        lanes: Dict[int, list[list[ResolvedStep]]] = {}
+        for item in resolved:
+            groups = lanes.setdefault(id(self._scheduler(item)), [])
+            if groups and groups[-1][0].carrier == item.carrier:
+                groups[-1].append(item)
+            else:
+                groups.append([item])
+
+        outcomes = await asyncio.gather(*(self._run_lane(groups) for groups in lanes.values()))
+        results: Dict[int, Dict[str, any]] = {}
+        for lane_results, _, _ in outcomes:
+            results.update(lane_results)
+
+        return {
+            "success": all(failure is None for _, _, failure in outcomes),
+            "steps": [results[id(item)] for item in resolved],
+            "queue_wait_ms": round(sum(wait for _, wait, _ in outcomes) * 1000, 3)
+        }
+
+    def _scheduler(self, item: ResolvedStep):
+        service, _ = self._devices[item.step.device]
+        return service.scheduler
+
+    async def _run_lane(self, groups: list[list[ResolvedStep]]):
+        """Send the groups of one emitter in order, skipping the rest after a failure"""
+        scheduler = self._scheduler(groups[0][0])
+        gap_us = int(scheduler.frame_gap * 1_000_000)
+        results: Dict[int, Dict[str, any]] = {}
+        total_wait = 0.0
+        failure = None
+        for group in groups:
+            if failure is None:
+                train = join_pulse_trains([item.code.pulses for item in group], gap_us)
+                code = IRCode("batch:" + "+".join(item.code.name for item in group), train)
+                try:
+                    receipt = await scheduler.submit(code, group[0].carrier)
+                    total_wait += receipt.wait
+                except TransmitterError as e:
+                    failure = str(e)
+                    for item in group:
+                        results[id(item)] = self._step_result(item, False, f"Transmission failed: {failure}")
+                    continue
+                for item in group:
+                    service, _ = self._devices[item.step.device]
+                    service.record_transmitted(item.action)
+                    results[id(item)] = self._step_result(item, True, "Sent")
+            else:
+                for item in group:
+                    results[id(item)] = self._step_result(item, False, "Skipped after earlier failure")
+        return results, total_wait, failure
+
+    @staticmethod
+    def _step_result(item: ResolvedStep, success: bool, message: str) -> Dict[str, any]:
+        return {
+            "device": item.step.device.value,
+            "action": item.step.action,
+            "success": success,
+            "message": message
+        }
+
+    # ========== SCENES ==========
+
+    def _load_scenes(self) -> Dict[str, list[BatchStep]]:
+        try:
+            data = json.loads(self.scenes_file.read_text())
+        except FileNotFoundError:
+            return {}
+        return {
+            name: [BatchStep(**step) for step in steps]
+            for name, steps in data.items()
+        }
+
+    async def _save_scenes(self) -> None:
+        data = {
+            name: [step.model_dump(mode="json") for step in steps]
+            for name, steps in self._scenes.items()
+        }
+        self._version += 1
+        await asyncio.to_thread(self._write_scenes, self._version, data)
+
+    def _write_scenes(self, version: int, data: Dict[str, list]) -> None:
+        with self._write_lock:
+            if version <= self._written:
+                return
+            self.scenes_file.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.scenes_file.parent, prefix=".scenes_")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(data, f, indent=2)
+                os.replace(tmp_path, self.scenes_file)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            self._written = version
+
+    def get_scenes(self) -> list[Dict[str, any]]:
+        """Get all stored scenes"""
+        return [{"name": name, "steps": steps} for name, steps in self._scenes.items()]
+
+    async def save_scene(self, name: str, steps: list[BatchStep]) -> Dict[str, any]:
+        """
+        Validate and store a named scene, replacing any existing one
+
+        Raises:
+            BatchValidationError: If any step is invalid
+        """
+        self.resolve(steps)
+        self._scenes[name] = steps
+        await self._save_scenes()
+        return {"name": name, "steps": steps}
+
+    async def delete_scene(self, name: str) -> None:
+        """
+        Delete a named scene
+
+        Raises:
+            SceneNotFoundError: If the scene does not exist
+        """
+        if self._scenes.pop(name, None) is None:
+            raise SceneNotFoundError(name)
+        await self._save_scenes()
+
+    def get_scene(self, name: str) -> list[BatchStep]:
+        """
+        Get the steps of a stored scene
+
+        Raises:
+            SceneNotFoundError: If the scene does not exist
+        """
+        steps = self._scenes.get(name)
+        if steps is None:
+            raise SceneNotFoundError(name)
+        return steps
+
+    async def run_scene(self, name: str) -> Dict[str, any]:
+        """
+        Run a stored scene
+
+        Raises:
+            SceneNotFoundError: If the scene does not exist
+            BatchValidationError: If a code used by the scene has gone missing
+        """
+        steps = self.get_scene(name)
+        return await self.run(steps)
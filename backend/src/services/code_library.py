@@ -0,0 +1,214 @@
+import logging
+import os
+import threading
+from array import array
+from enum import Enum
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Type
+from env import IR_CODE_LIBRARY, TRANSMIT_FRAME_GAP_MS
+from services.ir_library import IRCodeLibraryFile, IRLibraryError
+from services.transmitter import join_pulse_trains, parse_mode2
+
+try:
+    import watchfiles
+except ImportError:  # pragma: no cover - watchfiles ships with uvicorn[standard]
+    watchfiles = None
+
+logger = logging.getLogger(__name__)
+
+# Seconds between mtime scans when watchfiles is not available
+POLL_INTERVAL = 2.0
+
+
+class IRCode:
+    """A parsed IR code ready to be handed to a transmitter"""
+
+    __slots__ = ("name", "pulses", "source", "mtime_ns", "carrier")
+
+    def __init__(self, name: str, pulses: array, source: Optional[Path] = None, mtime_ns: int = 0,
+                 carrier: Optional[int] = None):
+        self.name = name
+        self.pulses = pulses
+        self.source = source
+        self.mtime_ns = mtime_ns
+        # Carrier recorded with the code; None leaves it to the device
+        self.carrier = carrier
+
+
+class CodeLibrary:
+    """
+    In-memory cache of the mode2 recordings for one device
+
+    Every `{prefix}_{action}.txt` under the resources path is parsed once into
+    an array('I') pulse train keyed by its enum member, so looking a code up
+    does no filesystem I/O. A background watcher re-parses files that change
+    on disk and swaps the new entry in.
+
+    When a binary library file is given (IR_CODE_LIBRARY by default), codes
+    are decoded from the memory-mapped library on first use instead, and the
+    whole cache is dropped when the library file is replaced.
+    """
+
+    def __init__(self, resources_path: str, prefix: str, actions: Iterable[Type[Enum]],
+                 library_file: Optional[str] = IR_CODE_LIBRARY):
+        self.resources_path = Path(resources_path)
+        self.library_file = Path(library_file) if library_file else None
+        self._library: Optional[IRCodeLibraryFile] = None
+        self._library_mtime_ns: Optional[int] = None
+        # Held while reading the mapped library, so the watcher never closes it under a reader
+        self._library_lock = threading.Lock()
+        self.prefix = prefix
+        self._file_prefix = f"{prefix}_"
+        self._members: Dict[str, Enum] = {
+            member.value: member for action_enum in actions for member in action_enum
+        }
+        self._codes: Dict[Enum, IRCode] = {}
+        self._stop_event = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        self.rescan()
+
+    def get(self, action: Enum) -> IRCode:
+        """
+        Get the parsed code for an action
+
+        Raises:
+            KeyError: If no recording exists for the action
+        """
+        try:
+            return self._codes[action]
+        except KeyError:
+            if self._library is None:
+                raise
+        return self._load_from_library(action)
+
+    def __contains__(self, action: Enum) -> bool:
+        try:
+            self.get(action)
+        except KeyError:
+            return False
+        return True
+
+    def _load_from_library(self, action: Enum) -> IRCode:
+        # Cached under the lock too, so a code from a replaced library is never stored
+        with self._library_lock:
+            if self._library is None:
+                raise KeyError(action)
+            entry = self._library.get(self.prefix, action.value)
+            pulses = entry.pulses
+            if entry.repeat > 1:
+                pulses = join_pulse_trains([pulses] * entry.repeat, TRANSMIT_FRAME_GAP_MS * 1000)
+            code = IRCode(
+                f"{self.prefix}_{action.value}", pulses, mtime_ns=self._library.mtime_ns, carrier=entry.carrier
+            )
+            self._codes[action] = code
+        return code
+
+    def _member_for(self, filename: str) -> Optional[Enum]:
+        if not filename.startswith(self._file_prefix) or not filename.endswith(".txt"):
+            return None
+        return self._members.get(filename[len(self._file_prefix):-4])
+
+    def rescan(self) -> list[Enum]:
+        """
+        Reload every recording whose mtime changed and drop deleted ones
+
+        Returns the actions whose entries were replaced or removed.
+        """
+        if self.library_file is not None:
+            return self._reopen_library()
+
+        changed = []
+        seen = set()
+        try:
+            entries = list(os.scandir(self.resources_path))
+        except FileNotFoundError:
+            entries = []
+
+        for entry in entries:
+            member = self._member_for(entry.name)
+            if member is None:
+                continue
+            try:
+                mtime_ns = entry.stat().st_mtime_ns
+            except FileNotFoundError:
+                continue
+            seen.add(member)
+            current = self._codes.get(member)
+            if current is not None and current.mtime_ns == mtime_ns:
+                continue
+            path = Path(entry.path)
+            try:
+                pulses = parse_mode2(path.read_text())
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping unreadable IR code {path}: {e}")
+                continue
+            if not pulses:
+                logger.warning(f"Skipping empty IR code {path}")
+                continue
+            self._codes[member] = IRCode(path.stem, pulses, path, mtime_ns)
+            changed.append(member)
+
+        for member in list(self._codes):
+            if member not in seen:
+                del self._codes[member]
+                changed.append(member)
+
+        if changed:
+            logger.info(f"Loaded IR codes for {self.prefix}: {[member.value for member in changed]}")
+        return changed
+
+    def _reopen_library(self) -> list[Enum]:
+        try:
+            mtime_ns = self.library_file.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime_ns = None
+        if mtime_ns == self._library_mtime_ns:
+            return []
+
+        library = None
+        if mtime_ns is not None:
+            try:
+                library = IRCodeLibraryFile(str(self.library_file))
+            except (OSError, IRLibraryError) as e:
+                # Keep serving the previous library until a valid one appears
+                logger.warning(f"Cannot open IR library {self.library_file}: {e}")
+                return []
+            logger.info(f"Opened IR library {self.library_file} for {self.prefix}")
+
+        # Swap the library before dropping cached codes so lookups never miss
+        with self._library_lock:
+            changed = list(self._codes)
+            previous, self._library = self._library, library
+            self._library_mtime_ns = mtime_ns
+            self._codes = {}
+            # Decoded codes are copies, so closing the old map leaves them valid
+            if previous is not None:
+                previous.close()
+        return changed
+
+    def start_watching(self) -> None:
+        """Start the background thread that reloads changed recordings"""
+        if self._watcher is not None:
+            return
+        self._stop_event.clear()
+        target = self._watch if watchfiles is not None else self._poll
+        self._watcher = threading.Thread(
+            target=target, name=f"{self.prefix}-code-watcher", daemon=True
+        )
+        self._watcher.start()
+
+    def stop_watching(self) -> None:
+        """Stop the background watcher"""
+        self._stop_event.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=5)
+            self._watcher = None
+
+    def _watch(self) -> None:
+        watched = self.library_file.parent if self.library_file is not None else self.resources_path
+        for _ in watchfiles.watch(watched, stop_event=self._stop_event):
+            self.rescan()
+
+    def _poll(self) -> None:
+        while not self._stop_event.wait(POLL_INTERVAL):
+            self.rescan()
@@ -0,0 +1,210 @@
+import json
+import os
+from enum import Enum
+from functools import partial
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Optional
+from models.ac_model import ACMode, ACTempControl, ACTimerControl
+from models.light_model import LightMode
+from env import DEVICE_MANIFEST
+from services.ac_service import (
+    ACResourceNotFoundError,
+    IRTransmissionError as ACTransmissionError
+)
+from services.device_service import (
+    DeviceResourceNotFoundError,
+    DeviceService,
+    IRTransmissionError as DeviceTransmissionError
+)
+from services.light_service import (
+    LightResourceNotFoundError,
+    IRTransmissionError as LightTransmissionError
+)
+from services.tx_scheduler import get_scheduler
+
+DEFAULT_MANIFEST = Path(__file__).resolve().parent.parent / "devices.json"
+
+# Exceptions the generic handler maps to HTTP status codes
+RESOURCE_NOT_FOUND_ERRORS = (
+    LightResourceNotFoundError,
+    ACResourceNotFoundError,
+    DeviceResourceNotFoundError
+)
+TRANSMISSION_ERRORS = (
+    LightTransmissionError,
+    ACTransmissionError,
+    DeviceTransmissionError
+)
+
+
+class UnknownDeviceActionError(Exception):
+    """Raised when no manifest entry matches the device and action"""
+    def __init__(self, device: str, action: str):
+        self.device = device
+        self.action = action
+        super().__init__(f"Unknown action '{action}' for device '{device}'")
+
+
+class DeviceAction:
+    """One entry of the dispatch table"""
+
+    __slots__ = ("device", "route", "member", "service", "handler")
+
+    def __init__(self, device: str, route: str, member: Enum, service,
+                 handler: Callable[[], Awaitable[Dict[str, any]]]):
+        self.device = device
+        self.route = route
+        self.member = member
+        self.service = service
+        self.handler = handler
+
+
+class DeviceRegistry:
+    """
+    Dispatch table built from the declarative device manifest
+
+    The manifest lists every device with its carrier, the URL action names and
+    the code each one sends. Devices backed by the light or AC service keep
+    their state tracking; any other device gets a DeviceService that reads
+    `{prefix}_{code}.txt` from its own resources path. Requests are resolved
+    with one dict lookup, however many devices and codes there are.
+
+    A device with an `emitter` key is sent through that emitter's scheduler,
+    so devices on different emitters transmit in parallel.
+    """
+
+    def __init__(self, builtin_services: Optional[Dict[str, object]] = None,
+                 scheduler=None, state_store=None, schedulers: Optional[Dict[str, object]] = None):
+        self.builtin_services = builtin_services or {}
+        # Passed on to the DeviceService of every generic device
+        self.scheduler = scheduler
+        # Schedulers by emitter name; emitters missing here use the shared ones
+        self.schedulers = schedulers or {}
+        self.state_store = state_store
+        self.services: Dict[str, object] = {}
+        self.carriers: Dict[str, Optional[int]] = {}
+        # Manifest `limits` of every device, for admission control
+        self.limits: Dict[str, Optional[Dict[str, float]]] = {}
+        self._dispatch: Dict[tuple[str, str], DeviceAction] = {}
+
+    @classmethod
+    def from_file(cls, path: Optional[str] = None,
+                  builtin_services: Optional[Dict[str, object]] = None,
+                  scheduler=None, state_store=None,
+                  schedulers: Optional[Dict[str, object]] = None) -> "DeviceRegistry":
+        """Build a registry from a manifest file (DEVICE_MANIFEST by default)"""
+        manifest_path = Path(path or DEVICE_MANIFEST or DEFAULT_MANIFEST)
+        registry = cls(builtin_services, scheduler, state_store, schedulers)
+        registry.load(json.loads(manifest_path.read_text()))
+        return registry
+
+    def load(self, manifest: Dict[str, any]) -> None:
+        """
+        Add every device of a parsed manifest to the dispatch table
+
+        Raises:
+            ValueError: If the manifest references an unknown service, code or emitter
+        """
+        for name, spec in manifest.get("devices", {}).items():
+            actions = spec.get("actions", {})
+            kind = spec.get("service", "generic")
+            scheduler = self._emitter_scheduler(name, spec.get("emitter"))
+
+            if kind == "generic":
+                resources_path = os.path.expandvars(spec.get("resources_path", ""))
+                service = DeviceService(
+                    name, resources_path, sorted(set(actions.values())),
+                    carrier=spec.get("carrier"), prefix=spec.get("prefix"),
+                    scheduler=scheduler or self.scheduler, state_store=self.state_store
+                )
+                resolve = service.actions
+                make_handler = lambda member, service=service: partial(service.send, member)
+            elif kind in self.builtin_services:
+                service = self.builtin_services[kind]
+                if "carrier" in spec:
+                    service.carrier = spec["carrier"]
+                if "protocol" in spec:
+                    if not hasattr(service, "configure_protocol"):
+                        raise ValueError(f"Device '{name}' does not support a protocol layout")
+                    service.configure_protocol(spec["protocol"])
+                if scheduler is not None:
+                    service.scheduler = scheduler
+                    service.transmitter = scheduler.transmitter
+                resolve, make_handler = self._builtin_dispatch(kind, service)
+            else:
+                raise ValueError(f"Device '{name}' uses unknown service '{kind}'")
+
+            self.services[name] = service
+            self.carriers[name] = service.carrier
+            self.limits[name] = spec.get("limits")
+            for route, code in actions.items():
+                try:
+                    member = resolve(code)
+                except ValueError:
+                    raise ValueError(f"Device '{name}' action '{route}' references unknown code '{code}'")
+                self._dispatch[(name, route)] = DeviceAction(name, route, member, service, make_handler(member))
+
+    def _emitter_scheduler(self, name: str, emitter: Optional[str]):
+        if emitter is None:
+            return None
+        if emitter in self.schedulers:
+            return self.schedulers[emitter]
+        try:
+            return get_scheduler(emitter)
+        except ValueError as e:
+            raise ValueError(f"Device '{name}': {e}")
+
+    @staticmethod
+    def _builtin_dispatch(kind: str, service):
+        if kind == "light":
+            return LightMode, lambda member: partial(service.set_light_mode, member)
+
+        handlers = {
+            ACMode: service.set_ac_mode,
+            ACTempControl: service.control_temperature,
+            ACTimerControl: service.control_timer
+        }
+
+        def resolve(code: str) -> Enum:
+            for action_enum in handlers:
+                try:
+                    return action_enum(code)
+                except ValueError:
+                    continue
+            raise ValueError(code)
+
+        return resolve, lambda member: partial(handlers[type(member)], member)
+
+    def lookup(self, device: str, action: str) -> DeviceAction:
+        """
+        Find the dispatch entry for a device action
+
+        Raises:
+            UnknownDeviceActionError: If the manifest has no such action
+        """
+        try:
+            return self._dispatch[(device, action)]
+        except KeyError:
+            raise UnknownDeviceActionError(device, action)
+
+    def __len__(self) -> int:
+        return len(self._dispatch)
+
+    def get_devices(self) -> list[Dict[str, any]]:
+        """Describe every device and its actions"""
+        devices: Dict[str, list[str]] = {name: [] for name in self.services}
+        for device, route in self._dispatch:
+            devices[device].append(route)
+        return [
+            {
+                "name": name,
+                "carrier": self.carriers[name],
+                "emitter": getattr(getattr(self.services[name], "scheduler", None), "emitter", None),
+                "actions": actions
+            }
+            for name, actions in devices.items()
+        ]
+
+    def code_libraries(self) -> list:
+        """Code libraries of every registered service, for the file watchers"""
+        return [service.codes for service in {id(s): s for s in self.services.values()}.values()]
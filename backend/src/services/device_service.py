@@ -0,0 +1,84 @@
+import time
+from enum import Enum
+from typing import Dict, Optional
+from models.state_model import DeviceState
+from services.code_library import CodeLibrary, IRCode
+from services.state_store import DeviceStateStore, get_state_store
+from services.transmitter import TransmitterError
+from services.tx_scheduler import PRIORITY_MODE, TransmitScheduler, get_scheduler
+
+
+class DeviceResourceNotFoundError(Exception):
+    """Raised when a device resource file is not found"""
+    def __init__(self, device: str, action: str):
+        self.device = device
+        self.action = action
+        super().__init__(f"Resource file not found for {device} action: {action}")
+
+
+class IRTransmissionError(Exception):
+    """Raised when IR transmission fails"""
+    def __init__(self, action: str, details: str):
+        self.action = action
+        self.details = details
+        super().__init__(f"Failed to transmit IR signal for action '{action}': {details}")
+
+
+class DeviceService:
+    """
+    Stateless IR device declared only in the device manifest
+
+    Each action sends the recorded `{prefix}_{code}.txt` as is. The action
+    enum is built from the manifest so the code library can key codes by
+    member the same way it does for the light and AC services.
+    """
+
+    def __init__(self, name: str, resources_path: str, codes: list[str],
+                 carrier: Optional[int] = None, prefix: Optional[str] = None,
+                 scheduler: Optional[TransmitScheduler] = None,
+                 state_store: Optional[DeviceStateStore] = None):
+        if not resources_path:
+            raise ValueError(f"resources_path is not set for device {name}")
+        self.name = name
+        self.carrier = carrier
+        self.actions = Enum(f"{name.title()}Action", {code.upper(): code for code in codes}, type=str)
+        self.codes = CodeLibrary(resources_path, prefix or name, [self.actions])
+        self.scheduler = scheduler or get_scheduler()
+        self.state_store = state_store or get_state_store()
+        self.state = self.state_store.states.devices.setdefault(name, DeviceState())
+
+    def _get_code(self, action: Enum) -> IRCode:
+        """Get the cached IR code for the action"""
+        try:
+            return self.codes.get(action)
+        except KeyError:
+            raise DeviceResourceNotFoundError(self.name, action.value)
+
+    def record_transmitted(self, action: Enum) -> None:
+        """Update the tracked state after an action was sent"""
+        self.state.last_action = action.value
+        self.state.updated_at = time.time()
+        self.state_store.changed(self.name)
+
+    async def send(self, action: Enum) -> Dict[str, any]:
+        """
+        Send the code recorded for an action
+
+        Raises:
+            DeviceResourceNotFoundError: If the resource file doesn't exist
+            IRTransmissionError: If IR transmission fails
+        """
+        code = self._get_code(action)
+        try:
+            receipt = await self.scheduler.submit(code, code.carrier or self.carrier, PRIORITY_MODE)
+        except TransmitterError as e:
+            raise IRTransmissionError(code.name, str(e))
+        self.record_transmitted(action)
+
+        return {
+            "device": self.name,
+            "action": action.value,
+            "success": True,
+            "message": f"{self.name} {action.value} sent successfully",
+            "queue_wait_ms": round(receipt.wait * 1000, 3)
+        }
@@ -0,0 +1,57 @@
+import asyncio
+import json
+from typing import Dict, Optional
+from env import EVENT_QUEUE_SIZE
+
+
+class EventBus:
+    """
+    Fan-out of state-change and transmit events to live clients
+
+    Every subscriber gets its own bounded queue of pre-serialized JSON text,
+    so an event is encoded once however many clients are connected. A client
+    that falls behind loses its oldest events rather than holding up the
+    publisher.
+    """
+
+    def __init__(self, queue_size: int = EVENT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers: set[asyncio.Queue] = set()
+        self.published = 0
+        self.dropped = 0
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self) -> asyncio.Queue:
+        """Get a queue that receives every event published from now on"""
+        queue = asyncio.Queue(self.queue_size)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self._subscribers.discard(queue)
+
+    def publish(self, event: Dict[str, any]) -> None:
+        """Queue an event for every subscriber without blocking"""
+        if not self._subscribers:
+            return
+        text = json.dumps(event, separators=(",", ":"))
+        self.published += 1
+        for queue in list(self._subscribers):
+            if queue.full():
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait(text)
+
+
+_shared_bus: Optional[EventBus] = None
+
+
+def get_event_bus() -> EventBus:
+    """Get the process-wide event bus"""
+    global _shared_bus
+    if _shared_bus is None:
+        _shared_bus = EventBus()
+    return _shared_bus
@@ -0,0 +1,352 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, Optional
+import httpx
+from env import GATEWAY_HEALTH_INTERVAL_S, GATEWAY_NODES, GATEWAY_TIMEOUT_S
+from services.metrics import REGISTRY
+from services.request_log import start_background
+
+logger = logging.getLogger(__name__)
+
+# Paths a node serves through the gateway
+PROXIED_PREFIXES = ("light", "ac")
+
+# Request headers passed on to the node
+FORWARDED_HEADERS = ("content-type", "idempotency-key", "accept", "if-none-match")
+
+# Node response headers not passed back: hop-by-hop ones, the length and encoding
+# of a body httpx has already decoded, and headers this server sets itself
+DROPPED_RESPONSE_HEADERS = frozenset((
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "te", "trailer",
+    "transfer-encoding", "upgrade", "content-length", "content-encoding", "date", "server", "x-request-id"
+))
+
+# Health checks give up sooner than proxied requests
+HEALTH_TIMEOUT_S = 2
+
+# Keep-alive connections kept open to each node
+POOL_KEEPALIVE = 10
+POOL_MAX_CONNECTIONS = 20
+
+GATEWAY_REQUESTS = REGISTRY.counter(
+    "gateway_requests_total", "Requests forwarded to downstream nodes by node and outcome", ("node", "outcome")
+)
+
+
+class NodeNotFoundError(Exception):
+    """Raised when a request names a node that is not configured"""
+    def __init__(self, name: str):
+        self.name = name
+        super().__init__(f"Unknown node: {name}")
+
+
+class NodeUnavailableError(Exception):
+    """Raised when a node is marked down or cannot be reached"""
+    def __init__(self, name: str, reason: str):
+        self.name = name
+        self.reason = reason
+        super().__init__(f"Node '{name}' is unavailable: {reason}")
+
+
+class NodeTimeoutError(Exception):
+    """Raised when a node accepted a request but did not answer in time"""
+    def __init__(self, name: str, reason: str):
+        self.name = name
+        self.reason = reason
+        super().__init__(f"Node '{name}' did not answer in time: {reason}")
+
+
+class GatewayValidationError(ValueError):
+    """Raised when a fan-out batch references unknown nodes"""
+    def __init__(self, errors: list[str]):
+        self.errors = errors
+        super().__init__("Invalid batch: " + "; ".join(errors))
+
+
+def parse_nodes(text: Optional[str]) -> Dict[str, str]:
+    """
+    Parse `living=http://10.0.0.2:8000,bedroom=http://10.0.0.3:8000` into a node to URL mapping
+
+    Raises:
+        ValueError: If an entry has no name or URL, or a name is repeated
+    """
+    nodes: Dict[str, str] = {}
+    for entry in (text or "").split(","):
+        if not entry.strip():
+            continue
+        name, _, url = (part.strip() for part in entry.partition("="))
+        if not name or not url.startswith(("http://", "https://")):
+            raise ValueError(f"Invalid node '{entry}', expected name=http://host:port")
+        if name in nodes:
+            raise ValueError(f"Node '{name}' is listed twice")
+        nodes[name] = url.rstrip("/")
+    return nodes
+
+
+class Node:
+    """A downstream Home Controller and its last known health"""
+
+    __slots__ = ("name", "url", "client", "healthy", "latency_ms", "last_check", "last_error")
+
+    def __init__(self, name: str, url: str):
+        self.name = name
+        self.url = url
+        self.client: Optional[httpx.AsyncClient] = None
+        # Assumed up until a request or health check says otherwise
+        self.healthy = True
+        self.latency_ms: Optional[float] = None
+        self.last_check: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def status(self) -> Dict[str, any]:
+        return {
+            "name": self.name,
+            "url": self.url,
+            "healthy": self.healthy,
+            "latency_ms": self.latency_ms,
+            "last_check": self.last_check,
+            "last_error": self.last_error
+        }
+
+
+class Gateway:
+    """
+    Proxies light and AC requests to the Home Controller nodes of other rooms
+
+    Every node has one pooled keep-alive client, so forwarded requests reuse
+    open connections. A background task health-checks all nodes together.
+    A node that cannot be connected to, or fails a check, is marked down and
+    requests for it fail at once, without waiting for a connect timeout,
+    until a check succeeds again. A slow answer, e.g. a long IR transmit,
+    fails that request only.
+    """
+
+    def __init__(self, nodes: Dict[str, str], health_interval: float = GATEWAY_HEALTH_INTERVAL_S,
+                 timeout: float = GATEWAY_TIMEOUT_S):
+        self.nodes = {name: Node(name, url) for name, url in nodes.items()}
+        self.health_interval = health_interval
+        self.timeout = timeout
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # Owns the clients of the current loop and closes them when cancelled
+        self._closer: Optional[asyncio.Task] = None
+        self._health_task: Optional[asyncio.Task] = None
+        # Without polling, a node marked down is checked on its own until it is back
+        self._polling = False
+        self._recovering: Dict[str, asyncio.Task] = {}
+
+    @classmethod
+    def from_env(cls) -> "Gateway":
+        """Gateway for the nodes in GATEWAY_NODES"""
+        return cls(parse_nodes(GATEWAY_NODES))
+
+    def __bool__(self) -> bool:
+        return bool(self.nodes)
+
+    def _ensure_clients(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        # Connections belong to the loop that opened them
+        self._loop = loop
+        limits = httpx.Limits(max_keepalive_connections=POOL_KEEPALIVE, max_connections=POOL_MAX_CONNECTIONS)
+        for node in self.nodes.values():
+            node.client = httpx.AsyncClient(base_url=node.url, limits=limits, timeout=self.timeout)
+        # Closed when this loop cancels its remaining tasks on shutdown, as asyncio.run does, even
+        # if stop() never runs; a client left to a loop that has since closed can no longer be closed
+        self._closer = start_background(loop, self._close_on_cancel([node.client for node in self.nodes.values()]))
+
+    @staticmethod
+    async def _close_on_cancel(clients: list[httpx.AsyncClient]) -> None:
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await asyncio.gather(*(client.aclose() for client in clients), return_exceptions=True)
+
+    def node(self, name: str) -> Node:
+        """
+        Raises:
+            NodeNotFoundError: If the node is not configured
+        """
+        try:
+            return self.nodes[name]
+        except KeyError:
+            raise NodeNotFoundError(name)
+
+    def get_nodes(self) -> list[Dict[str, any]]:
+        """Health of every node"""
+        return [node.status() for node in self.nodes.values()]
+
+    # ========== HEALTH ==========
+
+    def start(self, poll: bool = True) -> None:
+        """
+        Start health-checking on the current event loop
+
+        With `poll` off, as in all but the primary worker, nodes are only
+        checked after a request found them down.
+        """
+        self._ensure_clients()
+        self._polling = poll
+        if poll and (self._health_task is None or self._health_task.done()):
+            self._health_task = start_background(asyncio.get_running_loop(), self._health_loop())
+
+    async def stop(self) -> None:
+        """Stop health checks and close every connection"""
+        tasks = [task for task in (self._health_task, *self._recovering.values()) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._health_task = None
+        self._recovering.clear()
+        self._polling = False
+        if self._loop is asyncio.get_running_loop():
+            self._closer.cancel()
+            await asyncio.gather(self._closer, return_exceptions=True)
+        self._closer = None
+        self._loop = None
+
+    async def _health_loop(self) -> None:
+        while True:
+            await self.check_all()
+            await asyncio.sleep(self.health_interval)
+
+    async def check_all(self) -> None:
+        """Check every node concurrently"""
+        self._ensure_clients()
+        await asyncio.gather(*(self._check(node) for node in self.nodes.values()))
+
+    async def _check(self, node: Node) -> None:
+        started = time.perf_counter()
+        try:
+            response = await node.client.get("/", timeout=min(HEALTH_TIMEOUT_S, self.timeout))
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            self._mark_down(node, e)
+        else:
+            if not node.healthy:
+                logger.info(f"Node {node.name} is back up")
+            node.healthy = True
+            node.last_error = None
+            node.latency_ms = round((time.perf_counter() - started) * 1000, 3)
+        node.last_check = time.time()
+
+    def _mark_down(self, node: Node, error: Exception) -> None:
+        if node.healthy:
+            logger.warning(f"Node {node.name} is down: {error!r}")
+        node.healthy = False
+        node.last_error = f"{type(error).__name__}: {error}"
+        if not self._polling and self._loop is not None and node.name not in self._recovering:
+            self._recovering[node.name] = start_background(self._loop, self._recover(node))
+
+    async def _recover(self, node: Node) -> None:
+        """Check one node until it answers again"""
+        try:
+            while not node.healthy:
+                await asyncio.sleep(self.health_interval)
+                await self._check(node)
+        finally:
+            self._recovering.pop(node.name, None)
+
+    # ========== FORWARDING ==========
+
+    async def forward(self, name: str, method: str, path: str, query: bytes = b"",
+                      body: bytes = b"", headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+        """
+        Send a request to a node over its pooled connection
+
+        Raises:
+            NodeNotFoundError: If the node is not configured
+            NodeUnavailableError: If the node is marked down or the request fails to reach it
+            NodeTimeoutError: If the node does not answer within the timeout; it stays up
+        """
+        node = self.node(name)
+        if not node.healthy:
+            GATEWAY_REQUESTS.inc(name, "skipped")
+            raise NodeUnavailableError(name, node.last_error or "marked down")
+        self._ensure_clients()
+        request = node.client.build_request(
+            method, path, params=query.decode("latin-1") or None, content=body or None, headers=headers
+        )
+        try:
+            response = await node.client.send(request)
+        except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+            GATEWAY_REQUESTS.inc(name, "failed")
+            self._mark_down(node, e)
+            raise NodeUnavailableError(name, node.last_error)
+        except httpx.TimeoutException as e:
+            GATEWAY_REQUESTS.inc(name, "timeout")
+            raise NodeTimeoutError(name, f"{type(e).__name__}: {e}")
+        except httpx.TransportError as e:
+            GATEWAY_REQUESTS.inc(name, "failed")
+            raise NodeUnavailableError(name, f"{type(e).__name__}: {e}")
+        GATEWAY_REQUESTS.inc(name, "forwarded")
+        return response
+
+    async def run_batch(self, steps: list) -> Dict[str, any]:
+        """
+        Split a batch by node and run every node's part concurrently
+
+        Each node runs its steps in order through its own /batch endpoint;
+        results are reported in the order of the request.
+
+        Raises:
+            GatewayValidationError: If any step names an unknown node; nothing is sent
+        """
+        errors = [f"step {index}: unknown node '{step.node}'"
+                  for index, step in enumerate(steps) if step.node not in self.nodes]
+        if errors:
+            raise GatewayValidationError(errors)
+
+        by_node: Dict[str, list] = {}
+        for step in steps:
+            by_node.setdefault(step.node, []).append(step)
+
+        outcomes = await asyncio.gather(*(self._run_node_batch(name, node_steps)
+                                          for name, node_steps in by_node.items()))
+        results = dict(zip(by_node, outcomes))
+        positions = {name: iter(node_results) for name, node_results in results.items()}
+        ordered = [next(positions[step.node]) for step in steps]
+        return {"success": all(result["success"] for result in ordered), "steps": ordered}
+
+    async def _run_node_batch(self, name: str, steps: list) -> list[Dict[str, any]]:
+        payload = {"steps": [{"device": step.device, "action": step.action} for step in steps]}
+        try:
+            response = await self.forward(
+                name, "POST", "/batch", body=json.dumps(payload).encode(),
+                headers={"content-type": "application/json"}
+            )
+            if response.status_code == 200:
+                return [{"node": name, **result} for result in response.json()["steps"]]
+            message = f"Node returned {response.status_code}: {_error_detail(response)}"
+        except (NodeUnavailableError, NodeTimeoutError) as e:
+            message = str(e)
+        except ValueError as e:
+            message = f"Invalid response from node: {e}"
+        return [
+            {"node": name, "device": step.device, "action": step.action, "success": False, "message": message}
+            for step in steps
+        ]
+
+
+def _error_detail(response: httpx.Response) -> str:
+    """The `detail` of a FastAPI error body, or the raw text of any other body"""
+    try:
+        body = response.json()
+    except ValueError:
+        body = None
+    if isinstance(body, dict) and "detail" in body:
+        return str(body["detail"])
+    return response.text
+
+
+_shared_gateway: Optional[Gateway] = None
+
+
+def get_gateway() -> Gateway:
+    """Get the process-wide gateway for GATEWAY_NODES; empty when gateway mode is off"""
+    global _shared_gateway
+    if _shared_gateway is None:
+        _shared_gateway = Gateway.from_env()
+    return _shared_gateway
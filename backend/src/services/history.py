@@ -0,0 +1,293 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+from env import HISTORY_DB, HISTORY_FLUSH_S, IR_CODE_DIR
+from services.request_log import start_background
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = ("hour", "day")
+
+# Pending commands that trigger a write without waiting for HISTORY_FLUSH_S
+MAX_PENDING = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    device TEXT NOT NULL,
+    action TEXT NOT NULL,
+    mode TEXT
+);
+CREATE INDEX IF NOT EXISTS events_device_ts ON events (device, ts);
+CREATE INDEX IF NOT EXISTS events_ts ON events (ts);
+CREATE TABLE IF NOT EXISTS rollups (
+    device TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    start REAL NOT NULL,
+    seconds REAL NOT NULL DEFAULT 0,
+    switches INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (device, bucket, start, mode)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS current (
+    device TEXT PRIMARY KEY,
+    mode TEXT NOT NULL,
+    since REAL NOT NULL
+);
+"""
+
+
+class HistoryError(ValueError):
+    """Raised when a history query has an invalid range or bucket"""
+    pass
+
+
+def bucket_start(ts: float, bucket: str) -> float:
+    """Start of the local hour or day containing `ts`"""
+    local = time.localtime(ts)
+    hour = local.tm_hour if bucket == "hour" else 0
+    return time.mktime((local.tm_year, local.tm_mon, local.tm_mday, hour, 0, 0, 0, 0, -1))
+
+
+def next_bucket(start: float, bucket: str) -> float:
+    """Start of the bucket after the one starting at `start`, DST changes included"""
+    if bucket == "hour":
+        return start + 3600
+    local = time.localtime(start)
+    return time.mktime((local.tm_year, local.tm_mon, local.tm_mday + 1, 0, 0, 0, 0, 0, -1))
+
+
+def split_interval(since: float, until: float, bucket: str) -> Iterator[tuple[float, float]]:
+    """(bucket start, seconds) for every bucket the interval [since, until) overlaps"""
+    start = bucket_start(since, bucket)
+    while start < until:
+        end = next_bucket(start, bucket)
+        seconds = min(end, until) - max(start, since)
+        if seconds > 0:
+            yield start, seconds
+        start = end
+
+
+class HistoryStore:
+    """
+    Every command sent to the light and the AC, with pre-aggregated mode time
+
+    Commands are buffered in memory and written by a write-behind task in one
+    transaction per batch, from a worker thread, to SQLite in WAL mode. In
+    the same transaction each mode change closes the device's previous mode
+    interval and adds its seconds to hourly and daily rollups. So a usage
+    query reads a handful of rollup rows, plus the still-open interval,
+    instead of scanning raw events.
+    """
+
+    def __init__(self, db_file: str, flush_interval: float = HISTORY_FLUSH_S, clock=time.time):
+        self.db_file = Path(db_file)
+        self.flush_interval = flush_interval
+        self.clock = clock
+        self._pending: list[tuple[float, str, str, Optional[str]]] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        # Set when the buffer fills, so the write-behind task writes without waiting
+        self._wake: Optional[asyncio.Event] = None
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._db is None:
+            self.db_file.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(self.db_file, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            # WAL keeps the database consistent; a crash may only lose the last batch
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(SCHEMA)
+            self._db = db
+        return self._db
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    # ========== RECORDING ==========
+
+    def record(self, device: str, action: str, mode: Optional[str] = None, at: Optional[float] = None) -> None:
+        """
+        Queue a command; `mode` is the mode the device is in afterwards, None if unchanged
+
+        Without a running event loop the command is written at once.
+        """
+        self._pending.append((at if at is not None else self.clock(), device, action, mode))
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.save()
+            return
+        if self._flush_task is None or self._flush_task.done():
+            self._wake = asyncio.Event()
+            self._flush_task = start_background(loop, self._write_behind(self._wake))
+        elif len(self._pending) >= MAX_PENDING:
+            self._wake.set()
+
+    async def flush(self) -> None:
+        """Wait until every recorded command is in the database"""
+        await self._drain()
+
+    async def _write_behind(self, wake: asyncio.Event) -> None:
+        # A single task writes at most one batch per interval; a full buffer ends the wait early
+        while True:
+            try:
+                await asyncio.wait_for(wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            wake.clear()
+            if not await self._save_batch() or not self._pending:
+                return
+
+    async def _drain(self) -> None:
+        while self._pending and await self._save_batch():
+            pass
+
+    async def _save_batch(self) -> bool:
+        try:
+            await asyncio.to_thread(self.save)
+        except sqlite3.Error as e:
+            logger.error(f"Failed to write command history {self.db_file}: {e}")
+            return False
+        return True
+
+    def save(self) -> None:
+        """Write pending commands synchronously"""
+        with self._lock:
+            # Taken under the lock, so batches reach the database in the order they were recorded
+            batch, self._pending = self._pending, []
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch: list[tuple[float, str, str, Optional[str]]]) -> None:
+        db = self._connection()
+        current = {device: (mode, since) for device, mode, since in db.execute("SELECT * FROM current")}
+        rollups: Dict[tuple[str, str, str, float], list] = {}
+        for ts, device, action, mode in batch:
+            previous = current.get(device)
+            if mode is None or (previous is not None and previous[0] == mode):
+                continue
+            if previous is not None:
+                for bucket in BUCKETS:
+                    for start, seconds in split_interval(previous[1], ts, bucket):
+                        rollups.setdefault((device, previous[0], bucket, start), [0.0, 0])[0] += seconds
+            for bucket in BUCKETS:
+                rollups.setdefault((device, mode, bucket, bucket_start(ts, bucket)), [0.0, 0])[1] += 1
+            current[device] = (mode, ts)
+
+        db.execute("BEGIN")
+        try:
+            db.executemany("INSERT INTO events (ts, device, action, mode) VALUES (?, ?, ?, ?)", batch)
+            db.executemany(
+                "INSERT INTO rollups (device, mode, bucket, start, seconds, switches) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (device, bucket, start, mode) DO UPDATE SET "
+                "seconds = seconds + excluded.seconds, switches = switches + excluded.switches",
+                [(*key, seconds, switches) for key, (seconds, switches) in rollups.items()]
+            )
+            db.executemany(
+                "INSERT OR REPLACE INTO current (device, mode, since) VALUES (?, ?, ?)",
+                [(device, mode, since) for device, (mode, since) in current.items()]
+            )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    # ========== QUERIES ==========
+
+    async def get_events(self, device: Optional[str], start: float, end: float, limit: int) -> list[Dict[str, Any]]:
+        """
+        Raw commands in [start, end), newest first
+
+        Raises:
+            HistoryError: If the range is empty
+        """
+        if end <= start:
+            raise HistoryError("end must be after start")
+        await self.flush()
+        query = "SELECT ts, device, action, mode FROM events WHERE ts >= ? AND ts < ?"
+        params: list = [start, end]
+        if device is not None:
+            query += " AND device = ?"
+            params.append(device)
+        query += " ORDER BY ts DESC LIMIT ?"
+        params.append(limit)
+        rows = await asyncio.to_thread(self._read, query, params)
+        return [{"time": ts, "device": device, "action": action, "mode": mode} for ts, device, action, mode in rows]
+
+    async def get_usage(self, device: Optional[str], start: float, end: float, bucket: str = "day") -> Dict[str, Any]:
+        """
+        Seconds spent in each mode per hour or day, from the rollups
+
+        The range is widened to whole buckets. The mode a device is in right
+        now counts up to the current time.
+
+        Raises:
+            HistoryError: If the bucket is unknown or the range is empty
+        """
+        if bucket not in BUCKETS:
+            raise HistoryError(f"Unknown bucket '{bucket}', expected one of: {', '.join(BUCKETS)}")
+        if end <= start:
+            raise HistoryError("end must be after start")
+        await self.flush()
+        first = bucket_start(start, bucket)
+        filter_device = " AND device = ?" if device is not None else ""
+        params = [bucket, first, end] + ([device] if device is not None else [])
+        rows, open_intervals = await asyncio.to_thread(
+            self._read_usage,
+            "SELECT device, mode, start, seconds, switches FROM rollups "
+            "WHERE bucket = ? AND start >= ? AND start < ?" + filter_device,
+            params,
+            "SELECT device, mode, since FROM current" + (" WHERE device = ?" if device is not None else ""),
+            [device] if device is not None else []
+        )
+
+        usage: Dict[tuple[str, str, float], list] = {
+            (row_device, mode, row_start): [seconds, switches]
+            for row_device, mode, row_start, seconds, switches in rows
+        }
+        until = min(end, self.clock())
+        for row_device, mode, since in open_intervals:
+            for row_start, seconds in split_interval(max(since, first), until, bucket):
+                usage.setdefault((row_device, mode, row_start), [0.0, 0])[0] += seconds
+
+        totals: Dict[str, Dict[str, float]] = {}
+        for (row_device, mode, _), (seconds, _) in usage.items():
+            device_totals = totals.setdefault(row_device, {})
+            device_totals[mode] = round(device_totals.get(mode, 0.0) + seconds, 3)
+        rows = [
+            {"device": row_device, "mode": mode, "start": row_start, "seconds": round(seconds, 3), "switches": switches}
+            for (row_device, mode, row_start), (seconds, switches) in usage.items()
+        ]
+        rows.sort(key=lambda row: (row["start"], row["device"], row["mode"]))
+        return {"bucket": bucket, "start": first, "end": end, "rows": rows, "totals": totals}
+
+    def _read(self, query: str, params: list) -> list[tuple]:
+        with self._lock:
+            return self._connection().execute(query, params).fetchall()
+
+    def _read_usage(self, rollup_query: str, rollup_params: list,
+                    current_query: str, current_params: list) -> tuple[list[tuple], list[tuple]]:
+        with self._lock:
+            db = self._connection()
+            return db.execute(rollup_query, rollup_params).fetchall(), db.execute(current_query, current_params).fetchall()
+
+
+_shared_store: Optional[HistoryStore] = None
+
+
+def get_history_store() -> HistoryStore:
+    """Get the process-wide command history"""
+    global _shared_store
+    if _shared_store is None:
+        _shared_store = HistoryStore(HISTORY_DB or str(Path(IR_CODE_DIR) / "history.db"))
+    return _shared_store
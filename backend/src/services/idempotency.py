@@ -0,0 +1,203 @@
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Optional
+from env import IDEMPOTENCY_MAX_ENTRIES, IDEMPOTENCY_TTL_S
+from services.metrics import REGISTRY
+
+IDEMPOTENCY_HEADER = b"idempotency-key"
+REPLAYED_HEADER = (b"idempotent-replayed", b"true")
+
+# Methods that send IR codes or change stored data
+COMMAND_METHODS = frozenset(("POST", "PUT", "PATCH", "DELETE"))
+
+IDEMPOTENT_REQUESTS = REGISTRY.counter(
+    "idempotent_requests_total", "Requests with an Idempotency-Key by outcome", ("outcome",)
+)
+
+
+class CachedResponse:
+    """Status, headers and body of a completed request"""
+
+    __slots__ = ("status", "headers", "body")
+
+    def __init__(self, status: int, headers: list, body: bytes):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+
+class IdempotencyEntry:
+    """A keyed request, in flight until `response` is set"""
+
+    __slots__ = ("fingerprint", "done", "response", "expires_at")
+
+    def __init__(self, fingerprint: str, done: asyncio.Future):
+        self.fingerprint = fingerprint
+        self.done = done
+        self.response: Optional[CachedResponse] = None
+        self.expires_at = float("inf")
+
+
+class IdempotencyCache:
+    """
+    Bounded TTL/LRU cache of responses keyed by Idempotency-Key
+
+    Entries expire `ttl` seconds after their request completes. When the
+    cache is full the least recently used entry is dropped; a request still
+    in flight keeps running and only loses the ability to be joined.
+    """
+
+    def __init__(self, ttl: float = IDEMPOTENCY_TTL_S, max_entries: int = IDEMPOTENCY_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, IdempotencyEntry]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[IdempotencyEntry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.monotonic() or (
+            entry.response is None and entry.done.get_loop() is not asyncio.get_running_loop()
+        ):
+            # Expired, or abandoned by an event loop that has since closed
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def begin(self, key: str, fingerprint: str) -> IdempotencyEntry:
+        entry = IdempotencyEntry(fingerprint, asyncio.get_running_loop().create_future())
+        self._entries[key] = entry
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    def complete(self, key: str, entry: IdempotencyEntry, response: Optional[CachedResponse],
+                 store: bool = True) -> None:
+        """
+        Hand the response to the requests that joined the entry
+
+        It is kept for later repeats when `store` is set; otherwise, or when
+        the request raised and there is no response, the key is forgotten.
+        """
+        if response is None or not store:
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+        else:
+            entry.response = response
+            entry.expires_at = time.monotonic() + self.ttl
+        if not entry.done.done():
+            entry.done.set_result(response)
+
+
+class IdempotencyMiddleware:
+    """
+    ASGI middleware that answers repeated command requests from the cache
+
+    A POST/PUT/PATCH/DELETE carrying an Idempotency-Key header runs once.
+    Repeats get the stored response, marked with `Idempotent-Replayed: true`,
+    and a repeat that arrives while the first request is still running waits
+    for it instead of transmitting again. Only 2xx responses are stored: after
+    a 429 or a failed transmit the key is released, so a later retry runs
+    again, while the repeats that were waiting get the same error. When the
+    request raised, one of the waiters runs it again and the others join it.
+    Reusing a key for a different method, path or body is rejected with 422.
+    """
+
+    def __init__(self, app, cache: Optional[IdempotencyCache] = None):
+        self.app = app
+        self.cache = cache if cache is not None else IdempotencyCache()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in COMMAND_METHODS:
+            await self.app(scope, receive, send)
+            return
+        key = next((value for name, value in scope["headers"] if name == IDEMPOTENCY_HEADER), None)
+        if key is None:
+            await self.app(scope, receive, send)
+            return
+        key = key.decode("latin-1")
+
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        digest = hashlib.sha256(body).hexdigest()
+        fingerprint = f"{scope['method']} {scope['path']}?{scope['query_string'].decode('latin-1')} {digest}"
+
+        # The first waiter to find a raised request's key released runs it again
+        while (entry := self.cache.get(key)) is not None:
+            if entry.fingerprint != fingerprint:
+                IDEMPOTENT_REQUESTS.inc("mismatch")
+                await self._send_error(send, 422, "Idempotency-Key was already used for a different request")
+                return
+            if entry.response is None:
+                IDEMPOTENT_REQUESTS.inc("joined")
+                response = await asyncio.shield(entry.done)
+            else:
+                IDEMPOTENT_REQUESTS.inc("replayed")
+                response = entry.response
+            if response is not None:
+                await self._replay(send, response)
+                return
+
+        IDEMPOTENT_REQUESTS.inc("executed")
+        entry = self.cache.begin(key, fingerprint)
+        await self._run(scope, body, send, key, entry)
+
+    async def _run(self, scope, body: bytes, send, key: str, entry: IdempotencyEntry) -> None:
+        status = 500
+        headers = []
+        chunks = []
+        delivered = False
+
+        async def replay_receive():
+            nonlocal delivered
+            if not delivered:
+                delivered = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            # Nothing more to read; wait like a client that stays connected
+            await asyncio.Event().wait()
+
+        async def capture_send(message):
+            nonlocal status, headers
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, capture_send)
+        except BaseException:
+            self.cache.complete(key, entry, None)
+            raise
+        self.cache.complete(key, entry, CachedResponse(status, headers, b"".join(chunks)), store=200 <= status < 300)
+
+    @staticmethod
+    async def _replay(send, response: CachedResponse) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": response.status,
+            "headers": response.headers + [REPLAYED_HEADER]
+        })
+        await send({"type": "http.response.body", "body": response.body})
+
+    @staticmethod
+    async def _send_error(send, status: int, detail: str) -> None:
+        body = json.dumps({"detail": detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,297 @@
+"""
+Compact binary IR code library
+
+Layout (little endian):
+
+    header   magic "HCIR", version u16, reserved u16, count u32,
+             index offset u32, strings offset u32, data offset u32
+    index    `count` fixed-size entries sorted by (device, action):
+             key offset u32, device length u16, action length u16,
+             carrier u32, reserved u8, repeat u8, reserved u16,
+             pulse count u32, data offset u32, data length u32
+    strings  UTF-8 device and action names, back to back
+    data     per code, every duration as a zigzag LEB128 varint of its
+             delta from the previous duration of the same kind
+             (pulse or space)
+
+The file is memory-mapped and looked up by binary search over the index, so
+only the pages of codes that are actually used become resident.
+
+Convert existing mode2 recordings with:
+    python -m services.ir_library build codes.hcir --device light=DIR:38000 --device ac=DIR
+"""
+
+import argparse
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional
+from services.transmitter import DEFAULT_CARRIER, parse_mode2
+
+MAGIC = b"HCIR"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIIII")
+ENTRY = struct.Struct("<IHHIBBHIII")
+
+# Decoded codes kept per open library
+DECODED_CACHE_SIZE = 64
+
+
+class IRLibraryError(Exception):
+    """Raised when a binary IR library is malformed"""
+    pass
+
+
+class LibraryCode:
+    """A code decoded from the binary library"""
+
+    __slots__ = ("device", "action", "pulses", "carrier", "repeat")
+
+    def __init__(self, device: str, action: str, pulses: array, carrier: int = DEFAULT_CARRIER, repeat: int = 1):
+        self.device = device
+        self.action = action
+        self.pulses = pulses
+        self.carrier = carrier
+        self.repeat = repeat
+
+
+def encode_pulses(pulses: Iterable[int]) -> bytes:
+    """Delta + zigzag + varint encode a pulse train"""
+    out = bytearray()
+    previous = [0, 0]
+    for index, value in enumerate(pulses):
+        kind = index & 1
+        delta = value - previous[kind]
+        previous[kind] = value
+        zigzag = (delta << 1) ^ (delta >> 63)
+        while zigzag >= 0x80:
+            out.append((zigzag & 0x7F) | 0x80)
+            zigzag >>= 7
+        out.append(zigzag)
+    return bytes(out)
+
+
+def decode_pulses(data, count: int, offset: int = 0) -> array:
+    """Decode `count` durations written by encode_pulses starting at `offset`"""
+    pulses = array("I")
+    previous = [0, 0]
+    position = offset
+    for index in range(count):
+        shift = 0
+        zigzag = 0
+        while True:
+            byte = data[position]
+            position += 1
+            zigzag |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                break
+            shift += 7
+        delta = (zigzag >> 1) ^ -(zigzag & 1)
+        kind = index & 1
+        previous[kind] += delta
+        pulses.append(previous[kind])
+    return pulses
+
+
+def write_library(path: str, codes: Iterable[LibraryCode]) -> int:
+    """
+    Write codes to a library file, replacing it atomically
+
+    Returns the number of codes written.
+    """
+    ordered = sorted(codes, key=lambda code: (code.device.encode(), code.action.encode()))
+    strings = bytearray()
+    data = bytearray()
+    entries = []
+    for code in ordered:
+        device = code.device.encode()
+        action = code.action.encode()
+        key_offset = len(strings)
+        strings += device + action
+        encoded = encode_pulses(code.pulses)
+        entries.append(ENTRY.pack(
+            key_offset, len(device), len(action), code.carrier, 0,
+            code.repeat, 0, len(code.pulses), len(data), len(encoded)
+        ))
+        data += encoded
+
+    index_offset = HEADER.size
+    strings_offset = index_offset + ENTRY.size * len(entries)
+    data_offset = strings_offset + len(strings)
+    header = HEADER.pack(MAGIC, VERSION, 0, len(entries), index_offset, strings_offset, data_offset)
+
+    target = Path(path)
+    fd, tmp_path = tempfile.mkstemp(dir=target.parent, prefix=".ir_library_")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(header)
+            for entry in entries:
+                f.write(entry)
+            f.write(strings)
+            f.write(data)
+        os.replace(tmp_path, target)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return len(entries)
+
+
+class IRCodeLibraryFile:
+    """Read-only, memory-mapped view of a binary IR library"""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self.mtime_ns = stat.st_mtime_ns
+            if stat.st_size < HEADER.size:
+                raise IRLibraryError(f"{path} is too short to be an IR library")
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._validate()
+        except BaseException:
+            self._map.close()
+            raise
+        self._decoded: "OrderedDict[tuple[str, str], LibraryCode]" = OrderedDict()
+
+    def _validate(self) -> None:
+        """
+        Check the header and every index entry against the file size
+
+        Raises:
+            IRLibraryError: If the file is foreign, truncated or points outside itself
+        """
+        magic, version, _, count, index_offset, strings_offset, data_offset = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise IRLibraryError(f"{self.path} is not an IR library")
+        if version != VERSION:
+            raise IRLibraryError(f"{self.path} has unsupported version {version}")
+        size = len(self._map)
+        if not (HEADER.size <= index_offset and index_offset + count * ENTRY.size <= strings_offset
+                <= data_offset <= size):
+            raise IRLibraryError(f"{self.path} is truncated or its header is corrupt")
+        strings_size = data_offset - strings_offset
+        data_size = size - data_offset
+        index = self._map[index_offset:index_offset + count * ENTRY.size]
+        for position, entry in enumerate(ENTRY.iter_unpack(index)):
+            key_offset, device_length, action_length, *_, entry_data_offset, data_length = entry
+            if (key_offset + device_length + action_length > strings_size
+                    or entry_data_offset + data_length > data_size):
+                raise IRLibraryError(f"{self.path} entry {position} points outside the file")
+        self.count = count
+        self._index_offset = index_offset
+        self._strings_offset = strings_offset
+        self._data_offset = data_offset
+
+    def close(self) -> None:
+        self._map.close()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _entry(self, position: int) -> tuple:
+        return ENTRY.unpack_from(self._map, self._index_offset + position * ENTRY.size)
+
+    def _key(self, entry: tuple) -> tuple[bytes, bytes]:
+        start = self._strings_offset + entry[0]
+        middle = start + entry[1]
+        return self._map[start:middle], self._map[middle:middle + entry[2]]
+
+    def _decode(self, entry: tuple, device: str, action: str) -> LibraryCode:
+        _, _, _, carrier, _, repeat, _, count, offset, length = entry
+        start = self._data_offset + offset
+        try:
+            # Bounded by the entry's own bytes, so bad data cannot run into the next code
+            pulses = decode_pulses(self._map[start:start + length], count)
+        except IndexError:
+            raise IRLibraryError(f"{self.path} has corrupt data for {device}/{action}")
+        return LibraryCode(device, action, pulses, carrier, repeat)
+
+    def get(self, device: str, action: str) -> LibraryCode:
+        """
+        Look a code up by binary search over the index
+
+        Raises:
+            KeyError: If the library has no such code
+            IRLibraryError: If the code's data is corrupt
+        """
+        cache_key = (device, action)
+        code = self._decoded.get(cache_key)
+        if code is not None:
+            self._decoded.move_to_end(cache_key)
+            return code
+
+        target = (device.encode(), action.encode())
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            entry = self._entry(middle)
+            key = self._key(entry)
+            if key < target:
+                low = middle + 1
+            elif key > target:
+                high = middle
+            else:
+                code = self._decode(entry, device, action)
+                self._decoded[cache_key] = code
+                if len(self._decoded) > DECODED_CACHE_SIZE:
+                    self._decoded.popitem(last=False)
+                return code
+        raise KeyError(cache_key)
+
+    def __iter__(self) -> Iterator[LibraryCode]:
+        for position in range(self.count):
+            entry = self._entry(position)
+            device, action = self._key(entry)
+            yield self._decode(entry, device.decode(), action.decode())
+
+
+def import_mode2_directory(directory: str, device: str, carrier: int = DEFAULT_CARRIER,
+                           prefix: Optional[str] = None) -> list[LibraryCode]:
+    """Read every `{prefix}_{action}.txt` recording of a device"""
+    file_prefix = f"{prefix or device}_"
+    codes = []
+    for path in sorted(Path(directory).glob(f"{file_prefix}*.txt")):
+        pulses = parse_mode2(path.read_text())
+        if pulses:
+            codes.append(LibraryCode(device, path.stem[len(file_prefix):], pulses, carrier))
+    return codes
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Build or inspect a binary IR code library")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="import mode2 recordings into a library file")
+    build.add_argument("output")
+    build.add_argument(
+        "--device", action="append", required=True, metavar="NAME=DIR[:CARRIER]",
+        help="device name, directory with NAME_*.txt recordings and optional carrier in Hz"
+    )
+
+    show = commands.add_parser("list", help="list the codes in a library file")
+    show.add_argument("library")
+
+    args = parser.parse_args(argv)
+    if args.command == "build":
+        codes = []
+        for spec in args.device:
+            name, _, location = spec.partition("=")
+            directory, _, carrier = location.partition(":")
+            codes += import_mode2_directory(directory, name, int(carrier) if carrier else DEFAULT_CARRIER)
+        count = write_library(args.output, codes)
+        print(f"Wrote {count} codes to {args.output} ({os.path.getsize(args.output)} bytes)")
+    else:
+        library = IRCodeLibraryFile(args.library)
+        for code in library:
+            print(f"{code.device}\t{code.action}\t{code.carrier}\t{len(code.pulses)} durations")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,342 @@
+"""
+Pulse-distance IR protocols (NEC and AEHA)
+
+Both protocols send a leader, then every bit as one unit-long mark followed
+by a one-unit space (0) or a three-unit space (1), least significant bit of
+each byte first, and finish with a single trailing mark:
+
+    NEC   unit 562.5us, leader 16T mark + 8T space, 4 bytes
+    AEHA  unit ~425us (350-500), leader 8T mark + 4T space, any number of
+          bytes; air conditioners usually send several frames separated
+          by a long space
+
+The unit is measured from each recording, so decoding a capture and encoding
+it again reproduces its timing without the capture jitter.
+"""
+
+from array import array
+from statistics import median
+from typing import Dict, Iterable, Optional, Sequence
+
+# Spaces at least this long separate two frames of one transmission
+FRAME_SPACE_US = 8000
+
+# Default space between frames when encoding
+DEFAULT_FRAME_GAP_US = 20000
+
+# Allowed relative deviation of a duration from its nominal length
+DEFAULT_TOLERANCE = 0.35
+
+
+class ProtocolError(ValueError):
+    """Raised when a pulse train does not match a known protocol"""
+    pass
+
+
+class Protocol:
+    """Timing of a pulse-distance protocol, in units"""
+
+    __slots__ = ("name", "unit", "leader_mark", "leader_space", "byte_count", "carrier")
+
+    def __init__(self, name: str, unit: float, leader_mark: int, leader_space: int,
+                 byte_count: Optional[int] = None, carrier: int = 38000):
+        self.name = name
+        self.unit = unit
+        self.leader_mark = leader_mark
+        self.leader_space = leader_space
+        # None allows frames of any whole number of bytes
+        self.byte_count = byte_count
+        self.carrier = carrier
+
+
+NEC = Protocol("nec", 562.5, 16, 8, byte_count=4)
+AEHA = Protocol("aeha", 425, 8, 4)
+
+PROTOCOLS: Dict[str, Protocol] = {protocol.name: protocol for protocol in (NEC, AEHA)}
+
+
+class DecodedSignal:
+    """Protocol, payload bytes of every frame and the measured timing"""
+
+    __slots__ = ("protocol", "frames", "unit", "frame_gap")
+
+    def __init__(self, protocol: Protocol, frames: list[bytes], unit: Optional[float] = None,
+                 frame_gap: int = DEFAULT_FRAME_GAP_US):
+        self.protocol = protocol
+        self.frames = frames
+        self.unit = unit or protocol.unit
+        self.frame_gap = frame_gap
+
+    def with_frames(self, frames: list[bytes]) -> "DecodedSignal":
+        """Same protocol and timing with different payloads"""
+        return DecodedSignal(self.protocol, frames, self.unit, self.frame_gap)
+
+
+def _near(value: float, nominal: float, tolerance: float) -> bool:
+    return abs(value - nominal) <= nominal * tolerance
+
+
+def _split_frames(pulses: Sequence[int]) -> tuple[list[Sequence[int]], list[int]]:
+    frames = []
+    gaps = []
+    start = 0
+    for index in range(1, len(pulses), 2):
+        if pulses[index] >= FRAME_SPACE_US:
+            frames.append(pulses[start:index])
+            gaps.append(pulses[index])
+            start = index + 1
+    frames.append(pulses[start:])
+    return frames, gaps
+
+
+def _match_leader(frame: Sequence[int], tolerance: float) -> Protocol:
+    if len(frame) < 3:
+        raise ProtocolError("Frame is too short for a leader")
+    mark, space = frame[0], frame[1]
+    for protocol in PROTOCOLS.values():
+        # AEHA units vary between vendors, so only the leader ratio is fixed
+        ratio = protocol.leader_mark / protocol.leader_space
+        if protocol is AEHA:
+            unit = (mark + space) / (protocol.leader_mark + protocol.leader_space)
+            if not 300 <= unit <= 550:
+                continue
+        elif not _near(mark, protocol.leader_mark * protocol.unit, tolerance):
+            continue
+        if _near(mark / space, ratio, tolerance):
+            return protocol
+    raise ProtocolError(f"Unknown leader {mark}us/{space}us")
+
+
+def _decode_frame(frame: Sequence[int], tolerance: float) -> tuple[Protocol, bytes, float]:
+    protocol = _match_leader(frame, tolerance)
+    body = frame[2:]
+    if len(body) % 2 == 0:
+        raise ProtocolError(f"{protocol.name} frame has no trailing mark")
+
+    marks = body[::2]
+    unit = median(marks)
+    bits = []
+    for mark, space in zip(body[:-1:2], body[1::2]):
+        if not _near(mark, unit, tolerance):
+            raise ProtocolError(f"{protocol.name} mark of {mark}us does not match unit {unit}us")
+        if _near(space, unit, tolerance):
+            bits.append(0)
+        elif _near(space, 3 * unit, tolerance):
+            bits.append(1)
+        else:
+            raise ProtocolError(f"{protocol.name} space of {space}us is neither 1T nor 3T")
+
+    if not bits or len(bits) % 8:
+        raise ProtocolError(f"{protocol.name} frame has {len(bits)} bits, not whole bytes")
+    payload = bytes(
+        sum(bit << position for position, bit in enumerate(bits[start:start + 8]))
+        for start in range(0, len(bits), 8)
+    )
+    if protocol.byte_count is not None and len(payload) != protocol.byte_count:
+        raise ProtocolError(f"{protocol.name} frame has {len(payload)} bytes, expected {protocol.byte_count}")
+    return protocol, payload, unit
+
+
+def decode(pulses: Sequence[int], tolerance: float = DEFAULT_TOLERANCE) -> DecodedSignal:
+    """
+    Decode a recorded pulse train into protocol frames
+
+    Raises:
+        ProtocolError: If any frame does not match NEC or AEHA, or the frames
+            use different protocols
+    """
+    frames, gaps = _split_frames(pulses)
+    decoded = [_decode_frame(frame, tolerance) for frame in frames]
+    protocol = decoded[0][0]
+    if any(item[0] is not protocol for item in decoded):
+        raise ProtocolError("Frames of one recording use different protocols")
+    unit = median(item[2] for item in decoded)
+    frame_gap = int(median(gaps)) if gaps else DEFAULT_FRAME_GAP_US
+    return DecodedSignal(protocol, [item[1] for item in decoded], unit, frame_gap)
+
+
+def _encode_frame(out: array, protocol: Protocol, payload: bytes, unit: float) -> None:
+    one = round(unit)
+    three = round(3 * unit)
+    out.append(round(protocol.leader_mark * unit))
+    out.append(round(protocol.leader_space * unit))
+    for byte in payload:
+        for position in range(8):
+            out.append(one)
+            out.append(three if byte >> position & 1 else one)
+    out.append(one)
+
+
+def encode(signal: DecodedSignal) -> array:
+    """
+    Encode frames into a pulse train starting and ending with a mark
+
+    Raises:
+        ProtocolError: If a frame does not have the protocol's byte count
+    """
+    protocol = signal.protocol
+    out = array("I")
+    for index, payload in enumerate(signal.frames):
+        if protocol.byte_count is not None and len(payload) != protocol.byte_count:
+            raise ProtocolError(f"{protocol.name} frames must have {protocol.byte_count} bytes")
+        if index:
+            out.append(signal.frame_gap)
+        _encode_frame(out, protocol, payload, signal.unit)
+    return out
+
+
+def nec_frame(address: int, command: int) -> bytes:
+    """Standard NEC payload: address, inverted address, command, inverted command"""
+    return bytes((address, address ^ 0xFF, command, command ^ 0xFF))
+
+
+# ========== FRAME LAYOUT ==========
+
+class FieldSpec:
+    """Bit field inside a frame payload"""
+
+    __slots__ = ("name", "byte", "bit", "width", "base", "values")
+
+    def __init__(self, name: str, byte: int, bit: int = 0, width: int = 8, base: int = 0,
+                 values: Optional[Dict[str, int]] = None):
+        self.name = name
+        self.byte = byte
+        self.bit = bit
+        self.width = width
+        # The raw field holds `value - base`
+        self.base = base
+        # Named values such as modes, raw value by name
+        self.values = values
+
+    def _span(self) -> range:
+        bits = self.bit + self.width
+        return range(self.byte, self.byte + (bits + 7) // 8)
+
+    def read(self, payload: bytes):
+        raw = int.from_bytes(bytes(payload[index] for index in self._span()), "little")
+        raw = raw >> self.bit & ((1 << self.width) - 1)
+        if self.values is not None:
+            for name, value in self.values.items():
+                if value == raw:
+                    return name
+            return None
+        return raw + self.base
+
+    def write(self, payload: bytearray, value) -> None:
+        if self.values is not None:
+            try:
+                raw = self.values[value]
+            except KeyError:
+                raise ValueError(f"Field '{self.name}' has no value '{value}'")
+        else:
+            raw = int(value) - self.base
+        mask = (1 << self.width) - 1
+        if not 0 <= raw <= mask:
+            raise ValueError(f"Value {value} does not fit field '{self.name}'")
+        span = self._span()
+        word = int.from_bytes(bytes(payload[index] for index in span), "little")
+        word = word & ~(mask << self.bit) | raw << self.bit
+        payload[span.start:span.stop] = word.to_bytes(len(span), "little")
+
+
+class FrameLayout:
+    """
+    Named fields and checksum of one frame of a protocol signal
+
+    Built from the `protocol` entry of the device manifest:
+
+        {
+          "name": "aeha",
+          "template": "aircon_on",
+          "frame": -1,
+          "fields": {
+            "power": {"byte": 5, "bit": 5, "width": 1, "values": {"off": 0, "on": 1}},
+            "mode": {"byte": 6, "bit": 3, "width": 3, "values": {"aircon_on": 3, "heater_on": 1, "off": 3}},
+            "temperature": {"byte": 7, "width": 4, "base": 16},
+            "timer_hours": {"byte": 9, "width": 4}
+          },
+          "checksum": {"type": "sum", "byte": -1, "start": 0}
+        }
+
+    The template recording provides every byte the layout does not describe.
+    """
+
+    __slots__ = ("protocol", "template", "frame", "fields", "checksum")
+
+    CHECKSUMS = ("sum", "xor")
+
+    def __init__(self, protocol: Protocol, template: str, fields: Iterable[FieldSpec],
+                 frame: int = -1, checksum: Optional[Dict[str, any]] = None):
+        self.protocol = protocol
+        self.template = template
+        self.frame = frame
+        self.fields = {field.name: field for field in fields}
+        if checksum is not None and checksum.get("type") not in self.CHECKSUMS:
+            raise ValueError(f"Unknown checksum type {checksum.get('type')}")
+        self.checksum = checksum
+
+    @classmethod
+    def from_spec(cls, spec: Dict[str, any]) -> "FrameLayout":
+        """
+        Build a layout from its manifest entry
+
+        Raises:
+            ValueError: If the protocol, checksum or a field is invalid
+        """
+        try:
+            protocol = PROTOCOLS[spec.get("name", "aeha")]
+        except KeyError:
+            raise ValueError(f"Unknown IR protocol {spec.get('name')}")
+        if "template" not in spec:
+            raise ValueError("Protocol layout needs a template code")
+        try:
+            fields = [FieldSpec(name, **field) for name, field in spec.get("fields", {}).items()]
+        except TypeError as e:
+            raise ValueError(f"Invalid protocol field: {e}")
+        return cls(protocol, spec["template"], fields, spec.get("frame", -1), spec.get("checksum"))
+
+    def _checksum(self, payload: bytes) -> tuple[int, int]:
+        position = self.checksum.get("byte", -1) % len(payload)
+        start = self.checksum.get("start", 0)
+        end = self.checksum.get("end", position)
+        value = 0
+        for byte in payload[start:end]:
+            value = value ^ byte if self.checksum["type"] == "xor" else (value + byte) & 0xFF
+        return position, value
+
+    def read(self, signal: DecodedSignal) -> Dict[str, any]:
+        """
+        Read every field of a decoded signal
+
+        Raises:
+            ProtocolError: If the signal uses another protocol or its checksum is wrong
+        """
+        if signal.protocol is not self.protocol:
+            raise ProtocolError(f"Expected {self.protocol.name}, got {signal.protocol.name}")
+        payload = signal.frames[self.frame]
+        if self.checksum is not None:
+            position, value = self._checksum(payload)
+            if payload[position] != value:
+                raise ProtocolError(f"Checksum mismatch: {payload[position]:#04x} != {value:#04x}")
+        return {name: field.read(payload) for name, field in self.fields.items()}
+
+    def build(self, template: DecodedSignal, **values) -> DecodedSignal:
+        """
+        Write field values into a copy of the template signal
+
+        Raises:
+            ValueError: If a field is unknown or a value does not fit
+        """
+        payload = bytearray(template.frames[self.frame])
+        for name, value in values.items():
+            try:
+                field = self.fields[name]
+            except KeyError:
+                raise ValueError(f"Layout has no field '{name}'")
+            field.write(payload, value)
+        if self.checksum is not None:
+            position, value = self._checksum(payload)
+            payload[position] = value
+        frames = list(template.frames)
+        frames[self.frame] = bytes(payload)
+        return template.with_frames(frames)
@@ -0,0 +1,80 @@
+import hashlib
+from typing import Any, Callable, Hashable, Optional
+from fastapi import Request
+from fastapi.responses import Response
+from pydantic_core import to_json
+
+# Clients must revalidate, but a matching ETag costs them no body
+CACHE_CONTROL = "no-cache"
+
+
+def encode_json(content: Any) -> bytes:
+    """Compact JSON of dicts, lists, enums and pydantic models in one pass"""
+    return to_json(content)
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header names `etag` (weak comparison, as for GET)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+class FastJSONResponse(Response):
+    """
+    JSON response that skips FastAPI's jsonable_encoder pass
+
+    Content that is already bytes is sent as is; anything else is encoded
+    straight to bytes by pydantic-core. Command results are encoded this way
+    per request rather than cached: each carries its own queue wait, and
+    encoding the small dict costs under a microsecond.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return encode_json(content)
+
+
+class CachedJSON:
+    """
+    A response body encoded once and reused until its inputs change
+
+    `build` returns the content; `version` returns a value that changes
+    whenever the content would, e.g. the state store version. Without one the
+    body is built on first use and kept for good.
+    """
+
+    __slots__ = ("build", "version", "body", "etag", "_key")
+
+    def __init__(self, build: Callable[[], Any], version: Optional[Callable[[], Hashable]] = None):
+        self.build = build
+        self.version = version
+        self.body: Optional[bytes] = None
+        self.etag = ""
+        self._key = None
+
+    def get(self) -> tuple[bytes, str]:
+        """Current body and its ETag"""
+        key = self.version() if self.version is not None else None
+        if self.body is None or key != self._key:
+            self.body = encode_json(self.build())
+            self.etag = make_etag(self.body)
+            self._key = key
+        return self.body, self.etag
+
+    def response(self, request: Request) -> Response:
+        """The body, or an empty 304 when the client already has this version"""
+        body, etag = self.get()
+        headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        return FastJSONResponse(body, headers=headers)
@@ -0,0 +1,326 @@
+import asyncio
+import fcntl
+import logging
+import os
+import select
+import stat
+import tempfile
+import time
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Sequence
+
+import numpy as np
+
+from env import LEARN_CAPTURES, LEARN_TIMEOUT_S, RECEIVER_DEVICE
+from services.transmitter import _mode2_tokens, format_mode2
+
+logger = logging.getLogger(__name__)
+
+# _IOW('i', 0x12, __u32) and LIRC_MODE_MODE2 from <linux/lirc.h>
+LIRC_SET_REC_MODE = 0x40046912
+LIRC_MODE_MODE2 = 0x00000004
+
+# Packet types in the top byte of every LIRC mode2 value
+LIRC_MODE2_KINDS = {0x00: "space", 0x01: "pulse", 0x03: "timeout", 0x04: "overflow"}
+LIRC_VALUE_MASK = 0x00FFFFFF
+
+# Silence that ends one capture; longer than the gap between AC frames
+CAPTURE_GAP_US = 80000
+
+# Captures with fewer durations are stray noise
+MIN_EDGES = 7
+
+# Captures that must agree before a code is accepted
+MIN_CAPTURES = 2
+
+# Allowed relative deviation of a capture from the median capture
+OUTLIER_TOLERANCE = 0.3
+
+
+class LearnError(Exception):
+    """Raised when the captures cannot be turned into a clean code"""
+    pass
+
+
+class LearnTimeoutError(LearnError):
+    """Raised when no IR signal arrives before the timeout"""
+    pass
+
+
+class LearnBusyError(LearnError):
+    """Raised when another learn request is using the receiver"""
+    pass
+
+
+class ReceiverLock:
+    """
+    Turns on the one IR receiver, shared by learning and loopback verification
+
+    Both read RECEIVER_DEVICE, so a capture running for one would take the
+    other's frames. `learning` is set while a learn request holds the lock,
+    which can take seconds rather than the airtime of one frame.
+    """
+
+    __slots__ = ("_lock", "_loop", "learning")
+
+    def __init__(self):
+        self._lock: Optional[asyncio.Lock] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.learning = False
+
+    def lock(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Locks belong to the loop that first waits on them
+            self._lock = asyncio.Lock()
+            self._loop = loop
+        return self._lock
+
+
+_shared_receiver_lock = ReceiverLock()
+
+
+def get_receiver_lock() -> ReceiverLock:
+    """Get the process-wide receiver lock"""
+    return _shared_receiver_lock
+
+
+# ========== STREAMS ==========
+
+def mode2_text_events(lines: Iterable[str]) -> Iterator[tuple[str, int]]:
+    """Stream (kind, duration) events from `ir-ctl -r --mode2` style text"""
+    for line in lines:
+        parts = line.split()
+        if parts and parts[0] == "timeout":
+            yield "timeout", int(parts[1]) if len(parts) > 1 else 0
+            continue
+        yield from _mode2_tokens(line)
+
+
+def lirc_events(fd: int, deadline: float) -> Iterator[tuple[str, int]]:
+    """
+    Stream (kind, duration) events from a LIRC receiver in mode2
+
+    Stops quietly at the deadline (time.monotonic()).
+    """
+    pending = b""
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        ready, _, _ = select.select([fd], [], [], remaining)
+        if not ready:
+            return
+        data = pending + os.read(fd, 4096)
+        usable = len(data) - len(data) % 4
+        pending = data[usable:]
+        for packet in array("I", data[:usable]):
+            kind = LIRC_MODE2_KINDS.get(packet >> 24)
+            if kind is not None:
+                yield kind, packet & LIRC_VALUE_MASK
+
+
+def split_captures(events: Iterable[tuple[str, int]], gap_us: int = CAPTURE_GAP_US,
+                   min_edges: int = MIN_EDGES) -> Iterator[array]:
+    """
+    Group a stream of events into captures, one per button press
+
+    A timeout, an overflow or a space of at least `gap_us` ends a capture.
+    Leading and trailing silence is trimmed and captures shorter than
+    `min_edges` durations are dropped as noise.
+    """
+    current = array("I")
+    last_is_pulse = None
+    for kind, value in events:
+        if kind in ("timeout", "overflow") or (kind == "space" and value >= gap_us):
+            if last_is_pulse is False:
+                current.pop()
+            if kind != "overflow" and len(current) >= min_edges:
+                yield current
+            current = array("I")
+            last_is_pulse = None
+            continue
+        is_pulse = kind == "pulse"
+        if last_is_pulse is None and not is_pulse:
+            continue
+        if is_pulse == last_is_pulse:
+            current[-1] += value
+        else:
+            current.append(value)
+            last_is_pulse = is_pulse
+    if last_is_pulse is False:
+        current.pop()
+    if len(current) >= min_edges:
+        yield current
+
+
+# ========== CLEANUP ==========
+
+def align_and_average(captures: Sequence[Sequence[int]], tolerance: float = OUTLIER_TOLERANCE,
+                      min_captures: int = MIN_CAPTURES) -> Dict[str, any]:
+    """
+    Align captures of the same button and average them into one pulse train
+
+    The most common capture length is taken as the true edge count and the
+    median of those captures as the reference. Longer captures are aligned by
+    sliding them over the reference (pulse positions only) and keeping the
+    best-matching window, which drops noise before or after the signal.
+    Captures whose worst duration deviates from the per-edge median by more
+    than `tolerance` are rejected as outliers and the rest are averaged.
+
+    Returns the averaged pulses with the number of captures used and rejected.
+
+    Raises:
+        LearnError: If fewer than `min_captures` captures agree
+    """
+    arrays = [np.asarray(capture, dtype=np.float64) for capture in captures]
+    if len(arrays) < min_captures:
+        raise LearnError(f"Need at least {min_captures} captures, got {len(arrays)}")
+
+    lengths, counts = np.unique([len(capture) for capture in arrays], return_counts=True)
+    length = int(lengths[counts == counts.max()].max())
+    reference = np.median(np.stack([capture for capture in arrays if len(capture) == length]), axis=0)
+
+    aligned = []
+    for capture in arrays:
+        if len(capture) < length:
+            continue
+        windows = np.lib.stride_tricks.sliding_window_view(capture, length)[::2]
+        errors = (np.abs(windows - reference) / reference).mean(axis=1)
+        aligned.append(windows[errors.argmin()])
+    if len(aligned) < min_captures:
+        raise LearnError(f"Only {len(aligned)} of {len(arrays)} captures could be aligned")
+
+    stack = np.stack(aligned)
+    median = np.median(stack, axis=0)
+    keep = (np.abs(stack - median) / median).max(axis=1) <= tolerance
+    if keep.sum() < min_captures:
+        raise LearnError(f"Only {int(keep.sum())} of {len(arrays)} captures agree")
+
+    averaged = np.rint(stack[keep].mean(axis=0)).astype(np.uint32)
+    return {
+        "pulses": array("I", averaged.tolist()),
+        "used": int(keep.sum()),
+        "rejected": len(arrays) - int(keep.sum())
+    }
+
+
+# ========== SERVICE ==========
+
+class LearnService:
+    """
+    Records new IR codes from the receiver into the code libraries
+
+    RECEIVER_DEVICE is normally a LIRC character device. A regular file is
+    replayed as mode2 text instead, which is how the pipeline is tested.
+    """
+
+    def __init__(self, registry, receiver_device: Optional[str] = RECEIVER_DEVICE,
+                 captures: int = LEARN_CAPTURES, timeout: float = LEARN_TIMEOUT_S):
+        self.registry = registry
+        self.receiver_device = receiver_device
+        self.captures = captures
+        self.timeout = timeout
+        self._busy = False
+
+    def _events(self, deadline: float) -> Iterator[tuple[str, int]]:
+        if not self.receiver_device:
+            raise LearnError("RECEIVER_DEVICE environment variable is not set")
+        if not stat.S_ISCHR(os.stat(self.receiver_device).st_mode):
+            with open(self.receiver_device) as f:
+                yield from mode2_text_events(f)
+            return
+
+        fd = os.open(self.receiver_device, os.O_RDONLY)
+        try:
+            try:
+                fcntl.ioctl(fd, LIRC_SET_REC_MODE, LIRC_MODE_MODE2.to_bytes(4, "little"))
+            except OSError as e:
+                logger.debug(f"Could not set mode2 receive mode on {self.receiver_device}: {e}")
+            yield from lirc_events(fd, deadline)
+        finally:
+            os.close(fd)
+
+    def capture(self, count: int, timeout: float) -> list[array]:
+        """
+        Block until `count` captures arrive, the timeout passes or the stream ends
+
+        Raises:
+            OSError: If the receiver cannot be opened
+            LearnTimeoutError: If nothing was captured
+        """
+        deadline = time.monotonic() + timeout
+        captures = []
+        for capture in split_captures(self._events(deadline)):
+            captures.append(capture)
+            if len(captures) >= count:
+                break
+        if not captures:
+            raise LearnTimeoutError(f"No IR signal received within {timeout} seconds")
+        return captures
+
+    async def learn(self, device: str, action: str, captures: Optional[int] = None,
+                    timeout: Optional[float] = None) -> Dict[str, any]:
+        """
+        Capture a button several times and store the cleaned code for an action
+
+        The code is written to the action's `{prefix}_{code}.txt` and the
+        device's code library is rescanned, so it is sent from the next request.
+
+        Raises:
+            UnknownDeviceActionError: If the manifest has no such action
+            LearnBusyError: If another learn request is running
+            LearnTimeoutError: If no IR signal was received
+            LearnError: If the captures do not agree or codes come from the binary library
+            OSError: If the receiver cannot be opened
+        """
+        entry = self.registry.lookup(device, action)
+        library = entry.service.codes
+        if library.library_file is not None:
+            raise LearnError("Codes are served from IR_CODE_LIBRARY; rebuild the library instead")
+        if self._busy:
+            raise LearnBusyError("The receiver is already learning another code")
+
+        count = captures or self.captures
+        receiver = get_receiver_lock()
+        self._busy = True
+        try:
+            # Waits for a verified transmit to finish reading its echo
+            async with receiver.lock():
+                receiver.learning = True
+                try:
+                    raw = await asyncio.to_thread(self.capture, count, timeout or self.timeout)
+                finally:
+                    receiver.learning = False
+        finally:
+            self._busy = False
+        result = align_and_average(raw)
+
+        path = library.resources_path / f"{library.prefix}_{entry.member.value}.txt"
+        self._write_code(path, result["pulses"])
+        library.rescan()
+        logger.info(f"Learned {device} {action} from {result['used']} captures into {path}")
+        return {
+            "device": device,
+            "action": action,
+            "success": True,
+            "message": f"Learned {path.name} from {result['used']} of {len(raw)} captures",
+            "file": str(path),
+            "captures": len(raw),
+            "used": result["used"],
+            "rejected": result["rejected"],
+            "durations": len(result["pulses"])
+        }
+
+    @staticmethod
+    def _write_code(path: Path, pulses: array) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".learn_")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(format_mode2(pulses))
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
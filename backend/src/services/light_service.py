@@ -1,9 +1,14 @@
 import os
-import subprocess
-from pathlib import Path
-from typing import Dict
+import time
+from typing import Dict, Optional
 from models.light_model import LightMode
 from env import IR_CODE_DIR, IR_LIGHT_RESOURCES_PATH, TRANSMITTER_DEVICE
+from services.code_library import CodeLibrary, IRCode
+from services.history import HistoryStore, get_history_store
+from services.ir_library import IRLibraryError
+from services.state_store import DeviceStateStore, get_state_store
+from services.transmitter import TransmitterError
+from services.tx_scheduler import PRIORITY_MODE, TransmitReceipt, TransmitScheduler, get_scheduler
 
 
 class LightResourceNotFoundError(Exception):
@@ -22,7 +27,11 @@ class IRTransmissionError(Exception):
 
 
 class LightService:
-    def __init__(self):
+    # Carrier frequency in Hz, None keeps the transmitter default
+    carrier: Optional[int] = 38000
+
+    def __init__(self, transmitter=None, scheduler: Optional[TransmitScheduler] = None,
+                 state_store: Optional[DeviceStateStore] = None, history: Optional[HistoryStore] = None):
         self.ir_code_dir = IR_CODE_DIR
         self.resources_path = IR_LIGHT_RESOURCES_PATH
         self.transmitter_device = TRANSMITTER_DEVICE
@@ -34,67 +43,50 @@ class LightService:
             raise ValueError("IR_CODE_DIR environment variable is not set")
         if not self.transmitter_device:
             raise ValueError("transmitter_device environment variable is not set")
-    
-    def _get_resource_file_path(self, mode: LightMode) -> Path:
-        """Get the full path to the light resource file"""
-        filename = f"light_{mode.value}.txt"
-        file_path = Path(self.resources_path) / filename
         
-        if not file_path.exists():
-            raise LightResourceNotFoundError(mode.value)
+        if scheduler is None:
+            scheduler = TransmitScheduler(transmitter) if transmitter else get_scheduler()
+        self.scheduler = scheduler
+        self.transmitter = scheduler.transmitter
+        self.codes = CodeLibrary(self.resources_path, "light", [LightMode])
         
-        return file_path
+        # Last-known state, updated after every successful transmission
+        self.state_store = state_store or get_state_store()
+        self.state = self.state_store.light
+        # Every command sent, for usage queries
+        self.history = history or get_history_store()
     
-    def _transmit_ir_signal(self, resource_file: Path) -> None:
-        """Transmit IR signal using the resource file"""
+    def _get_code(self, mode: LightMode) -> IRCode:
+        """Get the cached IR code for the light mode"""
         try:
-            # Validate that the resource file exists
-            if not resource_file.exists():
-                raise IRTransmissionError(
-                    resource_file.stem,
-                    "IR code file not found"
-                )
-            
-            # ir-ctl command: -d for device, --send for file transmission
-            cmd = [
-                "ir-ctl",
-                "-d", self.transmitter_device,
-                "--carrier", "38000",
-                "--send", str(resource_file)
-            ]
-            
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=10,
-                check=True
-            )
-                
-        except subprocess.TimeoutExpired:
-            raise IRTransmissionError(
-                resource_file.stem,
-                "IR transmission timed out"
-            )
-        except subprocess.CalledProcessError as e:
-            raise IRTransmissionError(
-                resource_file.stem,
-                f"Command failed with code {e.returncode}: {e.stderr}"
-            )
-        except FileNotFoundError as e:
-            raise IRTransmissionError(
-                resource_file.stem,
-                f"IR transmission command not found: {str(e)}"
-            )
-        except Exception as e:
-            if isinstance(e, IRTransmissionError):
-                raise
-            raise IRTransmissionError(
-                resource_file.stem,
-                f"Unexpected error: {str(e)}"
+            return self.codes.get(mode)
+        except KeyError:
+            raise LightResourceNotFoundError(mode.value)
+        except IRLibraryError as e:
+            raise IRTransmissionError(mode.value, str(e))
+    
+    async def _transmit_ir_signal(self, code: IRCode, priority: int = PRIORITY_MODE,
+                                  coalesce_key: Optional[str] = None, accumulate: bool = False) -> TransmitReceipt:
+        """
+        Queue the IR code on the shared transmitter and wait until it is sent
+        
+        Returns the scheduler receipt with the queue wait and the code sent.
+        """
+        try:
+            return await self.scheduler.submit(
+                code, code.carrier or self.carrier, priority, coalesce_key, accumulate
             )
+        except TransmitterError as e:
+            raise IRTransmissionError(code.name, str(e))
+    
+    def record_transmitted(self, mode: LightMode) -> None:
+        """Update the tracked state and the history after a mode was sent"""
+        self.state.mode = mode
+        self.state.updated_at = time.time()
+        self.state_store.changed("light")
+        self.history.record("light", mode.value, mode.value)
     
-    def set_light_mode(self, mode: LightMode) -> Dict[str, any]:
+    async def set_light_mode(self, mode: LightMode) -> Dict[str, any]:
         """
         Set the light to a specific mode
         
@@ -102,16 +94,29 @@ class LightService:
             LightResourceNotFoundError: If the resource file doesn't exist
             IRTransmissionError: If IR transmission fails
         """
-        resource_file = self._get_resource_file_path(mode)
-        self._transmit_ir_signal(resource_file)
+        code = self._get_code(mode)
+        # A newer mode request replaces one that is still queued
+        receipt = await self._transmit_ir_signal(code, coalesce_key="light:mode")
         
+        if receipt.code_name != code.name:
+            message = f"Light mode {mode.value} was superseded by {receipt.code_name}"
+        else:
+            self.record_transmitted(mode)
+            message = f"Light set to {mode.value} mode successfully"
         return {
             "mode": mode.value,
             "success": True,
-            "message": f"Light set to {mode.value} mode successfully"
+            "message": message,
+            "queue_wait_ms": round(receipt.wait * 1000, 3)
         }
     
     def get_available_modes(self) -> list[str]:
         """Get list of available light modes"""
         return [mode.value for mode in LightMode]
 
+    def get_status(self) -> Dict[str, any]:
+        """Get available light modes and the last-known state"""
+        return {
+            "available_modes": self.get_available_modes(),
+            "state": self.state
+        }
@@ -0,0 +1,311 @@
+import asyncio
+import fcntl
+import logging
+import math
+import os
+import stat
+import time
+from array import array
+from collections import Counter, deque
+from typing import Awaitable, Callable, Dict, Optional, Sequence
+from env import RECEIVER_DEVICE, TRANSMIT_VERIFY, VERIFY_MAX_REPEATS, VERIFY_MAX_RESENDS
+from services.learn_service import (
+    CAPTURE_GAP_US,
+    LIRC_MODE_MODE2,
+    LIRC_SET_REC_MODE,
+    get_receiver_lock,
+    lirc_events,
+    mode2_text_events,
+    split_captures
+)
+from services.metrics import REGISTRY, code_label
+from services.transmitter import join_pulse_trains
+
+logger = logging.getLogger(__name__)
+
+# Receivers stretch pulses and shorten spaces; a duration matches within either bound
+ECHO_TOLERANCE = 0.25
+ECHO_TOLERANCE_US = 200
+
+# Time the receiver keeps listening after the frame's airtime
+ECHO_MARGIN_S = 0.15
+
+# Per-frame outcomes used to tune the repeat count, and the fewest worth acting on
+WINDOW_FRAMES = 100
+MIN_SAMPLES = 10
+
+# Repeats are chosen so that every copy of a command is missed at most this often
+TARGET_MISS_RATE = 0.01
+
+IR_VERIFY = REGISTRY.counter(
+    "ir_verify_total", "Loopback verification outcomes by device", ("device", "outcome")
+)
+
+
+def device_label(code_name: str) -> str:
+    """Device a code belongs to, from the `{prefix}_{code}` name of its recording"""
+    return code_label(code_name).split("_", 1)[0]
+
+
+def duration_matches(sent: int, received: int, tolerance: float = ECHO_TOLERANCE) -> bool:
+    error = abs(sent - received)
+    return error <= ECHO_TOLERANCE_US or error <= sent * tolerance
+
+
+def count_echoes(sent: Sequence[int], captures: Sequence[Sequence[int]]) -> int:
+    """
+    Number of times `sent` appears in the captures
+
+    Copies sent back to back may arrive as one capture, so every capture is
+    scanned for non-overlapping windows that match duration by duration.
+    """
+    length = len(sent)
+    found = 0
+    for capture in captures:
+        index = 0
+        while index + length <= len(capture):
+            if all(duration_matches(a, b) for a, b in zip(sent, capture[index:index + length])):
+                found += 1
+                # Skip the frame and the space after it
+                index += length + 1
+            else:
+                # Frames start with a pulse
+                index += 2
+    return found
+
+
+def split_frames(pulses: Sequence[int], gap_us: int = CAPTURE_GAP_US) -> list[tuple[int, ...]]:
+    """
+    Cut a pulse train at the spaces the receiver ends a capture on
+
+    A burst of several codes joined with the frame gap never arrives as one
+    capture, so each part has to be matched on its own.
+    """
+    frames = []
+    start = 0
+    for index in range(1, len(pulses), 2):
+        if pulses[index] >= gap_us:
+            frames.append(tuple(pulses[start:index]))
+            start = index + 1
+    frames.append(tuple(pulses[start:]))
+    return [frame for frame in frames if frame]
+
+
+def count_train_echoes(sent: Sequence[int], captures: Sequence[Sequence[int]]) -> int:
+    """Number of complete copies of `sent` in the captures, matching every frame of it separately"""
+    parts = Counter(split_frames(sent))
+    return min(count_echoes(frame, captures) // needed for frame, needed in parts.items())
+
+
+class LinkStats:
+    """Echo statistics of one device and the repeat count they call for"""
+
+    __slots__ = ("max_repeats", "repeats", "frames", "commands", "verified", "resent", "failed",
+                 "unverified", "_window")
+
+    def __init__(self, max_repeats: int):
+        self.max_repeats = max_repeats
+        self.repeats = 1
+        self.frames = 0
+        self.commands = 0
+        self.verified = 0
+        self.resent = 0
+        self.failed = 0
+        self.unverified = 0
+        self._window: deque = deque(maxlen=WINDOW_FRAMES)
+
+    @property
+    def miss_rate(self) -> Optional[float]:
+        """Share of recent frames without an echo"""
+        if len(self._window) < MIN_SAMPLES:
+            return None
+        return 1 - sum(self._window) / len(self._window)
+
+    def record_frames(self, sent: int, echoed: int) -> None:
+        self.frames += sent
+        self._window.extend([True] * min(echoed, sent) + [False] * max(sent - echoed, 0))
+
+    def tune(self) -> None:
+        """Send just enough copies that all of them are missed at most TARGET_MISS_RATE of the time"""
+        miss_rate = self.miss_rate
+        if miss_rate is None:
+            return
+        if miss_rate <= 0:
+            needed = 1
+        elif miss_rate >= 1:
+            needed = self.max_repeats
+        else:
+            needed = math.ceil(math.log(TARGET_MISS_RATE) / math.log(miss_rate))
+        self.repeats = min(max(needed, 1), self.max_repeats)
+
+    def as_dict(self) -> Dict[str, any]:
+        miss_rate = self.miss_rate
+        return {
+            "repeats": self.repeats,
+            "commands": self.commands,
+            "verified": self.verified,
+            "resent": self.resent,
+            "failed": self.failed,
+            "unverified": self.unverified,
+            "frames": self.frames,
+            "miss_rate": None if miss_rate is None else round(miss_rate, 3)
+        }
+
+
+class LoopbackVerifier:
+    """
+    Checks transmissions against their echo on RECEIVER_DEVICE
+
+    The receiver is opened before a frame is sent and read until its airtime
+    has passed, and the captures are matched against the sent pulses. A
+    resendable command (a mode or full-state frame, which is safe to receive
+    twice) is sent again when no copy echoed, up to `max_resends` times.
+    Increments are only checked, since a resend could step twice.
+
+    Every device starts at one copy per command. Its recent per-frame miss
+    rate sets how many copies resendable commands get up front, so a
+    reliable link costs one frame and a flaky one gets just enough repeats.
+    One receiver hears every emitter, so verified sends take turns on it
+    with each other and with learning; while a code is being learned they
+    go out unverified.
+    """
+
+    def __init__(self, receiver_device: Optional[str] = RECEIVER_DEVICE,
+                 max_repeats: int = VERIFY_MAX_REPEATS, max_resends: int = VERIFY_MAX_RESENDS):
+        self.receiver_device = receiver_device
+        self.max_repeats = max_repeats
+        self.max_resends = max_resends
+        self.stats: Dict[str, LinkStats] = {}
+
+    def stats_for(self, device: str) -> LinkStats:
+        stats = self.stats.get(device)
+        if stats is None:
+            stats = self.stats[device] = LinkStats(self.max_repeats)
+        return stats
+
+    def get_stats(self) -> Dict[str, Dict[str, any]]:
+        return {device: stats.as_dict() for device, stats in self.stats.items()}
+
+    # ========== RECEIVER ==========
+
+    def _open(self):
+        """Open the receiver: a LIRC fd, or a regular file replayed as mode2 text"""
+        if not stat.S_ISCHR(os.stat(self.receiver_device).st_mode):
+            return open(self.receiver_device)
+        fd = os.open(self.receiver_device, os.O_RDONLY | os.O_NONBLOCK)
+        try:
+            fcntl.ioctl(fd, LIRC_SET_REC_MODE, LIRC_MODE_MODE2.to_bytes(4, "little"))
+        except OSError as e:
+            logger.debug(f"Could not set mode2 receive mode on {self.receiver_device}: {e}")
+        return fd
+
+    def _read(self, receiver, deadline: float) -> Optional[list[array]]:
+        events = lirc_events(receiver, deadline) if isinstance(receiver, int) else mode2_text_events(receiver)
+        try:
+            return list(split_captures(events, min_edges=1))
+        except OSError as e:
+            logger.warning(f"Reading loopback receiver {self.receiver_device} failed: {e}")
+            return None
+        finally:
+            if isinstance(receiver, int):
+                os.close(receiver)
+            else:
+                receiver.close()
+
+    async def echo(self, send: Callable[[], Awaitable[None]], airtime: float) -> Optional[list[array]]:
+        """
+        Run `send` while listening, and return what the receiver captured
+
+        Returns None when the receiver failed after the frame was sent.
+
+        Raises:
+            OSError: If the receiver cannot be opened; nothing is sent
+            TransmitterError: If sending fails
+        """
+        receiver = self._open()
+        deadline = time.monotonic() + airtime + ECHO_MARGIN_S
+        listening = asyncio.ensure_future(asyncio.to_thread(self._read, receiver, deadline))
+        try:
+            await send()
+        except BaseException:
+            await asyncio.gather(listening, return_exceptions=True)
+            raise
+        return await listening
+
+    # ========== TRANSMISSION ==========
+
+    async def transmit(self, transmitter, pulses: array, carrier: Optional[int], code_name: str,
+                       copies: int = 1, gap_us: int = 0, resendable: bool = False, source=None) -> bool:
+        """
+        Send `copies` of a frame and check the echo, resending resendable frames on a miss
+
+        Returns whether an echo was seen. Without a receiver the frame is sent unverified.
+
+        Raises:
+            TransmitterError: If the transmitter fails to send
+        """
+        device = device_label(code_name)
+        stats = self.stats_for(device)
+        stats.commands += 1
+        if resendable:
+            copies = max(copies, stats.repeats)
+
+        receiver = get_receiver_lock()
+        if receiver.learning:
+            # A learn request holds the receiver for seconds; the transmit queue must not wait on it
+            train = pulses if copies == 1 else join_pulse_trains([pulses] * copies, gap_us)
+            await transmitter.send(train, carrier, source=source if copies == 1 else None)
+            stats.unverified += 1
+            IR_VERIFY.inc(device, "unverified")
+            return False
+
+        async with receiver.lock():
+            attempts = self.max_resends + 1 if resendable else 1
+            for attempt in range(attempts):
+                train = pulses if copies == 1 else join_pulse_trains([pulses] * copies, gap_us)
+                # The recording can be handed to ir-ctl as is only when it is sent once
+                frame_source = source if copies == 1 else None
+
+                async def send() -> None:
+                    await transmitter.send(train, carrier, source=frame_source)
+
+                try:
+                    captures = await self.echo(send, (sum(train) + gap_us) / 1_000_000)
+                except OSError as e:
+                    logger.warning(f"Loopback receiver unavailable, sending {code_name} unverified: {e}")
+                    await send()
+                    captures = None
+                if captures is None:
+                    stats.unverified += 1
+                    IR_VERIFY.inc(device, "unverified")
+                    return False
+
+                echoed = min(count_train_echoes(pulses, captures), copies)
+                stats.record_frames(copies, echoed)
+                if echoed:
+                    stats.verified += 1
+                    IR_VERIFY.inc(device, "verified")
+                    stats.tune()
+                    return True
+                if attempt + 1 < attempts:
+                    stats.resent += 1
+                    IR_VERIFY.inc(device, "resent")
+                    # The miss is already counted against the link, a single copy is enough to retry
+                    copies = 1
+
+        stats.failed += 1
+        IR_VERIFY.inc(device, "missed")
+        stats.tune()
+        logger.warning(f"No echo for {code_name} after {attempts} attempt(s)")
+        return False
+
+
+_shared_verifier: Optional[LoopbackVerifier] = None
+
+
+def get_verifier() -> Optional[LoopbackVerifier]:
+    """Get the process-wide verifier; None unless TRANSMIT_VERIFY is on and RECEIVER_DEVICE is set"""
+    global _shared_verifier
+    if _shared_verifier is None and TRANSMIT_VERIFY and RECEIVER_DEVICE:
+        _shared_verifier = LoopbackVerifier()
+    return _shared_verifier
@@ -0,0 +1,273 @@
+"""
+Low-overhead metrics in the Prometheus text format
+
+Every metric keeps one shard per thread. A thread only ever writes its own
+shard, so recording needs no lock; /metrics merges the shards when it is
+scraped. The event loop thread does nearly all the recording, with the
+state store and learn workers getting shards of their own.
+"""
+
+import bisect
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional, Sequence
+
+# Seconds; covers device writes (~ms), ir-ctl spawns (~10ms) and queued bursts (~s)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    """Shared per-thread sharding for every metric type"""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._shards: Dict[int, dict] = {}
+        self._shards_lock = threading.Lock()
+
+    def _shard(self) -> dict:
+        ident = threading.get_ident()
+        shard = self._shards.get(ident)
+        if shard is None:
+            # Only the first write from a new thread takes the lock
+            with self._shards_lock:
+                shard = self._shards.setdefault(ident, {})
+        return shard
+
+    def _snapshot(self) -> list[dict]:
+        with self._shards_lock:
+            shards = list(self._shards.values())
+        return [dict(shard) for shard in shards]
+
+    def _header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return sum(shard.get(labels, 0) for shard in self._snapshot())
+
+    def render(self) -> list[str]:
+        totals: Dict[tuple, float] = {}
+        for shard in self._snapshot():
+            for labels, value in shard.items():
+                totals[labels] = totals.get(labels, 0) + value
+        lines = self._header()
+        for labels, value in sorted(totals.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    """
+    Value that goes up and down
+
+    Per-thread shards are summed, so use inc()/dec() pairs; a gauge that
+    reflects some other state is given a `function` that is read at scrape
+    time instead.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 function: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labels)
+        self.function = function
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def render(self) -> list[str]:
+        if self.function is None:
+            return super().render()
+        return self._header() + [f"{self.name} {_format_value(self.function())}"]
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels: str) -> None:
+        shard = self._shard()
+        entry = shard.get(labels)
+        if entry is None:
+            # Bucket counts, then +Inf, sum
+            entry = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        entry[bisect.bisect_left(self.buckets, value)] += 1
+        entry[-1] += value
+
+    def time(self, *labels: str) -> "_Timer":
+        """Context manager that observes the elapsed time"""
+        return _Timer(self, labels)
+
+    def count(self, *labels: str) -> int:
+        return sum(sum(shard[labels][:-1]) for shard in self._snapshot() if labels in shard)
+
+    def render(self) -> list[str]:
+        totals: Dict[tuple, list] = {}
+        for shard in self._snapshot():
+            for labels, entry in shard.items():
+                total = totals.setdefault(labels, [0] * len(entry))
+                for index, value in enumerate(entry):
+                    total[index] += value
+        lines = self._header()
+        for labels, entry in sorted(totals.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), entry[:-1]):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, labels, le)} {cumulative}")
+            label_text = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(entry[-1])}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram: Histogram, labels: tuple):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+        return False
+
+
+class MetricsRegistry:
+    """Named collection of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _add(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: Sequence[str] = (),
+              function: Optional[Callable[[], float]] = None) -> Gauge:
+        return self._add(Gauge(name, documentation, labels, function))
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, documentation, labels, buckets))
+
+    def render(self) -> str:
+        """Every metric in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics.values():
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "http_requests_total", "HTTP requests by method, route and status", ("method", "route", "status")
+)
+HTTP_DURATION = REGISTRY.histogram(
+    "http_request_duration_seconds", "Time spent handling HTTP requests", ("method", "route")
+)
+HTTP_IN_FLIGHT = REGISTRY.gauge("http_requests_in_flight", "HTTP requests being handled")
+HTTP_EXCEPTIONS = REGISTRY.counter(
+    "http_exceptions_total", "Errors raised while handling requests, by exception type", ("exception",)
+)
+IR_FRAMES = REGISTRY.counter(
+    "ir_frames_total", "IR frames sent or failed, by code and outcome", ("code", "outcome")
+)
+IR_TRANSMIT_DURATION = REGISTRY.histogram(
+    "ir_transmit_seconds", "Airtime per frame: ir-ctl subprocess or device write time", ("backend",)
+)
+IR_QUEUE_WAIT = REGISTRY.histogram("ir_queue_wait_seconds", "Time requests wait in the transmit queue")
+IR_TRANSMIT_ERRORS = REGISTRY.counter(
+    "ir_transmit_errors_total", "Transmitter failures by backend and exception type", ("backend", "exception")
+)
+IR_CTL_TIMEOUTS = REGISTRY.counter("ir_ctl_timeouts_total", "ir-ctl invocations killed after the timeout")
+IR_IN_FLIGHT = REGISTRY.gauge("ir_transmit_in_flight", "Frames being transmitted")
+
+
+def code_label(name: str) -> str:
+    """Metric label for a code name; composite frames are labelled by their kind"""
+    return name.split(":", 1)[0].split("+", 1)[0]
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request counts, latency and in-flight requests"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception as e:
+            HTTP_EXCEPTIONS.inc(type(e).__name__)
+            raise
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            route = scope.get("route")
+            # Route templates keep the label set bounded
+            path = getattr(route, "path", "unmatched")
+            method = scope["method"]
+            HTTP_DURATION.observe(time.perf_counter() - started, method, path)
+            HTTP_REQUESTS.inc(method, path, str(status))
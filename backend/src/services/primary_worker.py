@@ -0,0 +1,62 @@
+import fcntl
+import logging
+import os
+from pathlib import Path
+from typing import Optional
+from env import IR_CODE_DIR, PRIMARY_LOCK_FILE
+
+logger = logging.getLogger(__name__)
+
+
+class PrimaryWorkerLock:
+    """
+    Elects one primary among the uvicorn workers of a host
+
+    The first worker to take an exclusive flock on the lock file is primary
+    and runs the background loops that must run once per host: the action
+    scheduler and gateway health checks. The kernel drops the lock when the
+    process exits, so a restarted worker can take over.
+    """
+
+    __slots__ = ("path", "_fd")
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._fd: Optional[int] = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def acquire(self) -> bool:
+        """Try to become primary without waiting; True if this process holds the lock"""
+        if self._fd is not None:
+            return True
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{os.getpid()}\n".encode())
+        self._fd = fd
+        return True
+
+    def release(self) -> None:
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+_shared_lock: Optional[PrimaryWorkerLock] = None
+
+
+def get_primary_lock() -> PrimaryWorkerLock:
+    """Get the process-wide primary worker lock"""
+    global _shared_lock
+    if _shared_lock is None:
+        _shared_lock = PrimaryWorkerLock(PRIMARY_LOCK_FILE or str(Path(IR_CODE_DIR) / "primary.lock"))
+    return _shared_lock
@@ -0,0 +1,201 @@
+import asyncio
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import time
+import uuid
+from collections import deque
+from contextvars import Context, ContextVar
+from typing import Any, Coroutine, Dict, Optional
+from env import LOG_FORMAT, LOG_LEVEL, REQUEST_LOG_SIZE, REQUEST_SLOW_MS
+
+logger = logging.getLogger(__name__)
+
+# Incoming request ids longer than this are replaced with a generated one
+MAX_REQUEST_ID_LENGTH = 64
+
+# Attributes every LogRecord has; anything else was passed with `extra=`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+# Entry of the request being handled, shared with the tasks it starts
+_current_entry: ContextVar[Optional[Dict[str, Any]]] = ContextVar("request_log_entry", default=None)
+
+
+def current_request_id() -> Optional[str]:
+    entry = _current_entry.get()
+    return entry["id"] if entry is not None else None
+
+
+def annotate_transmit(**fields: Any) -> None:
+    """Attach what a transmit did (code, backend, timings) to the current request's entry"""
+    entry = _current_entry.get()
+    if entry is not None:
+        entry.setdefault("transmits", []).append(fields)
+
+
+def start_background(loop: asyncio.AbstractEventLoop, coro: Coroutine) -> asyncio.Task:
+    """
+    Start a task that outlives the request it was started from
+
+    Tasks copy the context they are created in, so a worker started while
+    handling a request would log under that request's id for good and add
+    its transmits to it. These tasks get an empty context instead.
+    """
+    return loop.create_task(coro, context=Context())
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamps records with the id of the request being handled, or None outside of one"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = current_request_id()
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line with the message, the request id and any `extra` fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """The basicConfig layout, with the request id when there is one"""
+
+    def __init__(self):
+        super().__init__("%(levelname)s:%(name)s:%(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        request_id = getattr(record, "request_id", None)
+        return f"{text} [request_id={request_id}]" if request_id else text
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def configure_logging(level: str = LOG_LEVEL, log_format: str = LOG_FORMAT) -> None:
+    """
+    Route all logging through a queue to a background thread
+
+    Callers only enqueue the record, so a slow SD card or journald never
+    blocks the event loop. The listener thread formats and writes records
+    to stderr. Calling this again does nothing.
+    """
+    global _listener
+    if _listener is not None:
+        return
+    output = logging.StreamHandler()
+    output.setFormatter(JSONFormatter() if log_format == "json" else TextFormatter())
+
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    handler = logging.handlers.QueueHandler(records)
+    # Filters run in the caller, where the request context is still set
+    handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    root.setLevel(level.upper())
+    root.addHandler(handler)
+    _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+class RequestLog:
+    """The last `size` requests with their timings and transmits, oldest first"""
+
+    __slots__ = ("entries", "slow_ms")
+
+    def __init__(self, size: int = REQUEST_LOG_SIZE, slow_ms: float = REQUEST_SLOW_MS):
+        self.entries: deque = deque(maxlen=size)
+        self.slow_ms = slow_ms
+
+    def add(self, entry: Dict[str, Any]) -> None:
+        self.entries.append(entry)
+
+    def recent(self, limit: Optional[int] = None, min_duration_ms: float = 0) -> list[Dict[str, Any]]:
+        """Newest first, optionally only requests that took at least `min_duration_ms`"""
+        matching = [entry for entry in reversed(self.entries) if entry["duration_ms"] >= min_duration_ms]
+        return matching[:limit] if limit is not None else matching
+
+
+class RequestLogMiddleware:
+    """
+    ASGI middleware that records every HTTP request in the request log
+
+    Each request gets an id, taken from a sane X-Request-ID header or
+    generated, which is echoed in the response and stamped on every log
+    record written while it is handled.
+    """
+
+    def __init__(self, app, log: Optional["RequestLog"] = None):
+        self.app = app
+        self.log = log
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        log = self.log or get_request_log()
+        request_id = self._request_id(scope)
+        entry: Dict[str, Any] = {
+            "id": request_id,
+            "time": time.time(),
+            "method": scope["method"],
+            "path": scope["path"],
+            "client": scope["client"][0] if scope.get("client") else None,
+            "status": 500
+        }
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                entry["status"] = message["status"]
+                message["headers"] = [*message.get("headers", []), (b"x-request-id", request_id.encode())]
+            await send(message)
+
+        token = _current_entry.set(entry)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            entry["duration_ms"] = round((time.perf_counter() - started) * 1000, 3)
+            entry["route"] = getattr(scope.get("route"), "path", None)
+            log.add(entry)
+            if entry["duration_ms"] >= log.slow_ms:
+                logger.warning(f"Slow request {entry['method']} {entry['path']}: {entry['duration_ms']} ms",
+                               extra={"request": entry})
+            else:
+                logger.debug("%s %s %s", entry["method"], entry["path"], entry["status"], extra={"request": entry})
+            _current_entry.reset(token)
+
+    @staticmethod
+    def _request_id(scope) -> str:
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                candidate = value.decode("latin-1")
+                if 0 < len(candidate) <= MAX_REQUEST_ID_LENGTH and candidate.isprintable():
+                    return candidate
+        return uuid.uuid4().hex
+
+
+_shared_log: Optional[RequestLog] = None
+
+
+def get_request_log() -> RequestLog:
+    """Get the process-wide request ring buffer"""
+    global _shared_log
+    if _shared_log is None:
+        _shared_log = RequestLog()
+    return _shared_log
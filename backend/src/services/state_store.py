@@ -0,0 +1,138 @@
+import asyncio
+import json
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import Optional
+from pydantic import ValidationError
+from models.state_model import DeviceStates
+from env import IR_CODE_DIR, STATE_SNAPSHOT_FILE
+from services.event_bus import EventBus, get_event_bus
+from services.request_log import start_background
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceStateStore:
+    """
+    In-memory state of every device with a crash-safe snapshot on disk
+
+    Reads are plain attribute access on the models. Every change bumps a
+    version; a write-behind task serializes the models on the event loop and
+    writes them from a worker thread to a temp file that atomically replaces
+    the snapshot, so a crash leaves either the old or the new file. Changes
+    to a named device are also published on the event bus, if there is one.
+    """
+
+    def __init__(self, snapshot_file: str, events: Optional[EventBus] = None):
+        self.snapshot_file = Path(snapshot_file)
+        self.events = events
+        self.states = self._load()
+        self.version = 0
+        self._saved_version = 0
+        self._flush_task: Optional[asyncio.Task] = None
+
+    @property
+    def ac(self):
+        return self.states.ac
+
+    @property
+    def light(self):
+        return self.states.light
+
+    def _load(self) -> DeviceStates:
+        try:
+            return DeviceStates.model_validate_json(self.snapshot_file.read_bytes())
+        except FileNotFoundError:
+            return DeviceStates()
+        except (OSError, ValidationError) as e:
+            logger.warning(f"Ignoring unreadable state snapshot {self.snapshot_file}: {e}")
+            return DeviceStates()
+
+    def _serialize(self) -> bytes:
+        return self.states.model_dump_json().encode()
+
+    def _write(self, data: bytes) -> None:
+        self.snapshot_file.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.snapshot_file.parent, prefix=".state_")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_file)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def state_of(self, device: str):
+        """
+        Get the state model of a device
+
+        Raises:
+            KeyError: If the device has no tracked state
+        """
+        if device in ("ac", "light"):
+            return getattr(self.states, device)
+        return self.states.devices[device]
+
+    def changed(self, device: Optional[str] = None) -> None:
+        """Record that a state model was modified and schedule a snapshot"""
+        self.version += 1
+        if device is not None and self.events is not None and self.events.subscribers:
+            self.events.publish({
+                "type": "state",
+                "device": device,
+                "state": self.state_of(device).model_dump(mode="json")
+            })
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # The change already happened; a failed snapshot must not fail the command
+            try:
+                self.save()
+            except OSError as e:
+                logger.error(f"Failed to write state snapshot {self.snapshot_file}: {e}")
+            return
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = start_background(loop, self._write_behind())
+
+    async def flush(self) -> None:
+        """Wait until the snapshot on disk reflects the latest version"""
+        task = self._flush_task
+        if task is not None and not task.done() and task.get_loop() is asyncio.get_running_loop():
+            # Only one writer at a time, so an older write never lands last
+            await task
+        else:
+            await self._write_behind()
+
+    async def _write_behind(self) -> None:
+        while self._saved_version != self.version:
+            version = self.version
+            data = self._serialize()
+            try:
+                await asyncio.to_thread(self._write, data)
+            except OSError as e:
+                logger.error(f"Failed to write state snapshot {self.snapshot_file}: {e}")
+                return
+            self._saved_version = version
+
+    def save(self) -> None:
+        """Write the snapshot synchronously"""
+        version = self.version
+        self._write(self._serialize())
+        self._saved_version = version
+
+
+_shared_store: Optional[DeviceStateStore] = None
+
+
+def get_state_store() -> DeviceStateStore:
+    """Get the process-wide device state store"""
+    global _shared_store
+    if _shared_store is None:
+        _shared_store = DeviceStateStore(
+            STATE_SNAPSHOT_FILE or str(Path(IR_CODE_DIR) / "state.json"), events=get_event_bus()
+        )
+    return _shared_store
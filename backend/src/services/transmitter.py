@@ -0,0 +1,511 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import random
+import stat
+import struct
+import tempfile
+import threading
+import time
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+from env import (
+    IR_CODE_DIR,
+    SIMULATED_FAILURE_RATE,
+    SIMULATED_OVERHEAD_MS,
+    SIMULATED_SEED,
+    SIMULATED_TIMEOUT_RATE,
+    SIMULATED_TIMEOUT_S,
+    TRANSMITTER_BACKEND,
+    TRANSMITTER_DEVICE,
+    TRANSMITTER_DEVICES,
+    TRANSMITTER_POOL_SIZE,
+    TRANSMITTER_SOCKET
+)
+from services.metrics import IR_CTL_TIMEOUTS
+
+logger = logging.getLogger(__name__)
+
+# _IOW('i', 0x13, __u32) from <linux/lirc.h>
+LIRC_SET_SEND_CARRIER = 0x40046913
+
+IR_CTL_TIMEOUT = 10
+
+# Emitter used by devices that do not name one
+DEFAULT_EMITTER = "default"
+
+# Carrier used by both ir-ctl and the kernel when none is set explicitly
+DEFAULT_CARRIER = 38000
+
+# Daemon messages: (JSON length, payload length), the JSON object, then the payload
+MESSAGE_HEADER = struct.Struct("!II")
+MAX_MESSAGE_BYTES = 1 << 20
+
+# A daemon request waits for the frames of every worker queued ahead of it
+DAEMON_TIMEOUT = 30
+
+
+class TransmitterError(Exception):
+    """Raised when a transmitter backend fails to send a pulse train"""
+    pass
+
+
+def parse_mode2(text: str) -> array:
+    """
+    Parse mode2 text (as written by `ir-ctl -r --mode2`) into a pulse train
+
+    Returns an array('I') of alternating pulse/space durations in microseconds,
+    starting and ending with a pulse. Both the `pulse 560` / `space 560` form
+    and the raw `+560 -560` form are accepted.
+    """
+    pulses = array("I")
+    last_is_pulse = None
+    for line in text.splitlines():
+        for token_kind, token_value in _mode2_tokens(line):
+            is_pulse = token_kind == "pulse"
+            if last_is_pulse is None and not is_pulse:
+                # Leading silence carries no information
+                continue
+            if is_pulse == last_is_pulse:
+                pulses[-1] += token_value
+            else:
+                pulses.append(token_value)
+                last_is_pulse = is_pulse
+    if pulses and not last_is_pulse:
+        pulses.pop()
+    return pulses
+
+
+def _mode2_tokens(line: str):
+    line = line.split("#", 1)[0].strip()
+    if not line:
+        return
+    parts = line.split()
+    if parts[0] in ("pulse", "space") and len(parts) >= 2:
+        yield parts[0], int(parts[1])
+        return
+    if parts[0] in ("timeout", "carrier"):
+        return
+    for part in parts:
+        if part.startswith("+"):
+            yield "pulse", int(part[1:])
+        elif part.startswith("-"):
+            yield "space", int(part[1:])
+        else:
+            raise ValueError(f"Unrecognised mode2 token: {part!r}")
+
+
+def format_mode2(pulses: array) -> str:
+    """Format a pulse train as mode2 text that ir-ctl can send"""
+    lines = []
+    for index, duration in enumerate(pulses):
+        kind = "pulse" if index % 2 == 0 else "space"
+        lines.append(f"{kind} {duration}")
+    return "\n".join(lines) + "\n"
+
+
+def join_pulse_trains(trains: Iterable[array], gap_us: int) -> array:
+    """Concatenate pulse trains into one, separated by `gap_us` of silence"""
+    joined = array("I")
+    for train in trains:
+        if joined:
+            joined.append(gap_us)
+        joined.extend(train)
+    return joined
+
+
+class IrCtlTransmitter:
+    """Transmits by spawning `ir-ctl --send` for every frame"""
+
+    name = "ir-ctl"
+
+    def __init__(self, device: str, timeout: float = IR_CTL_TIMEOUT):
+        self.device = device
+        self.timeout = timeout
+
+    async def send(self, pulses: array, carrier: Optional[int] = None, source: Optional[Path] = None) -> None:
+        """
+        Send a pulse train, preferring the recorded file when one is given
+
+        Raises:
+            TransmitterError: If ir-ctl is missing, fails or times out
+        """
+        if source is not None:
+            await self._run(source, carrier)
+            return
+
+        with tempfile.NamedTemporaryFile("w", suffix=".txt", prefix="ir_") as tmp:
+            tmp.write(format_mode2(pulses))
+            tmp.flush()
+            await self._run(Path(tmp.name), carrier)
+
+    async def _run(self, source: Path, carrier: Optional[int]) -> None:
+        # ir-ctl command: -d for device, --send for file transmission
+        cmd = ["ir-ctl", "-d", self.device]
+        if carrier:
+            cmd += ["--carrier", str(carrier)]
+        cmd += ["--send", str(source)]
+
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+        except FileNotFoundError as e:
+            raise TransmitterError(f"IR transmission command not found: {str(e)}")
+
+        try:
+            _, stderr = await asyncio.wait_for(process.communicate(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            IR_CTL_TIMEOUTS.inc()
+            raise TransmitterError("IR transmission timed out")
+
+        if process.returncode != 0:
+            raise TransmitterError(
+                f"Command failed with code {process.returncode}: {stderr.decode(errors='replace')}"
+            )
+
+
+class LircTransmitter:
+    """
+    Writes pulse trains straight to a LIRC character device
+
+    The device is opened once and kept open. The carrier is set through the
+    LIRC_SET_SEND_CARRIER ioctl only when it changes, and each frame goes out
+    as a single write of packed native u32 durations, which is what the
+    kernel expects in LIRC_MODE_PULSE.
+    """
+
+    name = "lirc"
+
+    def __init__(self, device: str):
+        self.device = device
+        self._fd: Optional[int] = None
+        self._is_char_device = False
+        self._carrier: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def open(self) -> None:
+        """Open the device if it is not open yet"""
+        if self._fd is not None:
+            return
+        fd = os.open(self.device, os.O_WRONLY | os.O_CLOEXEC)
+        self._is_char_device = stat.S_ISCHR(os.fstat(fd).st_mode)
+        self._fd = fd
+        self._carrier = None
+
+    def close(self) -> None:
+        """Close the device; the next send reopens it"""
+        with self._lock:
+            self._close_locked()
+
+    def _close_locked(self) -> None:
+        if self._fd is not None:
+            try:
+                os.close(self._fd)
+            finally:
+                self._fd = None
+
+    def _write(self, pulses: array, carrier: Optional[int]) -> None:
+        with self._lock:
+            try:
+                self.open()
+                if carrier and carrier != self._carrier and self._is_char_device:
+                    fcntl.ioctl(self._fd, LIRC_SET_SEND_CARRIER, struct.pack("I", carrier))
+                    self._carrier = carrier
+                data = pulses.tobytes()
+                written = os.write(self._fd, data)
+                if written != len(data):
+                    raise TransmitterError(f"Short write to {self.device}: {written}/{len(data)} bytes")
+            except OSError as e:
+                # Drop the descriptor so a replugged device is picked up again
+                self._close_locked()
+                raise TransmitterError(f"Failed to write to {self.device}: {str(e)}")
+
+    async def send(self, pulses: array, carrier: Optional[int] = None, source: Optional[Path] = None) -> None:
+        """
+        Send a pulse train through the open device
+
+        The write blocks for the airtime of the frame, so it runs in a worker
+        thread to keep the event loop free.
+
+        Raises:
+            TransmitterError: If the device cannot be opened or written
+        """
+        if len(pulses) % 2 == 0:
+            raise TransmitterError("Pulse train must start and end with a pulse")
+        await asyncio.to_thread(self._write, pulses, carrier)
+
+
+class SimulatedTransmitter:
+    """
+    Stands in for an emitter without touching any hardware
+
+    Each frame blocks a worker thread for its exact airtime, the sum of its
+    durations, plus a fixed `overhead` per frame (e.g. the cost of spawning
+    ir-ctl). A recorded `source` file is read and parsed the way ir-ctl
+    would, so broken recordings fail as they would on the device.
+    Transmitters of the same device share one lock, like writes to one LIRC
+    device, so frames from several schedulers or emitters on it queue up
+    and `contended` counts how often that happened. `failure_rate` and
+    `timeout_rate` inject ir-ctl failures: a non-zero exit, or a hang for
+    `timeout` seconds before the frame is given up.
+    """
+
+    name = "simulated"
+
+    _device_locks: Dict[str, threading.Lock] = {}
+    _device_locks_guard = threading.Lock()
+
+    def __init__(self, device: str, overhead: float = SIMULATED_OVERHEAD_MS / 1000,
+                 failure_rate: float = SIMULATED_FAILURE_RATE, timeout_rate: float = SIMULATED_TIMEOUT_RATE,
+                 timeout: float = SIMULATED_TIMEOUT_S, seed: Optional[int] = SIMULATED_SEED):
+        self.device = device
+        self.overhead = overhead
+        self.failure_rate = failure_rate
+        self.timeout_rate = timeout_rate
+        self.timeout = timeout
+        self._random = random.Random(seed)
+        with self._device_locks_guard:
+            self._lock = self._device_locks.setdefault(device, threading.Lock())
+        self.frames = 0
+        self.airtime = 0.0
+        self.contended = 0
+
+    def _transmit(self, pulses: array, source: Optional[Path]) -> None:
+        if source is not None:
+            try:
+                pulses = parse_mode2(source.read_text())
+            except (OSError, ValueError) as e:
+                raise TransmitterError(f"Command failed with code 1: {e}")
+        if len(pulses) % 2 == 0:
+            raise TransmitterError("Pulse train must start and end with a pulse")
+
+        if not self._lock.acquire(blocking=False):
+            self.contended += 1
+            self._lock.acquire()
+        try:
+            outcome = self._random.random()
+            if outcome < self.timeout_rate:
+                time.sleep(self.timeout)
+                IR_CTL_TIMEOUTS.inc()
+                raise TransmitterError("IR transmission timed out")
+            if outcome < self.timeout_rate + self.failure_rate:
+                time.sleep(self.overhead)
+                raise TransmitterError(f"Command failed with code 1: simulated failure on {self.device}")
+            airtime = sum(pulses) / 1_000_000
+            time.sleep(self.overhead + airtime)
+            self.frames += 1
+            self.airtime += airtime
+        finally:
+            self._lock.release()
+
+    async def send(self, pulses: array, carrier: Optional[int] = None, source: Optional[Path] = None) -> None:
+        """
+        Block for the airtime of the frame in a worker thread, as the LIRC backend does
+
+        Raises:
+            TransmitterError: If the recording is invalid or an injected failure or timeout hits
+        """
+        await asyncio.to_thread(self._transmit, pulses, source)
+
+
+def daemon_socket_path() -> str:
+    """Unix socket of the transmitter daemon: TRANSMITTER_SOCKET or `$IR_CODE_DIR/transmitter.sock`"""
+    return TRANSMITTER_SOCKET or str(Path(IR_CODE_DIR) / "transmitter.sock")
+
+
+def encode_message(message: Dict[str, any], payload: bytes = b"") -> bytes:
+    body = json.dumps(message, separators=(",", ":")).encode()
+    return MESSAGE_HEADER.pack(len(body), len(payload)) + body + payload
+
+
+async def read_message(reader: asyncio.StreamReader) -> tuple[Dict[str, any], bytes]:
+    """
+    Read one framed message
+
+    Raises:
+        asyncio.IncompleteReadError: If the peer closed the connection
+        ValueError: If the message is too large or not a JSON object
+    """
+    body_length, payload_length = MESSAGE_HEADER.unpack(await reader.readexactly(MESSAGE_HEADER.size))
+    if body_length + payload_length > MAX_MESSAGE_BYTES:
+        raise ValueError(f"Message of {body_length + payload_length} bytes is too large")
+    data = await reader.readexactly(body_length + payload_length)
+    message = json.loads(data[:body_length])
+    if not isinstance(message, dict):
+        raise ValueError("Message is not a JSON object")
+    return message, data[body_length:]
+
+
+class DaemonTransmitter:
+    """
+    Sends frames through the transmitter daemon (services/tx_daemon.py)
+
+    The daemon owns the emitters and queues the frames of every worker
+    process, so uvicorn can run several workers without frames colliding.
+    Requests go over a small pool of Unix socket connections per event loop,
+    one request per connection at a time. A recorded code is sent by its
+    file path and parsed and cached by the daemon; other frames carry their
+    packed durations.
+    """
+
+    name = "daemon"
+
+    def __init__(self, device: str, socket_path: Optional[str] = None, pool_size: int = TRANSMITTER_POOL_SIZE,
+                 timeout: float = DAEMON_TIMEOUT):
+        self.device = device
+        self.socket_path = socket_path or daemon_socket_path()
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._idle: list[tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def _ensure_pool(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Connections belong to the loop that opened them
+            self._loop = loop
+            self._idle = []
+            self._slots = asyncio.Semaphore(self.pool_size)
+
+    async def _request(self, message: Dict[str, any], payload: bytes = b"") -> Dict[str, any]:
+        self._ensure_pool()
+        async with self._slots:
+            while True:
+                reused = bool(self._idle)
+                if reused:
+                    reader, writer = self._idle.pop()
+                else:
+                    try:
+                        reader, writer = await asyncio.open_unix_connection(self.socket_path)
+                    except OSError as e:
+                        raise TransmitterError(f"Transmitter daemon at {self.socket_path} is not reachable: {e}")
+                try:
+                    writer.write(encode_message(message, payload))
+                    await writer.drain()
+                    reply, _ = await asyncio.wait_for(read_message(reader), self.timeout)
+                except (ConnectionError, asyncio.IncompleteReadError) as e:
+                    writer.close()
+                    # An idle connection may predate a daemon restart; try a fresh one
+                    if reused:
+                        continue
+                    raise TransmitterError(f"Transmitter daemon at {self.socket_path} closed the connection: {e!r}")
+                except (OSError, ValueError, asyncio.TimeoutError) as e:
+                    writer.close()
+                    raise TransmitterError(f"Transmitter daemon at {self.socket_path} failed: {e!r}")
+                except BaseException:
+                    # Cancelled mid-exchange: a late reply could still arrive, so never reuse it
+                    writer.close()
+                    raise
+                self._idle.append((reader, writer))
+                return reply
+
+    async def close(self) -> None:
+        """Close idle connections"""
+        idle, self._idle = self._idle, []
+        for _, writer in idle:
+            writer.close()
+
+    async def send(self, pulses: array, carrier: Optional[int] = None, source: Optional[Path] = None) -> None:
+        """
+        Have the daemon transmit a frame and wait until it has been sent
+
+        Raises:
+            TransmitterError: If the daemon is unreachable or reports a failure
+        """
+        message = {"op": "send", "device": self.device, "carrier": carrier}
+        if source is not None:
+            reply = await self._request({**message, "source": str(source)})
+            if not reply.get("missing"):
+                self._check(reply)
+                return
+        self._check(await self._request(message, pulses.tobytes()))
+
+    @staticmethod
+    def _check(reply: Dict[str, any]) -> None:
+        if not reply.get("ok"):
+            raise TransmitterError(reply.get("error") or "Transmitter daemon reported a failure")
+
+
+def create_transmitter(backend: str, device: str):
+    """
+    Build a transmitter backend by name
+
+    `auto` uses the LIRC device directly when it can be opened and falls back
+    to ir-ctl otherwise. `simulated` never touches the device, and `daemon`
+    sends through the transmitter daemon.
+    """
+    if backend == "simulated":
+        return SimulatedTransmitter(device)
+    if backend == "daemon":
+        return DaemonTransmitter(device)
+    if backend == "ir-ctl":
+        return IrCtlTransmitter(device)
+    if backend == "lirc":
+        transmitter = LircTransmitter(device)
+        transmitter.open()
+        return transmitter
+    if backend == "auto":
+        transmitter = LircTransmitter(device)
+        try:
+            transmitter.open()
+            return transmitter
+        except OSError as e:
+            logger.warning(f"Cannot open {device} directly ({e}), falling back to ir-ctl")
+            return IrCtlTransmitter(device)
+    raise ValueError(f"Unknown transmitter backend: {backend}")
+
+
+def parse_emitters(text: Optional[str]) -> Dict[str, str]:
+    """
+    Parse `name=/dev/lirc0,name2=/dev/lirc2` into an emitter to device mapping
+
+    Raises:
+        ValueError: If an entry has no name or device, or a name is repeated
+    """
+    emitters: Dict[str, str] = {}
+    for entry in (text or "").split(","):
+        if not entry.strip():
+            continue
+        name, _, device = (part.strip() for part in entry.partition("="))
+        if not name or not device:
+            raise ValueError(f"Invalid emitter '{entry}', expected name=/dev/lircN")
+        if name in emitters:
+            raise ValueError(f"Emitter '{name}' is listed twice")
+        emitters[name] = device
+    return emitters
+
+
+def emitter_devices() -> Dict[str, str]:
+    """
+    Every configured emitter and its LIRC device
+
+    TRANSMITTER_DEVICES names the emitters; TRANSMITTER_DEVICE, when set, is
+    the `default` emitter unless that name is taken already.
+    """
+    emitters = parse_emitters(TRANSMITTER_DEVICES)
+    if TRANSMITTER_DEVICE and DEFAULT_EMITTER not in emitters:
+        emitters[DEFAULT_EMITTER] = TRANSMITTER_DEVICE
+    return emitters
+
+
+_shared_transmitters: Dict[str, object] = {}
+
+
+def get_transmitter(device: Optional[str] = None):
+    """Get the process-wide transmitter for a LIRC device (TRANSMITTER_DEVICE by default)"""
+    device = device or TRANSMITTER_DEVICE
+    if not device:
+        raise ValueError("TRANSMITTER_DEVICE environment variable is not set")
+    transmitter = _shared_transmitters.get(device)
+    if transmitter is None:
+        transmitter = _shared_transmitters[device] = create_transmitter(TRANSMITTER_BACKEND, device)
+    return transmitter
@@ -0,0 +1,164 @@
+"""
+Transmitter daemon: one process that owns the IR emitters
+
+HTTP workers started with TRANSMITTER_BACKEND=daemon send their frames here
+over a Unix socket instead of driving the devices themselves, so any number
+of uvicorn workers can share one emitter. Every device gets one transmit
+scheduler, which sends frames one at a time with the configured gap.
+
+Run from backend/src:
+    python -m services.tx_daemon
+"""
+
+import asyncio
+import logging
+import os
+import signal
+from array import array
+from pathlib import Path
+from typing import Callable, Dict, Optional
+from env import TRANSMITTER_DAEMON_BACKEND
+from services.code_library import IRCode
+from services.request_log import configure_logging
+from services.transmitter import (
+    TransmitterError,
+    create_transmitter,
+    daemon_socket_path,
+    encode_message,
+    parse_mode2,
+    read_message
+)
+from services.tx_scheduler import TransmitScheduler
+
+logger = logging.getLogger(__name__)
+
+
+class TransmitterDaemon:
+    """
+    Serves framed `send` and `status` requests on a Unix socket
+
+    A `send` names the device and carries either the path of a recording,
+    which is parsed once and cached until the file changes, or the packed
+    durations of a generated frame. The reply comes once the frame is sent.
+    """
+
+    def __init__(self, socket_path: Optional[str] = None, backend: str = TRANSMITTER_DAEMON_BACKEND,
+                 transmitter_factory: Optional[Callable[[str], object]] = None):
+        self.socket_path = socket_path or daemon_socket_path()
+        self.transmitter_factory = transmitter_factory or (lambda device: create_transmitter(backend, device))
+        self.schedulers: Dict[str, TransmitScheduler] = {}
+        # Recording path -> (mtime_ns, pulses)
+        self._codes: Dict[str, tuple[int, array]] = {}
+        self.code_loads = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+        # Open worker connections and the tasks serving them
+        self._clients: Dict[asyncio.StreamWriter, asyncio.Task] = {}
+
+    def scheduler(self, device: str) -> TransmitScheduler:
+        scheduler = self.schedulers.get(device)
+        if scheduler is None:
+            scheduler = self.schedulers[device] = TransmitScheduler(self.transmitter_factory(device), emitter=device)
+        return scheduler
+
+    def _code(self, path: str) -> Optional[array]:
+        """Pulses of a recording, parsed again only when the file changed; None if unreadable"""
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+            cached = self._codes.get(path)
+            if cached is not None and cached[0] == mtime_ns:
+                return cached[1]
+            pulses = parse_mode2(Path(path).read_text())
+        except (OSError, ValueError) as e:
+            logger.warning(f"Cannot load recording {path}: {e}")
+            return None
+        self.code_loads += 1
+        self._codes[path] = (mtime_ns, pulses)
+        return pulses
+
+    async def handle(self, message: Dict[str, any], payload: bytes) -> Dict[str, any]:
+        """Run one request and build its reply"""
+        op = message.get("op")
+        if op == "status":
+            return {"ok": True, "emitters": [scheduler.stats() for scheduler in self.schedulers.values()]}
+        if op != "send":
+            return {"ok": False, "error": f"Unknown op: {op!r}"}
+        device = message.get("device")
+        if not isinstance(device, str) or not device:
+            return {"ok": False, "error": "A send needs a device"}
+
+        source = message.get("source")
+        if source is not None:
+            pulses = self._code(source)
+            if pulses is None:
+                # The worker sends the durations instead
+                return {"ok": False, "missing": True, "error": f"Cannot load recording {source}"}
+            code = IRCode(Path(source).stem, pulses, source=Path(source))
+        else:
+            pulses = array("I")
+            pulses.frombytes(payload[:len(payload) - len(payload) % pulses.itemsize])
+            code = IRCode("frame", pulses)
+
+        try:
+            await self.scheduler(device).submit(code, message.get("carrier"))
+        except (TransmitterError, ValueError) as e:
+            return {"ok": False, "error": str(e)}
+        return {"ok": True}
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._clients[writer] = asyncio.current_task()
+        try:
+            while True:
+                try:
+                    message, payload = await read_message(reader)
+                except asyncio.IncompleteReadError:
+                    return
+                writer.write(encode_message(await self.handle(message, payload)))
+                await writer.drain()
+        except (OSError, ValueError) as e:
+            logger.warning(f"Dropping transmitter daemon client: {e!r}")
+        finally:
+            self._clients.pop(writer, None)
+            writer.close()
+
+    async def start(self) -> None:
+        """Listen on the socket, replacing a stale one left by a previous run"""
+        path = Path(self.socket_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.unlink(missing_ok=True)
+        self._server = await asyncio.start_unix_server(self._serve_connection, path=str(path))
+        # Workers may run as another user of the same group
+        os.chmod(path, 0o660)
+        logger.info(f"Transmitter daemon listening on {path}")
+
+    async def stop(self) -> None:
+        """Stop listening and hang up on every worker"""
+        if self._server is not None:
+            self._server.close()
+            clients = list(self._clients.items())
+            for writer, _ in clients:
+                writer.close()
+            await asyncio.gather(*(task for _, task in clients), return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+            Path(self.socket_path).unlink(missing_ok=True)
+
+    async def serve_forever(self) -> None:
+        """Serve until SIGINT or SIGTERM"""
+        await self.start()
+        stopped = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stopped.set)
+        try:
+            await stopped.wait()
+        finally:
+            await self.stop()
+
+
+def main() -> None:
+    configure_logging()
+    asyncio.run(TransmitterDaemon().serve_forever())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+import asyncio
+import heapq
+import itertools
+from typing import Dict, Optional
+from env import TRANSMIT_FRAME_GAP_MS
+from services.code_library import IRCode
+from services.event_bus import EventBus, get_event_bus
+from services.loopback import LoopbackVerifier, get_verifier
+from services.request_log import annotate_transmit, start_background
+from services.metrics import (
+    IR_FRAMES,
+    IR_IN_FLIGHT,
+    IR_QUEUE_WAIT,
+    IR_TRANSMIT_DURATION,
+    IR_TRANSMIT_ERRORS,
+    REGISTRY,
+    code_label
+)
+from services.transmitter import DEFAULT_EMITTER, emitter_devices, get_transmitter, join_pulse_trains
+
+# Lower values are transmitted first
+PRIORITY_MODE = 0
+PRIORITY_ADJUST = 1
+
+
+class TransmitJob:
+    """A queued frame and every caller waiting for it"""
+
+    __slots__ = ("code", "carrier", "priority", "coalesce_key", "accumulate", "repeat", "waiters")
+
+    def __init__(self, code: IRCode, carrier: Optional[int], priority: int,
+                 coalesce_key: Optional[str], accumulate: bool):
+        self.code = code
+        self.carrier = carrier
+        self.priority = priority
+        self.coalesce_key = coalesce_key
+        self.accumulate = accumulate
+        self.repeat = 1
+        # (future, enqueued_at) for every request folded into this job
+        self.waiters: list[tuple[asyncio.Future, float]] = []
+
+    @property
+    def resendable(self) -> bool:
+        """Latest-wins jobs set a mode or a full state, so receiving them twice is harmless"""
+        return self.coalesce_key is not None and not self.accumulate
+
+
+class TransmitReceipt:
+    """What was actually sent on behalf of a submitted request"""
+
+    __slots__ = ("wait", "code_name", "repeat", "verified", "airtime")
+
+    def __init__(self, wait: float, code_name: str, repeat: int, verified: Optional[bool] = None,
+                 airtime: float = 0.0):
+        self.wait = wait
+        self.code_name = code_name
+        self.repeat = repeat
+        self.airtime = airtime
+        # Whether the loopback receiver heard the frame; None without verification
+        self.verified = verified
+
+
+class TransmitScheduler:
+    """
+    Single owner of the IR transmitter
+
+    Requests are queued and sent one at a time by a worker task, so two
+    requests can never drive the emitter at once. Mode changes jump ahead of
+    queued increments, a pending mode command with the same coalesce key is
+    replaced by the newest one (latest wins), and repeated presses of the same
+    increment are folded into one back-to-back burst. A minimum gap is kept
+    between the end of one frame and the start of the next.
+
+    There is one scheduler per emitter. Each one orders its own frames, and
+    schedulers of different emitters transmit in parallel.
+
+    With a `verifier`, every frame is checked against its loopback echo and
+    resendable jobs are resent on a miss (see LoopbackVerifier).
+    """
+
+    def __init__(self, transmitter, frame_gap: float = TRANSMIT_FRAME_GAP_MS / 1000,
+                 events: Optional[EventBus] = None, emitter: str = DEFAULT_EMITTER,
+                 verifier: Optional[LoopbackVerifier] = None):
+        self.transmitter = transmitter
+        self.emitter = emitter
+        self.verifier = verifier
+        self.frame_gap = frame_gap
+        # Transmit-complete events for live clients
+        self.events = events
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._heap: list[tuple[int, int, TransmitJob]] = []
+        self._pending: Dict[str, TransmitJob] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._sequence = itertools.count()
+        self._last_frame_end = 0.0
+        self._in_flight = 0
+        self.transmitted = 0
+        self.coalesced = 0
+        self.last_wait = 0.0
+        self.max_wait = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of frames waiting to be transmitted"""
+        return len(self._heap)
+
+    def stats(self) -> Dict[str, float]:
+        """Snapshot of the queue for status endpoints"""
+        return {
+            "emitter": self.emitter,
+            "device": getattr(self.transmitter, "device", None),
+            "backend": self.transmitter.name,
+            "queue_depth": self.queue_depth,
+            "in_flight": self._in_flight,
+            "transmitted": self.transmitted,
+            "coalesced": self.coalesced,
+            "last_wait_ms": round(self.last_wait * 1000, 3),
+            "max_wait_ms": round(self.max_wait * 1000, 3)
+        }
+
+    def _ensure_worker(self) -> asyncio.AbstractEventLoop:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            # Futures from a previous loop can never be awaited again
+            self._loop = loop
+            self._heap = []
+            self._pending = {}
+            self._in_flight = 0
+            self._wakeup = asyncio.Event()
+            self._worker = start_background(loop, self._run())
+        return loop
+
+    async def submit(self, code: IRCode, carrier: Optional[int] = None,
+                     priority: int = PRIORITY_MODE, coalesce_key: Optional[str] = None,
+                     accumulate: bool = False) -> TransmitReceipt:
+        """
+        Queue a code for transmission and wait until it has been sent
+
+        coalesce_key: Pending jobs with the same key are merged. When
+            `accumulate` is set and the code matches, the press is appended
+            to the pending burst; otherwise the newest code replaces it.
+
+        Returns a receipt with the time the request spent waiting in the queue
+        and the code that went out, which differs from `code` when a newer
+        request superseded it.
+
+        Raises:
+            TransmitterError: If the transmitter fails to send the frame
+        """
+        loop = self._ensure_worker()
+        future = loop.create_future()
+        enqueued_at = loop.time()
+
+        job = self._pending.get(coalesce_key) if coalesce_key else None
+        if job is not None:
+            if accumulate and job.code.name == code.name:
+                job.repeat += 1
+            else:
+                job.code = code
+                job.carrier = carrier
+            job.waiters.append((future, enqueued_at))
+            self.coalesced += 1
+        else:
+            job = TransmitJob(code, carrier, priority, coalesce_key, accumulate)
+            job.waiters.append((future, enqueued_at))
+            heapq.heappush(self._heap, (priority, next(self._sequence), job))
+            if coalesce_key:
+                self._pending[coalesce_key] = job
+            self._wakeup.set()
+
+        try:
+            receipt = await future
+        except Exception as e:
+            annotate_transmit(code=code.name, emitter=self.emitter, backend=self.transmitter.name, error=str(e))
+            raise
+        annotate_transmit(
+            code=receipt.code_name, emitter=self.emitter, backend=self.transmitter.name, repeat=receipt.repeat,
+            queue_wait_ms=round(receipt.wait * 1000, 3), airtime_ms=round(receipt.airtime * 1000, 3),
+            verified=receipt.verified
+        )
+        return receipt
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            while not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+
+            # Keep the inter-frame gap before choosing the next job, so a mode
+            # change that arrives meanwhile still goes first
+            delay = self._last_frame_end + self.frame_gap - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            _, _, job = heapq.heappop(self._heap)
+            if job.coalesce_key and self._pending.get(job.coalesce_key) is job:
+                del self._pending[job.coalesce_key]
+
+            waiters = [(future, at) for future, at in job.waiters if not future.done()]
+            if not waiters:
+                continue
+
+            started = loop.time()
+            backend = self.transmitter.name
+            self._in_flight = 1
+            IR_IN_FLIGHT.inc()
+            verified = None
+            try:
+                if self.verifier is not None:
+                    verified = await self.verifier.transmit(
+                        self.transmitter, job.code.pulses, job.carrier, job.code.name, job.repeat,
+                        int(self.frame_gap * 1_000_000), job.resendable, job.code.source
+                    )
+                elif job.repeat == 1:
+                    await self.transmitter.send(job.code.pulses, job.carrier, source=job.code.source)
+                else:
+                    burst = join_pulse_trains(
+                        [job.code.pulses] * job.repeat, int(self.frame_gap * 1_000_000)
+                    )
+                    await self.transmitter.send(burst, job.carrier)
+            except Exception as e:
+                IR_FRAMES.inc(code_label(job.code.name), "failed")
+                IR_TRANSMIT_ERRORS.inc(backend, type(e).__name__)
+                self._publish(job, started, loop.time(), str(e))
+                for future, _ in waiters:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                self.transmitted += 1
+                airtime = loop.time() - started
+                IR_FRAMES.inc(code_label(job.code.name), "sent")
+                IR_TRANSMIT_DURATION.observe(airtime, backend)
+                self._publish(job, started, loop.time(), verified=verified)
+                for future, enqueued_at in waiters:
+                    wait = started - enqueued_at
+                    self.last_wait = wait
+                    self.max_wait = max(self.max_wait, wait)
+                    IR_QUEUE_WAIT.observe(wait)
+                    if not future.done():
+                        future.set_result(TransmitReceipt(wait, job.code.name, job.repeat, verified, airtime))
+            finally:
+                self._in_flight = 0
+                IR_IN_FLIGHT.dec()
+                self._last_frame_end = loop.time()
+
+    def _publish(self, job: TransmitJob, started: float, ended: float, error: Optional[str] = None,
+                 verified: Optional[bool] = None) -> None:
+        if self.events is None:
+            return
+        self.events.publish({
+            "type": "transmitted",
+            "emitter": self.emitter,
+            "code": job.code.name,
+            "repeat": job.repeat,
+            "success": error is None,
+            "error": error,
+            "verified": verified,
+            "airtime_ms": round((ended - started) * 1000, 3)
+        })
+
+
+_shared_schedulers: Dict[str, TransmitScheduler] = {}
+
+
+def default_emitter() -> str:
+    """
+    Emitter used by devices that do not name one: `default`, or else the first one listed
+
+    Raises:
+        ValueError: If no emitter is configured
+    """
+    devices = emitter_devices()
+    if not devices:
+        raise ValueError("TRANSMITTER_DEVICE environment variable is not set")
+    return DEFAULT_EMITTER if DEFAULT_EMITTER in devices else next(iter(devices))
+
+
+def get_scheduler(emitter: Optional[str] = None) -> TransmitScheduler:
+    """
+    Get the process-wide scheduler that owns an emitter (the default one without a name)
+
+    Raises:
+        ValueError: If the emitter is not configured
+    """
+    emitter = emitter or default_emitter()
+    scheduler = _shared_schedulers.get(emitter)
+    if scheduler is None:
+        devices = emitter_devices()
+        if emitter not in devices:
+            raise ValueError(f"Unknown emitter '{emitter}', configure it in TRANSMITTER_DEVICES")
+        scheduler = _shared_schedulers[emitter] = TransmitScheduler(
+            get_transmitter(devices[emitter]), events=get_event_bus(), emitter=emitter, verifier=get_verifier()
+        )
+    return scheduler
+
+
+def get_schedulers() -> Dict[str, TransmitScheduler]:
+    """Get the scheduler of every configured emitter"""
+    return {emitter: get_scheduler(emitter) for emitter in emitter_devices()}
+
+
+REGISTRY.gauge("ir_queue_depth", "Frames waiting in the transmit queues of all emitters",
+               function=lambda: sum(scheduler.queue_depth for scheduler in _shared_schedulers.values()))
@@ -0,0 +1,139 @@
+import asyncio
+
+import httpx
+import pytest
+
+from main import app
+from models.ac_model import ACMode, ACTempControl, ACTimerControl
+from services.ac_service import ACService, ACStateError
+from services.state_store import DeviceStateStore
+from services.tx_scheduler import TransmitScheduler
+
+GAP = 0.05
+
+
+@pytest.fixture
+def ac(fake_transmitter, tmp_path):
+    transmitter = fake_transmitter()
+    service = ACService(
+        scheduler=TransmitScheduler(transmitter, frame_gap=GAP),
+        state_store=DeviceStateStore(str(tmp_path / "state.json")),
+    )
+    return service, transmitter
+
+
+def test_heater_plan_moves_in_both_directions(ac):
+    service, _ = ac
+    service.state.mode = ACMode.HEATER_ON
+    service.state.setpoints[ACMode.HEATER_ON] = 20
+
+    assert service.plan_temperature(23) == [ACTempControl.HEATER_TEMP_UP] * 3
+    assert service.plan_temperature(18) == [ACTempControl.HEATER_TEMP_DOWN] * 2
+    assert service.plan_temperature(20) == []
+
+
+def test_aircon_can_only_be_raised(ac):
+    service, _ = ac
+    service.state.mode = ACMode.AIRCON_ON
+    service.state.setpoints[ACMode.AIRCON_ON] = 25
+
+    assert service.plan_temperature(27) == [ACTempControl.AIRCON_TEMP_UP] * 2
+    with pytest.raises(ACStateError):
+        service.plan_temperature(24)
+
+
+def test_setpoints_need_a_known_mode_and_valid_range(ac):
+    service, _ = ac
+    with pytest.raises(ACStateError):
+        service.plan_temperature(22)
+    service.state.mode = ACMode.OFF
+    with pytest.raises(ACStateError):
+        service.plan_timer(2)
+    service.state.mode = ACMode.HEATER_ON
+    with pytest.raises(ValueError):
+        service.plan_temperature(99)
+    with pytest.raises(ValueError):
+        service.plan_timer(0)
+
+
+def test_timer_plan_turns_timer_on_first(ac):
+    service, _ = ac
+    service.state.mode = ACMode.HEATER_ON
+    assert service.plan_timer(3) == [ACTimerControl.TIMER_ON] + [ACTimerControl.TIMER_UP] * 2
+    service.state.timer_hours = 5
+    assert service.plan_timer(3) == [ACTimerControl.TIMER_DOWN] * 2
+
+
+def test_temperature_goes_out_as_one_timed_burst(ac):
+    service, transmitter = ac
+    asyncio.run(service.set_ac_mode(ACMode.HEATER_ON))
+    start = service.state.setpoints[ACMode.HEATER_ON]
+
+    result = asyncio.run(service.set_temperature(start + 3))
+
+    assert result["presses"] == 3
+    assert service.state.setpoints[ACMode.HEATER_ON] == start + 3
+    assert len(transmitter.frames) == 2
+    press = service.codes.get(ACTempControl.HEATER_TEMP_UP).pulses.tolist()
+    burst = transmitter.frames[1][0]
+    assert burst == press + [int(GAP * 1_000_000)] + press + [int(GAP * 1_000_000)] + press
+    # Every gap between presses is exactly the inter-frame gap
+    gaps = burst[len(press)::len(press) + 1]
+    assert gaps == [int(GAP * 1_000_000)] * 2
+    assert sum(burst) == 3 * sum(press) + 2 * GAP * 1_000_000
+
+
+def test_relative_presses_keep_the_tracked_setpoint(ac):
+    service, transmitter = ac
+    asyncio.run(service.set_ac_mode(ACMode.HEATER_ON))
+    start = service.state.setpoints[ACMode.HEATER_ON]
+    asyncio.run(service.control_temperature(ACTempControl.HEATER_TEMP_DOWN))
+
+    result = asyncio.run(service.set_temperature(start))
+
+    assert result["presses"] == 1
+    assert transmitter.frames[-1][0] == service.codes.get(ACTempControl.HEATER_TEMP_UP).pulses.tolist()
+
+
+def test_concurrent_setpoints_are_planned_one_after_the_other(ac):
+    service, transmitter = ac
+    asyncio.run(service.set_ac_mode(ACMode.HEATER_ON))
+    service.state.setpoints[ACMode.HEATER_ON] = 22
+
+    async def scenario():
+        return await asyncio.gather(service.set_temperature(25), service.set_temperature(25))
+
+    first, second = asyncio.run(scenario())
+    assert (first["presses"], second["presses"]) == (3, 0)
+    assert service.state.setpoints[ACMode.HEATER_ON] == 25
+    assert len(transmitter.frames) == 2
+
+
+def test_timer_burst_and_off_resets_timer(ac):
+    service, transmitter = ac
+    asyncio.run(service.set_ac_mode(ACMode.AIRCON_ON))
+
+    result = asyncio.run(service.set_timer(4))
+    assert result["presses"] == 4
+    assert service.state.timer_hours == 4
+    assert len(transmitter.frames) == 2
+
+    asyncio.run(service.set_ac_mode(ACMode.OFF))
+    assert service.state.timer_hours is None
+
+
+def test_setpoint_endpoints():
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            await client.post("/ac/off")
+            conflict = await client.put("/ac/temperature/22")
+            await client.post("/ac/heater/on")
+            ok = await client.put("/ac/temperature/24")
+            out_of_range = await client.put("/ac/timer/99")
+            return conflict, ok, out_of_range
+
+    conflict, ok, out_of_range = asyncio.run(scenario())
+    assert conflict.status_code == 409
+    assert ok.status_code == 200
+    assert ok.json()["value"] == 24
+    assert out_of_range.status_code == 400
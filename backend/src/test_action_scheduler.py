@@ -0,0 +1,173 @@
+import asyncio
+import json
+from datetime import datetime
+
+import httpx
+import pytest
+
+from main import app
+from services.action_scheduler import ActionScheduler, Clock, CronExpression, ScheduleError
+from services.device_registry import UnknownDeviceActionError
+
+
+class FakeClock(Clock):
+    """Clock that only moves when the test advances it"""
+
+    def __init__(self, now: float):
+        self.now = now
+        self._waiters = []
+
+    def time(self) -> float:
+        return self.now
+
+    async def wait(self, event, timeout):
+        woken = asyncio.get_running_loop().create_future()
+        self._waiters.append((self.now + timeout, woken))
+        event_wait = asyncio.ensure_future(event.wait())
+        await asyncio.wait([woken, event_wait], return_when=asyncio.FIRST_COMPLETED)
+        event_wait.cancel()
+
+    async def advance(self, seconds: float):
+        self.now += seconds
+        for deadline, woken in self._waiters:
+            if deadline <= self.now and not woken.done():
+                woken.set_result(None)
+        self._waiters = [(deadline, woken) for deadline, woken in self._waiters if not woken.done()]
+        for _ in range(5):
+            await asyncio.sleep(0)
+
+
+class FakeEntry:
+    def __init__(self, calls, clock, device, action):
+        self.calls = calls
+        self.clock = clock
+        self.key = (device, action)
+
+    async def handler(self):
+        self.calls.append((self.key, self.clock.time()))
+        return {"success": True}
+
+
+class FakeRegistry:
+    def __init__(self, clock):
+        self.clock = clock
+        self.calls = []
+
+    def lookup(self, device, action):
+        if device not in ("light", "ac"):
+            raise UnknownDeviceActionError(device, action)
+        return FakeEntry(self.calls, self.clock, device, action)
+
+
+def local(*args) -> float:
+    return datetime(*args).timestamp()
+
+
+def test_cron_expressions_follow_cron_semantics():
+    weekdays = CronExpression("30 6 * * 1-5")
+    # Saturday 2026-10-17 -> Monday 06:30
+    assert weekdays.next_after(local(2026, 10, 17, 12, 0)) == local(2026, 10, 19, 6, 30)
+    assert weekdays.next_after(local(2026, 10, 19, 6, 30)) == local(2026, 10, 20, 6, 30)
+
+    steps = CronExpression("*/15 8-18/2 * * *")
+    assert steps.next_after(local(2026, 10, 18, 9, 50)) == local(2026, 10, 18, 10, 0)
+    assert steps.next_after(local(2026, 10, 18, 18, 45)) == local(2026, 10, 19, 8, 0)
+
+    # Both day fields restricted: either matches (the 1st, or any Sunday)
+    either = CronExpression("0 0 1 * 0")
+    assert either.next_after(local(2026, 10, 12)) == local(2026, 10, 18)
+    assert either.next_after(local(2026, 10, 26)) == local(2026, 11, 1)
+    assert CronExpression("0 12 * * 7").next_after(local(2026, 10, 18, 13)) == local(2026, 10, 25, 12)
+    # A day field that covers every day is unrestricted however it is written
+    assert CronExpression("0 0 */1 * 0").next_after(local(2026, 10, 12)) == local(2026, 10, 18)
+    assert CronExpression("0 0 1 * 0-6").next_after(local(2026, 10, 12)) == local(2026, 11, 1)
+
+    for bad in ("* * *", "61 * * * *", "a * * * *", "*/0 * * * *"):
+        with pytest.raises(ScheduleError):
+            CronExpression(bad)
+    with pytest.raises(ScheduleError):
+        CronExpression("0 0 31 2 *").next_after(local(2026, 1, 1))
+
+
+def test_recurring_runs_do_not_drift_under_load(tmp_path):
+    start = local(2026, 10, 18, 0, 0)
+    clock = FakeClock(start)
+    registry = FakeRegistry(clock)
+    scheduler = ActionScheduler(registry, tmp_path / "schedules.json", clock)
+
+    async def scenario():
+        scheduler.start()
+        for _ in range(100):
+            scheduler.add("light", "off", cron="*/5 * * * *")
+        one_shots = [scheduler.add("ac", "off", in_seconds=seconds) for seconds in range(1, 3601, 3)]
+        # Irregular ticks for six hours: the loop wakes up late every time
+        while clock.now < start + 6 * 3600:
+            await clock.advance(7.3)
+        await scheduler.stop()
+        return one_shots
+
+    one_shots = asyncio.run(scenario())
+    cron_runs = [at for key, at in registry.calls if key == ("light", "off")]
+    # 72 five-minute slots in six hours, each run once per schedule
+    assert len(cron_runs) == 100 * 72
+    # Every run lands within one tick of its slot, from the first slot to the last
+    for index, at in enumerate(sorted(cron_runs)):
+        slot = start + 300 * (index // 100 + 1)
+        assert 0 <= at - slot < 7.3
+    scheduled = [schedule.next_run for schedule in scheduler.get_schedules()]
+    assert scheduled == [start + 6 * 3600 + 300] * 100
+    shot_runs = sorted(at for key, at in registry.calls if key == ("ac", "off"))
+    assert len(shot_runs) == len(one_shots)
+    assert all(0 <= ran - shot.at < 7.3 for ran, shot in zip(shot_runs, one_shots))
+    assert scheduler.fired == len(registry.calls)
+
+
+def test_schedules_are_persisted_and_reloaded(tmp_path):
+    path = tmp_path / "schedules.json"
+    clock = FakeClock(local(2026, 10, 18, 12, 0))
+    registry = FakeRegistry(clock)
+    scheduler = ActionScheduler(registry, path, clock)
+    cron = scheduler.add("ac", "heater/on", cron="30 6 * * 1-5")
+    soon = scheduler.add("light", "off", in_seconds=60)
+    later = scheduler.add("light", "on", at=clock.now + 3600)
+    removed = scheduler.add("light", "dark", in_seconds=10)
+    scheduler.remove(removed.id)
+    with pytest.raises(ScheduleError):
+        scheduler.add("light", "off")
+    with pytest.raises(UnknownDeviceActionError):
+        scheduler.add("tv", "power", in_seconds=5)
+    with pytest.raises(ScheduleError):
+        scheduler.add("light", "off", cron="0 0 31 2 *")
+    assert len(scheduler._crons) == 1
+    assert {item["id"] for item in json.loads(path.read_text())} == {cron.id, soon.id, later.id}
+
+    # Restarted three minutes after `soon` was due and a day later
+    clock.now += 240
+    reloaded = ActionScheduler(registry, path, clock)
+    assert {schedule.id for schedule in reloaded.get_schedules()} == {cron.id, soon.id, later.id}
+    clock.now += 86400
+    reloaded = ActionScheduler(registry, path, clock)
+    assert [schedule.id for schedule in reloaded.get_schedules()] == [cron.id]
+    assert reloaded.get_schedules()[0].next_run == local(2026, 10, 20, 6, 30)
+
+
+def test_schedule_endpoints():
+    async def call():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            created = await client.post("/schedules", json={"device": "light", "action": "off", "in_seconds": 2700})
+            unknown = await client.post("/schedules", json={"device": "light", "action": "disco", "in_seconds": 5})
+            invalid = await client.post("/schedules", json={"device": "ac", "action": "off", "cron": "99 * * * *"})
+            listed = await client.get("/schedules")
+            deleted = await client.delete(f"/schedules/{created.json()['id']}")
+            missing = await client.delete(f"/schedules/{created.json()['id']}")
+            return created, unknown, invalid, listed, deleted, missing
+
+    created, unknown, invalid, listed, deleted, missing = asyncio.run(call())
+    assert created.status_code == 201
+    assert created.json()["device"] == "light"
+    assert created.json()["id"] in [schedule["id"] for schedule in listed.json()]
+    assert unknown.status_code == 404
+    assert invalid.status_code == 400
+    assert deleted.status_code == 204
+    assert missing.status_code == 404
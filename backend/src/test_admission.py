@@ -0,0 +1,100 @@
+import asyncio
+
+import httpx
+import pytest
+
+import services.admission as admission_module
+from main import app
+from services.admission import AdmissionController, AdmissionRejectedError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_buckets_refill_and_are_kept_per_client():
+    clock = FakeClock()
+    controller = AdmissionController(global_rate=10, global_burst=10, client_rate=1, client_burst=2,
+                                     max_queue=0, clock=clock)
+    for _ in range(2):
+        with controller.admit("light", "phone"):
+            pass
+    with pytest.raises(AdmissionRejectedError) as rejected:
+        controller.admit("light", "phone")
+    assert rejected.value.reason == "client"
+    assert rejected.value.retry_after == pytest.approx(1.0)
+    assert rejected.value.retry_after_header == "1"
+
+    # Other clients are unaffected, and the bucket refills at `rate`
+    with controller.admit("light", "tablet"):
+        pass
+    clock.now += 0.5
+    with pytest.raises(AdmissionRejectedError) as rejected:
+        controller.admit("light", "phone")
+    assert rejected.value.retry_after == pytest.approx(0.5)
+    clock.now += 0.5
+    with controller.admit("light", "phone"):
+        pass
+
+
+def test_device_limits_and_bounded_queue():
+    clock = FakeClock()
+    controller = AdmissionController(global_rate=0, global_burst=0, client_rate=0, client_burst=0,
+                                     max_queue=5, clock=clock)
+    controller.configure_devices({"ac": {"rate": 0.5, "burst": 1, "max_queue": 1}, "light": None})
+    with pytest.raises(ValueError):
+        controller.configure("tv", {"rps": 3})
+
+    slot = controller.admit("ac", "phone")
+    with pytest.raises(AdmissionRejectedError) as rejected:
+        controller.admit("ac", "tablet")
+    assert rejected.value.reason == "queue"
+    slot.__exit__(None, None, None)
+    assert controller.pending("ac") == 0
+
+    # Queue slot is free again, but the device bucket needs 2 s for the next token
+    with pytest.raises(AdmissionRejectedError) as rejected:
+        controller.admit("ac", "tablet")
+    assert (rejected.value.reason, rejected.value.retry_after) == ("device", pytest.approx(2.0))
+
+    # A batch takes a slot on every device, and frees them when one is refused
+    held = [controller.admit("light") for _ in range(4)]
+    with pytest.raises(AdmissionRejectedError):
+        controller.admit_all(["light", "light", "ac"])
+    assert controller.pending("light") == 4
+    with controller.admit_all(["light"]):
+        assert controller.pending("light") == 5
+    for slot in held:
+        slot.__exit__(None, None, None)
+    assert controller.pending("light") == 0
+
+
+def test_over_limit_commands_get_429_with_retry_after(monkeypatch):
+    controller = AdmissionController(global_rate=0, global_burst=0, client_rate=1, client_burst=2, max_queue=1)
+    monkeypatch.setattr(admission_module, "_shared_controller", controller)
+    monkeypatch.setenv("FAKE_IR_CTL_DELAY", "0.1")
+
+    async def call():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            # The second command finds the light's only queue slot taken
+            concurrent = await asyncio.gather(client.post("/light/on"), client.post("/light/off"))
+            # The refused command took no token, so one is left of the client's burst of two
+            allowed = await client.post("/ac/off")
+            limited = await client.post("/ac/off")
+            status = await client.get("/ac/status")
+            return concurrent, allowed, limited, status
+
+    (first, second), allowed, limited, status = asyncio.run(call())
+    assert first.status_code == 200
+    assert second.status_code == 429
+    assert second.json()["detail"].startswith("Too many requests for light (queue limit)")
+    assert allowed.status_code == 200
+    assert limited.status_code == 429
+    assert limited.headers["retry-after"] == "1"
+    assert 0 < limited.json()["retry_after_s"] <= 1
+    # Read endpoints are never limited
+    assert status.status_code == 200
@@ -0,0 +1,67 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from main import app
+
+
+def _client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+def test_reads_stay_fast_during_slow_transmit(monkeypatch):
+    monkeypatch.setenv("FAKE_IR_CTL_DELAY", "1")
+
+    async def scenario():
+        async with _client() as client:
+            started = time.perf_counter()
+            transmit = asyncio.create_task(client.post("/ac/aircon/on"))
+            # Give the handler time to spawn ir-ctl before issuing reads
+            await asyncio.sleep(0.1)
+
+            read_started = time.perf_counter()
+            status = await client.get("/ac/status")
+            modes = await client.get("/light/modes")
+            read_elapsed = time.perf_counter() - read_started
+
+            assert status.status_code == 200
+            assert modes.status_code == 200
+            assert not transmit.done()
+
+            response = await transmit
+            assert response.status_code == 200
+            assert time.perf_counter() - started >= 1
+            return read_elapsed
+
+    read_elapsed = asyncio.run(scenario())
+    assert read_elapsed < 0.5
+
+
+def test_transmitter_status_answers_during_slow_transmit(monkeypatch):
+    monkeypatch.setenv("FAKE_IR_CTL_DELAY", "0.5")
+
+    async def scenario():
+        async with _client() as client:
+            transmit = asyncio.create_task(client.post("/light/on"))
+            await asyncio.sleep(0.1)
+            status = await client.get("/transmitter/status")
+            await transmit
+            return status
+
+    status = asyncio.run(scenario())
+    assert status.status_code == 200
+    assert status.json()["in_flight"] == 1
+
+
+def test_failed_transmit_maps_to_500(monkeypatch):
+    monkeypatch.setenv("FAKE_IR_CTL_EXIT", "3")
+
+    async def scenario():
+        async with _client() as client:
+            return await client.post("/light/off")
+
+    response = asyncio.run(scenario())
+    assert response.status_code == 500
+    assert "code 3" in response.json()["detail"]
@@ -0,0 +1,129 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from main import app
+from models.batch_model import BatchStep
+from services.ac_service import ACService
+from services.batch_service import BatchService, BatchValidationError, SceneNotFoundError
+from services.light_service import LightService
+from services.state_store import DeviceStateStore
+from services.transmitter import parse_mode2
+from services.tx_scheduler import TransmitScheduler
+
+
+@pytest.fixture
+def batch(tmp_path, fake_transmitter):
+    transmitter = fake_transmitter()
+    scheduler = TransmitScheduler(transmitter, frame_gap=0.04)
+    store = DeviceStateStore(str(tmp_path / "state.json"))
+    service = BatchService(
+        LightService(scheduler=scheduler, state_store=store),
+        ACService(scheduler=scheduler, state_store=store),
+        scenes_file=str(tmp_path / "scenes.json"),
+    )
+    return service, transmitter
+
+
+def _steps(*pairs):
+    return [BatchStep(device=device, action=action) for device, action in pairs]
+
+
+def test_batch_goes_out_as_one_train_with_gaps(batch, ir_code_dir):
+    service, transmitter = batch
+    steps = _steps(("light", "dark"), ("ac", "heater_on"), ("ac", "timer_on"))
+
+    result = asyncio.run(service.run(steps))
+
+    assert result["success"] is True
+    assert [step["success"] for step in result["steps"]] == [True, True, True]
+    assert len(transmitter.frames) == 1
+    code = parse_mode2((ir_code_dir / "light_dark.txt").read_text()).tolist()
+    assert transmitter.frames[0][0] == code + [40000] + code + [40000] + code
+    assert transmitter.frames[0][1] == 38000
+    assert service.light_service.state.mode == "dark"
+    assert service.ac_service.state.mode == "heater_on"
+    assert service.ac_service.state.timer_hours is not None
+
+
+def test_batch_validates_every_step_before_sending(batch):
+    service, transmitter = batch
+    steps = _steps(("light", "on"), ("light", "disco"), ("ac", "turbo"))
+
+    with pytest.raises(BatchValidationError) as excinfo:
+        asyncio.run(service.run(steps))
+
+    assert len(excinfo.value.errors) == 2
+    assert transmitter.frames == []
+
+
+def test_failed_transmit_is_reported_per_step(tmp_path, fake_transmitter):
+    scheduler = TransmitScheduler(fake_transmitter(fail=True), frame_gap=0)
+    service = BatchService(
+        LightService(scheduler=scheduler),
+        ACService(scheduler=scheduler),
+        scenes_file=str(tmp_path / "scenes.json"),
+    )
+
+    result = asyncio.run(service.run(_steps(("light", "off"), ("ac", "off"))))
+
+    assert result["success"] is False
+    assert all(not step["success"] for step in result["steps"])
+
+
+def test_scenes_persist_and_run(batch, tmp_path):
+    service, transmitter = batch
+    asyncio.run(service.save_scene("evening", _steps(("light", "dark"), ("ac", "heater_on"))))
+
+    stored = json.loads((tmp_path / "scenes.json").read_text())
+    assert stored == {"evening": [
+        {"device": "light", "action": "dark"},
+        {"device": "ac", "action": "heater_on"},
+    ]}
+
+    reloaded = BatchService(service.light_service, service.ac_service, str(tmp_path / "scenes.json"))
+    result = asyncio.run(reloaded.run_scene("evening"))
+    assert result["success"] is True
+    assert len(transmitter.frames) == 1
+
+    asyncio.run(reloaded.delete_scene("evening"))
+    with pytest.raises(SceneNotFoundError):
+        asyncio.run(reloaded.run_scene("evening"))
+
+
+def test_concurrent_scene_writes_leave_the_latest_snapshot(batch, tmp_path):
+    service, _ = batch
+
+    async def scenario():
+        await asyncio.gather(*(
+            service.save_scene(f"scene{index}", _steps(("light", "dark"))) for index in range(20)
+        ))
+        await service.delete_scene("scene0")
+
+    asyncio.run(scenario())
+    stored = json.loads((tmp_path / "scenes.json").read_text())
+    assert sorted(stored) == sorted(f"scene{index}" for index in range(1, 20))
+
+
+def test_batch_endpoint():
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            ok = await client.post("/batch", json={"steps": [
+                {"device": "light", "action": "off"},
+                {"device": "ac", "action": "off"},
+            ]})
+            bad = await client.post("/batch", json={"steps": [{"device": "light", "action": "disco"}]})
+            missing = await client.post("/scenes/nope")
+            saved = await client.put("/scenes/bedtime", json={"steps": [{"device": "light", "action": "off"}]})
+            deleted = await client.delete("/scenes/bedtime")
+            return ok, bad, missing, saved, deleted
+
+    ok, bad, missing, saved, deleted = asyncio.run(scenario())
+    assert saved.json() == {"name": "bedtime", "steps": [{"device": "light", "action": "off"}]}
+    assert deleted.status_code == 204
+    assert ok.status_code == 200
+    assert [step["action"] for step in ok.json()["steps"]] == ["off", "off"]
+    assert bad.status_code == 400
+    assert missing.status_code == 404
@@ -0,0 +1,90 @@
+import asyncio
+import os
+import time
+from array import array
+from pathlib import Path
+
+import pytest
+
+from models.ac_model import ACMode, ACTempControl, ACTimerControl
+from models.light_model import LightMode
+from services.ac_service import ACResourceNotFoundError, ACService
+from services.code_library import CodeLibrary
+
+
+def _write_code(path: Path, pulses: list[int], mtime_offset: int = 0) -> None:
+    lines = [f"{'pulse' if i % 2 == 0 else 'space'} {d}" for i, d in enumerate(pulses)]
+    path.write_text("\n".join(lines) + "\n")
+    if mtime_offset:
+        stat = path.stat()
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + mtime_offset))
+
+
+def test_library_parses_every_code_once(tmp_path):
+    _write_code(tmp_path / "light_on.txt", [9000, 4500, 560])
+    _write_code(tmp_path / "light_off.txt", [9000, 4500, 560, 560, 560])
+    (tmp_path / "light_unknown.txt").write_text("pulse 1\n")
+    (tmp_path / "ac_off.txt").write_text("pulse 1\n")
+
+    library = CodeLibrary(str(tmp_path), "light", [LightMode])
+
+    assert library.get(LightMode.ON).pulses == array("I", [9000, 4500, 560])
+    assert library.get(LightMode.OFF).pulses.typecode == "I"
+    assert LightMode.DARK not in library
+
+
+def test_lookup_does_no_filesystem_io(tmp_path, monkeypatch):
+    _write_code(tmp_path / "light_on.txt", [9000, 4500, 560])
+    library = CodeLibrary(str(tmp_path), "light", [LightMode])
+
+    def fail(*args, **kwargs):
+        raise AssertionError("filesystem access on the hot path")
+
+    monkeypatch.setattr(Path, "stat", fail)
+    monkeypatch.setattr(Path, "exists", fail)
+    monkeypatch.setattr(Path, "read_text", fail)
+    assert library.get(LightMode.ON).pulses[0] == 9000
+
+
+def test_rescan_swaps_rerecorded_and_removed_codes(tmp_path):
+    _write_code(tmp_path / "light_on.txt", [9000, 4500, 560])
+    _write_code(tmp_path / "light_off.txt", [100])
+    library = CodeLibrary(str(tmp_path), "light", [LightMode])
+    original = library.get(LightMode.ON)
+
+    assert library.rescan() == []
+    _write_code(tmp_path / "light_on.txt", [8000, 4000, 500], mtime_offset=1_000_000)
+    (tmp_path / "light_off.txt").unlink()
+
+    assert set(library.rescan()) == {LightMode.ON, LightMode.OFF}
+    assert library.get(LightMode.ON) is not original
+    assert library.get(LightMode.ON).pulses.tolist() == [8000, 4000, 500]
+    assert LightMode.OFF not in library
+
+
+def test_watcher_picks_up_new_recording(tmp_path):
+    library = CodeLibrary(str(tmp_path), "light", [LightMode])
+    library.start_watching()
+    try:
+        # Let the watcher register before the file appears
+        time.sleep(0.3)
+        _write_code(tmp_path / "light_dark.txt", [7000, 3500, 500])
+        deadline = time.monotonic() + 10
+        while LightMode.DARK not in library and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        library.stop_watching()
+    assert library.get(LightMode.DARK).pulses.tolist() == [7000, 3500, 500]
+
+
+def test_ac_service_sends_cached_pulses(tmp_path, fake_transmitter):
+    _write_code(tmp_path / "ac_heater_on.txt", [3400, 1700, 430])
+    transmitter = fake_transmitter()
+    service = ACService(transmitter=transmitter)
+    service.codes = CodeLibrary(str(tmp_path), "ac", [ACMode, ACTempControl, ACTimerControl])
+
+    asyncio.run(service.set_ac_mode(ACMode.HEATER_ON))
+    assert transmitter.frames[0][0] == [3400, 1700, 430]
+
+    with pytest.raises(ACResourceNotFoundError):
+        asyncio.run(service.set_ac_mode(ACMode.OFF))
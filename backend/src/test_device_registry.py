@@ -0,0 +1,100 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from main import app
+from services.device_registry import DeviceRegistry, UnknownDeviceActionError
+from services.state_store import DeviceStateStore
+from services.tx_scheduler import TransmitScheduler
+
+
+def _client():
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+@pytest.fixture
+def tv_registry(tmp_path, fake_transmitter):
+    codes = tmp_path / "tv"
+    codes.mkdir()
+    (codes / "tv_power.txt").write_text("pulse 2400\nspace 600\npulse 1200\n")
+    (codes / "tv_vol_up.txt").write_text("pulse 2400\nspace 600\npulse 600\n")
+    transmitter = fake_transmitter()
+    registry = DeviceRegistry(
+        scheduler=TransmitScheduler(transmitter, frame_gap=0),
+        state_store=DeviceStateStore(str(tmp_path / "state.json")),
+    )
+    registry.load({"devices": {"tv": {
+        "resources_path": str(codes),
+        "carrier": 40000,
+        "actions": {"power": "power", "volume/up": "vol_up", "volume/down": "vol_down"},
+    }}})
+    return registry, transmitter
+
+
+def test_generic_device_dispatches_by_manifest(tv_registry):
+    registry, transmitter = tv_registry
+
+    result = asyncio.run(registry.lookup("tv", "volume/up").handler())
+
+    assert result["success"] is True
+    assert transmitter.frames[0][:2] == ([2400, 600, 600], 40000)
+    assert registry.services["tv"].state.last_action == "vol_up"
+    assert len(registry) == 3
+
+
+def test_unknown_actions_and_missing_codes(tv_registry):
+    registry, _ = tv_registry
+    with pytest.raises(UnknownDeviceActionError):
+        registry.lookup("tv", "channel/up")
+    with pytest.raises(Exception, match="Resource file not found"):
+        asyncio.run(registry.lookup("tv", "volume/down").handler())
+
+
+def test_manifest_rejects_unknown_codes_and_services():
+    with pytest.raises(ValueError):
+        DeviceRegistry({"light": SimpleNamespace(carrier=None, set_light_mode=None)}).load(
+            {"devices": {"light": {"service": "light", "actions": {"x": "strobe"}}}}
+        )
+    with pytest.raises(ValueError):
+        DeviceRegistry().load({"devices": {"fan": {"service": "fan", "actions": {}}}})
+
+
+def test_default_manifest_keeps_every_existing_url():
+    paths = [
+        "/light/all-bright", "/light/bright", "/light/dark", "/light/off", "/light/on",
+        "/ac/aircon/on", "/ac/heater/on", "/ac/off",
+        "/ac/aircon/temp/up", "/ac/heater/temp/up", "/ac/heater/temp/down",
+        "/ac/timer/on", "/ac/timer/up", "/ac/timer/down",
+    ]
+
+    async def scenario():
+        async with _client() as client:
+            responses = []
+            for path in paths:
+                responses.append(await client.get(path))
+                responses.append(await client.post(path))
+            return responses
+
+    responses = asyncio.run(scenario())
+    assert [response.status_code for response in responses] == [200] * len(paths) * 2
+    assert responses[0].json()["mode"] == "all_bright"
+    assert responses[-1].json()["action"] == "timer_down"
+
+
+def test_fixed_routes_win_and_unknown_actions_404():
+    async def scenario():
+        async with _client() as client:
+            return (
+                await client.get("/light/modes"),
+                await client.get("/ac/status"),
+                await client.post("/light/strobe"),
+                await client.get("/devices"),
+            )
+
+    modes, status, unknown, devices = asyncio.run(scenario())
+    assert modes.json() == ["all_bright", "bright", "dark", "off", "on"]
+    assert "state" in status.json()
+    assert unknown.status_code == 404
+    assert {device["name"] for device in devices.json()} == {"light", "ac"}
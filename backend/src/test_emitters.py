@@ -0,0 +1,143 @@
+import asyncio
+import time
+from array import array
+
+import httpx
+import pytest
+
+import services.transmitter as transmitter_module
+import services.tx_scheduler as tx_scheduler
+from main import app
+from models.batch_model import BatchStep
+from services.ac_service import ACService
+from services.batch_service import BatchService
+from services.device_registry import DeviceRegistry
+from services.light_service import LightService
+from services.state_store import DeviceStateStore
+from services.transmitter import LircTransmitter, parse_emitters
+from services.tx_scheduler import TransmitScheduler
+
+
+class BlockingLircTransmitter(LircTransmitter):
+    """Writes to a plain file, blocking for the airtime like a real LIRC device"""
+
+    def __init__(self, device: str, airtime: float):
+        super().__init__(device)
+        self.airtime = airtime
+
+    def _write(self, pulses, carrier):
+        time.sleep(self.airtime)
+        super()._write(pulses, carrier)
+
+
+def written(path) -> list[int]:
+    frames = array("I")
+    frames.frombytes(path.read_bytes())
+    return frames.tolist()
+
+
+@pytest.fixture
+def emitters(tmp_path):
+    """Two emitters writing to their own device files"""
+    devices = {name: tmp_path / f"lirc_{name}" for name in ("living", "bedroom")}
+    for path in devices.values():
+        path.touch()
+    schedulers = {
+        name: TransmitScheduler(BlockingLircTransmitter(str(path), airtime=0.1), frame_gap=0.01, emitter=name)
+        for name, path in devices.items()
+    }
+    return devices, schedulers
+
+
+def test_emitter_mapping_is_parsed():
+    assert parse_emitters("living=/dev/lirc0, bedroom = /dev/lirc2,") == {
+        "living": "/dev/lirc0", "bedroom": "/dev/lirc2"
+    }
+    assert parse_emitters(None) == {}
+    for bad in ("living", "=/dev/lirc0", "a=/dev/lirc0,a=/dev/lirc1"):
+        with pytest.raises(ValueError):
+            parse_emitters(bad)
+
+
+def test_devices_on_different_emitters_transmit_in_parallel(tmp_path, emitters):
+    devices, schedulers = emitters
+    for device in ("tv", "fan"):
+        codes = tmp_path / device
+        codes.mkdir()
+        (codes / f"{device}_power.txt").write_text("pulse 2400\nspace 600\npulse 1200\n")
+        (codes / f"{device}_up.txt").write_text("pulse 2400\nspace 600\npulse 600\n")
+    registry = DeviceRegistry(state_store=DeviceStateStore(str(tmp_path / "state.json")), schedulers=schedulers)
+    registry.load({"devices": {
+        device: {"resources_path": str(tmp_path / device), "emitter": emitter,
+                 "actions": {"power": "power", "up": "up"}}
+        for device, emitter in (("tv", "living"), ("fan", "bedroom"))
+    }})
+
+    async def scenario():
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            registry.lookup(device, action).handler()
+            for action in ("power", "up", "up")
+            for device in ("tv", "fan")
+        ))
+        return time.perf_counter() - started
+
+    elapsed = asyncio.run(scenario())
+    # Three frames per emitter, both emitters at once
+    assert elapsed < 0.5
+    for path in devices.values():
+        assert written(path) == [2400, 600, 1200, 2400, 600, 600, 2400, 600, 600]
+    assert {device["name"]: device["emitter"] for device in registry.get_devices()} == {
+        "tv": "living", "fan": "bedroom"
+    }
+    with pytest.raises(ValueError, match="Unknown emitter 'attic'"):
+        registry.load({"devices": {"lamp": {"emitter": "attic", "actions": {}}}})
+
+
+def test_batch_runs_each_emitter_in_order_and_emitters_in_parallel(tmp_path, emitters):
+    devices, schedulers = emitters
+    store = DeviceStateStore(str(tmp_path / "state.json"))
+    batch = BatchService(
+        LightService(scheduler=schedulers["living"], state_store=store),
+        ACService(scheduler=schedulers["bedroom"], state_store=store),
+        scenes_file=str(tmp_path / "scenes.json")
+    )
+    steps = [BatchStep(device=device, action=action) for device, action in (
+        ("light", "on"), ("ac", "heater_on"), ("light", "dark"), ("ac", "heater_temp_up")
+    )]
+
+    async def scenario():
+        started = time.perf_counter()
+        result = await batch.run(steps)
+        return result, time.perf_counter() - started
+
+    result, elapsed = asyncio.run(scenario())
+    assert result["success"] is True
+    assert [(step["device"], step["action"]) for step in result["steps"]] == [
+        (step.device.value, step.action) for step in steps
+    ]
+    # Each emitter sends its steps as one joined train, both at once
+    assert elapsed < 0.18
+    assert schedulers["living"].transmitted == schedulers["bedroom"].transmitted == 1
+    assert all(written(path) for path in devices.values())
+
+
+def test_shared_schedulers_follow_transmitter_devices(monkeypatch, tmp_path):
+    monkeypatch.setattr(transmitter_module, "TRANSMITTER_DEVICES", f"living={tmp_path}/lirc0,bedroom={tmp_path}/lirc2")
+    monkeypatch.setattr(transmitter_module, "TRANSMITTER_DEVICE", None)
+    monkeypatch.setattr(transmitter_module, "_shared_transmitters", {})
+    monkeypatch.setattr(tx_scheduler, "_shared_schedulers", {})
+
+    assert tx_scheduler.get_scheduler() is tx_scheduler.get_scheduler("living")
+    assert tx_scheduler.get_scheduler("bedroom").transmitter.device == f"{tmp_path}/lirc2"
+    with pytest.raises(ValueError):
+        tx_scheduler.get_scheduler("attic")
+
+    async def call():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/transmitter/status")
+
+    status = asyncio.run(call()).json()
+    assert status["emitter"] == "living"
+    assert [emitter["emitter"] for emitter in status["emitters"]] == ["living", "bedroom"]
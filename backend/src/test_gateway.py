@@ -0,0 +1,263 @@
+import asyncio
+import socket
+import threading
+import time
+
+import httpx
+import pytest
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+import services.gateway as gateway_module
+from models.gateway_model import GatewayBatchStep
+from routers import gateway_router
+from services.gateway import Gateway, GatewayValidationError, NodeUnavailableError, parse_nodes
+
+
+def make_node(name: str, calls: list) -> FastAPI:
+    """Stand-in Home Controller that records what it is asked to do"""
+    node = FastAPI()
+
+    @node.get("/")
+    async def root():
+        return {"status": "running"}
+
+    @node.api_route("/{path:path}", methods=["GET", "POST", "PUT"])
+    async def action(path: str, request: Request):
+        calls.append((request.method, path, request.client.port, request.headers.get("idempotency-key")))
+        if path == "batch":
+            await asyncio.sleep(0.2)
+            steps = (await request.json())["steps"]
+            return {"success": True, "steps": [{**step, "success": True, "message": f"Sent by {name}"}
+                                               for step in steps]}
+        if path == "light/status":
+            headers = {"ETag": '"v1"', "Cache-Control": "no-cache"}
+            if request.headers.get("if-none-match") == '"v1"':
+                return Response(status_code=304, headers=headers)
+            return JSONResponse({"node": name, "mode": "on"}, headers=headers)
+        if path == "light/busy":
+            return JSONResponse({"detail": "Too many commands"}, status_code=429, headers={"Retry-After": "3"})
+        if path == "light/slow":
+            await asyncio.sleep(0.5)
+        if path == "ac/temperature":
+            return {"node": name, "temperature": (await request.json())["temperature"]}
+        return {"node": name, "path": path}
+
+    return node
+
+
+@pytest.fixture
+def nodes():
+    """Two stand-in nodes served by uvicorn, plus the URL of a port nobody listens on"""
+    servers, urls, calls = [], {}, {}
+    for name in ("living", "bedroom"):
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        calls[name] = []
+        server = uvicorn.Server(uvicorn.Config(make_node(name, calls[name]), log_level="warning"))
+        thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+        thread.start()
+        servers.append((server, thread))
+        urls[name] = f"http://127.0.0.1:{sock.getsockname()[1]}"
+    while not all(server.started for server, _ in servers):
+        time.sleep(0.01)
+    closed = socket.socket()
+    closed.bind(("127.0.0.1", 0))
+    urls["attic"] = f"http://127.0.0.1:{closed.getsockname()[1]}"
+    closed.close()
+    yield urls, calls
+    for server, thread in servers:
+        server.should_exit = True
+        thread.join()
+
+
+@pytest.fixture
+def gateway_app(nodes, monkeypatch):
+    urls, calls = nodes
+    gateway = Gateway(urls, health_interval=60, timeout=2)
+    monkeypatch.setattr(gateway_module, "_shared_gateway", gateway)
+    app = FastAPI()
+    app.include_router(gateway_router.router)
+    return app, gateway, calls
+
+
+def _client(app):
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+def test_node_mapping_is_parsed():
+    assert parse_nodes("living=http://10.0.0.2:8000/, bedroom=https://pi.local") == {
+        "living": "http://10.0.0.2:8000", "bedroom": "https://pi.local"
+    }
+    for bad in ("living", "living=10.0.0.2", "a=http://x,a=http://y"):
+        with pytest.raises(ValueError):
+            parse_nodes(bad)
+
+
+def test_requests_are_forwarded_over_pooled_connections(gateway_app):
+    app, gateway, calls = gateway_app
+
+    async def scenario():
+        async with _client(app) as client:
+            responses = [await client.post("/nodes/living/light/on", headers={"Idempotency-Key": "k1"})
+                         for _ in range(3)]
+            responses.append(await client.put("/nodes/bedroom/ac/temperature", json={"temperature": 21}))
+            responses.append(await client.post("/nodes/living/transmitter/status"))
+            responses.append(await client.post("/nodes/garage/light/on"))
+        await gateway.stop()
+        return responses
+
+    *light, ac, blocked, unknown = asyncio.run(scenario())
+    assert [response.json() for response in light] == [{"node": "living", "path": "light/on"}] * 3
+    assert ac.json() == {"node": "bedroom", "temperature": 21}
+    assert blocked.status_code == 404
+    assert unknown.status_code == 404
+    # Every forwarded request reused the same keep-alive connection
+    assert {port for _, _, port, _ in calls["living"]} == {calls["living"][0][2]}
+    assert calls["living"][0][3] == "k1"
+
+
+def test_node_response_headers_and_conditional_requests_pass_through(gateway_app):
+    app, gateway, calls = gateway_app
+
+    async def scenario():
+        async with _client(app) as client:
+            status = await client.get("/nodes/living/light/status")
+            cached = await client.get("/nodes/living/light/status", headers={"If-None-Match": status.headers["etag"]})
+            busy = await client.post("/nodes/living/light/busy")
+        await gateway.stop()
+        return status, cached, busy
+
+    status, cached, busy = asyncio.run(scenario())
+    assert status.json() == {"node": "living", "mode": "on"}
+    assert status.headers["etag"] == '"v1"' and status.headers["cache-control"] == "no-cache"
+    assert status.headers["content-type"] == "application/json"
+    assert cached.status_code == 304 and cached.content == b""
+    assert busy.status_code == 429 and busy.headers["retry-after"] == "3"
+
+
+def test_dead_nodes_are_skipped_until_a_health_check_passes(gateway_app):
+    app, gateway, calls = gateway_app
+
+    async def scenario():
+        async with _client(app) as client:
+            first = await client.post("/nodes/attic/light/on")
+            started = time.perf_counter()
+            second = await client.post("/nodes/attic/light/on")
+            skipped_in = time.perf_counter() - started
+            await gateway.check_all()
+            statuses = (await client.get("/nodes")).json()
+        await gateway.stop()
+        return first, second, skipped_in, statuses
+
+    first, second, skipped_in, statuses = asyncio.run(scenario())
+    assert first.status_code == second.status_code == 503
+    assert skipped_in < 0.05
+    healthy = {status["name"]: status["healthy"] for status in statuses}
+    assert healthy == {"living": True, "bedroom": True, "attic": False}
+    assert "ConnectError" in next(status["last_error"] for status in statuses if status["name"] == "attic")
+
+
+def test_slow_answers_time_out_without_marking_the_node_down(nodes, monkeypatch):
+    urls, calls = nodes
+    gateway = Gateway(urls, health_interval=60, timeout=0.2)
+    monkeypatch.setattr(gateway_module, "_shared_gateway", gateway)
+    app = FastAPI()
+    app.include_router(gateway_router.router)
+
+    async def scenario():
+        async with _client(app) as client:
+            slow = await client.post("/nodes/living/light/slow")
+            after = await client.post("/nodes/living/light/on")
+        await gateway.stop()
+        return slow, after
+
+    slow, after = asyncio.run(scenario())
+    assert slow.status_code == 504
+    assert after.status_code == 200
+    assert gateway.nodes["living"].healthy
+
+
+def test_workers_that_do_not_poll_only_check_nodes_found_down(nodes):
+    urls, calls = nodes
+    gateway = Gateway(urls, health_interval=0.05, timeout=2)
+
+    async def scenario():
+        gateway.start(poll=False)
+        await asyncio.sleep(0.1)
+        polled = len(calls["living"])
+        with pytest.raises(NodeUnavailableError):
+            await gateway.forward("attic", "POST", "/light/on")
+        recovering = set(gateway._recovering)
+        await gateway.stop()
+        return polled, recovering
+
+    polled, recovering = asyncio.run(scenario())
+    assert gateway._health_task is None and polled == 0
+    assert recovering == {"attic"}
+
+
+def test_clients_are_closed_with_their_event_loop(nodes):
+    urls, calls = nodes
+    gateway = Gateway(urls, health_interval=60, timeout=2)
+
+    async def forward():
+        await gateway.forward("living", "POST", "/light/on")
+        return gateway.nodes["living"].client
+
+    # Never stopped: the loop shutting down closes the pooled connections
+    first = asyncio.run(forward())
+    assert first.is_closed
+    second = asyncio.run(forward())
+    assert second is not first and second.is_closed
+    assert len(calls["living"]) == 2
+
+
+def test_batch_fans_out_to_nodes_concurrently(gateway_app):
+    app, gateway, calls = gateway_app
+    steps = [
+        {"node": "living", "device": "light", "action": "on"},
+        {"node": "bedroom", "device": "ac", "action": "heater_on"},
+        {"node": "living", "device": "ac", "action": "off"},
+        {"node": "attic", "device": "light", "action": "off"},
+    ]
+
+    async def scenario():
+        async with _client(app) as client:
+            # Open the pooled connections first, so only the fan-out is timed
+            await gateway.check_all()
+            started = time.perf_counter()
+            response = await client.post("/nodes/batch", json={"steps": steps})
+            elapsed = time.perf_counter() - started
+            invalid = await client.post("/nodes/batch", json={"steps": [{**steps[0], "node": "garage"}]})
+        await gateway.stop()
+        return response, elapsed, invalid
+
+    response, elapsed, invalid = asyncio.run(scenario())
+    body = response.json()
+    assert elapsed < 0.35
+    assert body["success"] is False
+    assert [(step["node"], step["action"], step["success"]) for step in body["steps"]] == [
+        ("living", "on", True), ("bedroom", "heater_on", True), ("living", "off", True), ("attic", "off", False)
+    ]
+    assert body["steps"][0]["message"] == "Sent by living"
+    assert len([call for call in calls["living"] if call[1] == "batch"]) == 1
+    assert invalid.status_code == 400
+    with pytest.raises(GatewayValidationError):
+        asyncio.run(gateway.run_batch([GatewayBatchStep(node="garage", device="light", action="on")]))
+
+
+def test_batch_reports_node_errors_that_are_not_json():
+    gateway = Gateway({"living": "http://living", "bedroom": "http://bedroom"})
+    bodies = {"living": {"content": b"<html>502 Bad Gateway</html>"}, "bedroom": {"json": ["busy"]}}
+
+    async def forward(name, *args, **kwargs):
+        return httpx.Response(502, **bodies[name])
+
+    gateway.forward = forward
+    steps = [GatewayBatchStep(node=name, device="light", action="on") for name in bodies]
+    result = asyncio.run(gateway.run_batch(steps))
+    assert [step["message"] for step in result["steps"]] == [
+        "Node returned 502: <html>502 Bad Gateway</html>", 'Node returned 502: ["busy"]'
+    ]
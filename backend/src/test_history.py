@@ -0,0 +1,107 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from main import app
+from services.history import MAX_PENDING, HistoryError, HistoryStore, split_interval
+
+# 22:30 local time on a day without a DST change
+BASE = time.mktime((2026, 1, 5, 22, 30, 0, 0, 0, -1))
+MIDNIGHT = time.mktime((2026, 1, 6, 0, 0, 0, 0, 0, -1))
+
+
+class FakeClock:
+    def __init__(self, now: float):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_intervals_are_split_at_local_hours_and_days():
+    assert list(split_interval(BASE, BASE + 3 * 3600, "day")) == [
+        (MIDNIGHT - 86400, 5400), (MIDNIGHT, 5400)
+    ]
+    assert [seconds for _, seconds in split_interval(BASE, BASE + 3 * 3600, "hour")] == [1800, 3600, 3600, 1800]
+
+
+def test_mode_time_is_rolled_up_per_day_including_the_open_interval(tmp_path):
+    clock = FakeClock(BASE + 5 * 3600)
+    store = HistoryStore(str(tmp_path / "history.db"), flush_interval=0, clock=clock)
+
+    async def scenario():
+        store.record("ac", "heater_on", "heater_on", at=BASE)
+        store.record("ac", "heater_temp_up", at=BASE + 600)
+        store.record("ac", "off", "off", at=BASE + 3 * 3600)
+        store.record("light", "on", "on", at=BASE + 4 * 3600)
+        usage = await store.get_usage("ac", BASE - 86400, clock.now, "day")
+        events = await store.get_events(None, BASE, clock.now, 10)
+        return usage, events
+
+    usage, events = asyncio.run(scenario())
+    assert [event["action"] for event in events] == ["on", "off", "heater_temp_up", "heater_on"]
+    heater = [(row["start"], row["seconds"], row["switches"]) for row in usage["rows"] if row["mode"] == "heater_on"]
+    assert heater == [(MIDNIGHT - 86400, 5400, 1), (MIDNIGHT, 5400, 0)]
+    # Off since 01:30, counted up to the current time
+    assert usage["totals"] == {"ac": {"heater_on": 10800, "off": 7200}}
+
+
+def test_a_full_buffer_wakes_the_single_write_behind_task(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.db"), flush_interval=60, clock=FakeClock(BASE))
+
+    async def scenario():
+        tasks = set()
+        for index in range(20 * MAX_PENDING):
+            store.record("light", "on", at=BASE + index)
+            tasks.add(store._flush_task)
+            if index % 50 == 0:
+                await asyncio.sleep(0)
+        for _ in range(100):
+            if len(store._pending) < MAX_PENDING:
+                break
+            await asyncio.sleep(0.01)
+        settled = len(store._pending), len(asyncio.all_tasks())
+        await store.flush()
+        return len(tasks), settled
+
+    task_count, (pending, running) = asyncio.run(scenario())
+    # Without the wake-up the 60 s window would still be open; what arrived during the
+    # last write is not a full batch and waits for the interval
+    assert pending < MAX_PENDING
+    assert task_count <= 20 and running <= 2
+    assert store._connection().execute("SELECT COUNT(*) FROM events").fetchone()[0] == 20 * MAX_PENDING
+
+
+def test_history_survives_a_restart_and_uses_wal(tmp_path):
+    path = str(tmp_path / "history.db")
+    first = HistoryStore(path, clock=FakeClock(BASE))
+    first.record("light", "dark", "dark", at=BASE)
+    first.close()
+
+    clock = FakeClock(BASE + 1200)
+    second = HistoryStore(path, clock=clock)
+    second.record("light", "off", "off", at=BASE + 600)
+    usage = asyncio.run(second.get_usage("light", BASE, clock.now, "hour"))
+
+    assert usage["totals"] == {"light": {"dark": 600, "off": 600}}
+    assert second._connection().execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    with pytest.raises(HistoryError):
+        asyncio.run(second.get_usage("light", BASE, clock.now, "week"))
+
+
+def test_commands_are_queryable_over_http():
+    async def call():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            await client.post("/ac/aircon/on")
+            events = await client.get("/history/events", params={"device": "ac", "limit": 1})
+            usage = await client.get("/history/usage", params={"device": "ac", "bucket": "hour"})
+            invalid = await client.get("/history/usage", params={"start": 100, "end": 50})
+            return events, usage, invalid
+
+    events, usage, invalid = asyncio.run(call())
+    assert events.json()[0]["action"] == "aircon_on"
+    assert events.json()[0]["mode"] == "aircon_on"
+    assert "aircon_on" in usage.json()["totals"]["ac"]
+    assert invalid.status_code == 400
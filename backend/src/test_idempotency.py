@@ -0,0 +1,156 @@
+import asyncio
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from main import app
+from services.idempotency import IdempotencyCache, IdempotencyMiddleware
+from services.tx_scheduler import get_scheduler
+
+
+def make_app(cache: IdempotencyCache):
+    counting = FastAPI()
+    counting.add_middleware(IdempotencyMiddleware, cache=cache)
+    calls = []
+
+    @counting.post("/press/{button}")
+    async def press(button: str, request: Request):
+        calls.append((button, await request.body()))
+        await asyncio.sleep(0.05)
+        return {"button": button, "presses": len(calls)}
+
+    @counting.get("/status")
+    async def status():
+        calls.append(("status", b""))
+        return {"ok": True}
+
+    return counting, calls
+
+
+async def post_all(target, requests):
+    transport = httpx.ASGITransport(app=target)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await asyncio.gather(*(client.request(*request[:2], **request[2]) for request in requests))
+
+
+def test_duplicates_join_in_flight_request_and_replay_afterwards():
+    target, calls = make_app(IdempotencyCache(ttl=60, max_entries=10))
+    headers = {"Idempotency-Key": "tap-1"}
+
+    async def scenario():
+        first, joined = await post_all(target, [("POST", "/press/up", {"headers": headers})] * 2)
+        (replayed,) = await post_all(target, [("POST", "/press/up", {"headers": headers})])
+        return first, joined, replayed
+
+    first, joined, replayed = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert first.json() == joined.json() == replayed.json() == {"button": "up", "presses": 1}
+    assert replayed.headers["idempotent-replayed"] == "true"
+
+
+def test_keys_are_scoped_to_the_request_and_expire():
+    cache = IdempotencyCache(ttl=0.01, max_entries=10)
+    target, calls = make_app(cache)
+
+    async def scenario():
+        ok, = await post_all(target, [("POST", "/press/up", {"headers": {"Idempotency-Key": "k"}})])
+        other, = await post_all(target, [("POST", "/press/down", {"headers": {"Idempotency-Key": "k"}})])
+        await asyncio.sleep(0.02)
+        again, = await post_all(target, [("POST", "/press/down", {"headers": {"Idempotency-Key": "k"}})])
+        return ok, other, again
+
+    ok, other, again = asyncio.run(scenario())
+    assert ok.status_code == 200
+    assert other.status_code == 422
+    assert again.status_code == 200
+    assert [button for button, _ in calls] == ["up", "down"]
+
+
+def test_cache_is_bounded_and_only_commands_are_cached():
+    cache = IdempotencyCache(ttl=60, max_entries=2)
+    target, calls = make_app(cache)
+
+    requests = [("POST", f"/press/{index}", {"headers": {"Idempotency-Key": str(index)}}) for index in range(5)]
+    requests += [("GET", "/status", {"headers": {"Idempotency-Key": "status"}})] * 2
+    requests.append(("POST", "/press/x", {"content": b"body", "headers": {"Idempotency-Key": "b"}}))
+    asyncio.run(post_all(target, requests))
+
+    assert len(cache) == 2
+    assert [button for button, _ in calls].count("status") == 2
+    assert ("x", b"body") in calls
+
+
+def test_repeated_temperature_press_is_sent_once():
+    scheduler = get_scheduler()
+    headers = {"Idempotency-Key": "retry-1"}
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(
+                client.post("/ac/heater/temp/up", headers=headers),
+                client.post("/ac/heater/temp/up", headers=headers),
+            )
+
+    before = scheduler.transmitted
+    first, second = asyncio.run(scenario())
+    assert first.status_code == second.status_code == 200
+    assert first.json() == second.json()
+    assert scheduler.transmitted == before + 1
+
+
+def test_failed_responses_release_the_key():
+    target = FastAPI()
+    target.add_middleware(IdempotencyMiddleware, cache=IdempotencyCache(ttl=60, max_entries=10))
+    statuses = [429, 500]
+    calls = []
+
+    @target.post("/press")
+    async def press():
+        calls.append(len(calls))
+        status = statuses.pop(0) if statuses else 200
+        return JSONResponse({"attempt": len(calls)}, status_code=status)
+
+    request = ("POST", "/press", {"headers": {"Idempotency-Key": "retry-2"}})
+
+    async def scenario():
+        return [(await post_all(target, [request]))[0] for _ in range(4)]
+
+    responses = asyncio.run(scenario())
+    assert [response.status_code for response in responses] == [429, 500, 200, 200]
+    assert len(calls) == 3
+    assert responses[3].json() == {"attempt": 3}
+    assert responses[3].headers["idempotent-replayed"] == "true"
+
+
+def test_waiters_share_a_failed_response_and_one_retries_after_an_error():
+    target = FastAPI()
+    target.add_middleware(IdempotencyMiddleware, cache=IdempotencyCache(ttl=60, max_entries=10))
+    outcomes = ["busy", "raise"]
+    calls = []
+
+    @target.post("/press")
+    async def press():
+        calls.append(len(calls))
+        await asyncio.sleep(0.05)
+        outcome = outcomes.pop(0) if outcomes else "ok"
+        if outcome == "raise":
+            raise RuntimeError("transmitter vanished")
+        return JSONResponse({"attempt": len(calls)}, status_code=503 if outcome == "busy" else 200)
+
+    async def scenario(key):
+        transport = httpx.ASGITransport(app=target, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(
+                *(client.post("/press", headers={"Idempotency-Key": key}) for _ in range(3))
+            )
+
+    busy = asyncio.run(scenario("burst-1"))
+    assert [response.status_code for response in busy] == [503] * 3
+    assert len(calls) == 1
+
+    retried = asyncio.run(scenario("burst-2"))
+    # The first attempt raised; exactly one waiter ran it again and the other joined that run
+    assert sorted(response.status_code for response in retried) == [200, 200, 500]
+    assert len(calls) == 3
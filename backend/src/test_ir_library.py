@@ -0,0 +1,152 @@
+import asyncio
+import os
+from array import array
+
+import pytest
+
+from models.ac_model import ACMode, ACTempControl, ACTimerControl
+from models.light_model import LightMode
+from services.ac_service import ACService
+from services.light_service import IRTransmissionError, LightService
+from services.code_library import CodeLibrary
+from services.ir_library import (
+    ENTRY,
+    HEADER,
+    IRCodeLibraryFile,
+    IRLibraryError,
+    LibraryCode,
+    decode_pulses,
+    encode_pulses,
+    import_mode2_directory,
+    main,
+    write_library,
+)
+from services.state_store import DeviceStateStore
+from services.transmitter import parse_mode2
+from services.tx_scheduler import TransmitScheduler
+
+
+def test_varint_delta_round_trip_is_compact():
+    pulses = array("I", [9000, 4500] + [560, 560, 560, 1690] * 32 + [560])
+    encoded = encode_pulses(pulses)
+    assert decode_pulses(encoded, len(pulses)) == pulses
+    # Repeated timings collapse to one-byte zero deltas
+    assert len(encoded) < len(pulses) * 2
+    assert decode_pulses(encode_pulses([1, 4_000_000_000, 7]), 3).tolist() == [1, 4_000_000_000, 7]
+
+
+def test_library_lookup_and_metadata(tmp_path):
+    codes = [
+        LibraryCode(f"dev{d:03}", f"act{a}", array("I", [1000 + d, 500, a + 1]), 36000 + d, 1 + a % 3)
+        for d in range(200) for a in range(5)
+    ]
+    path = tmp_path / "codes.hcir"
+    assert write_library(str(path), reversed(codes)) == 1000
+
+    library = IRCodeLibraryFile(str(path))
+    code = library.get("dev123", "act4")
+    assert code.pulses.tolist() == [1123, 500, 5]
+    assert (code.carrier, code.repeat) == (36123, 2)
+    with pytest.raises(KeyError):
+        library.get("dev123", "act9")
+    assert len(library) == 1000
+    assert [c.device for c in library][:2] == ["dev000", "dev000"]
+    library.close()
+
+
+def test_rejects_foreign_files(tmp_path):
+    path = tmp_path / "bogus.hcir"
+    path.write_bytes(b"not a library at all, clearly")
+    with pytest.raises(IRLibraryError):
+        IRCodeLibraryFile(str(path))
+
+
+def test_rejects_truncated_and_corrupt_files_when_opened(tmp_path):
+    path = tmp_path / "codes.hcir"
+    write_library(str(path), [LibraryCode("light", "on", array("I", [9000, 4500, 560]))])
+    valid = path.read_bytes()
+
+    entry = HEADER.size
+    corrupt = [
+        b"",
+        valid[:-1],
+        valid[:HEADER.size + ENTRY.size],
+        valid[:entry] + ENTRY.pack(0, 5, 200, 38000, 50, 1, 0, 3, 0, 4) + valid[entry + ENTRY.size:],
+        valid[:entry] + ENTRY.pack(0, 5, 2, 38000, 50, 1, 0, 3, 1000, 4) + valid[entry + ENTRY.size:],
+    ]
+    for content in corrupt:
+        path.write_bytes(content)
+        with pytest.raises(IRLibraryError):
+            IRCodeLibraryFile(str(path))
+
+    # In bounds, but more pulses than the entry's bytes hold
+    path.write_bytes(valid[:entry] + ENTRY.pack(0, 5, 2, 38000, 50, 1, 0, 9, 0, 4) + valid[entry + ENTRY.size:])
+    library = IRCodeLibraryFile(str(path))
+    with pytest.raises(IRLibraryError):
+        library.get("light", "on")
+    library.close()
+
+
+def test_corrupt_entries_surface_as_transmission_errors(tmp_path, fake_transmitter):
+    path = tmp_path / "codes.hcir"
+    write_library(str(path), [LibraryCode("light", "on", array("I", [9000, 4500, 560]))])
+    valid = path.read_bytes()
+    entry = HEADER.size
+    path.write_bytes(valid[:entry] + ENTRY.pack(0, 5, 2, 38000, 0, 1, 0, 9, 0, 4) + valid[entry + ENTRY.size:])
+
+    service = LightService(
+        scheduler=TransmitScheduler(fake_transmitter(), frame_gap=0),
+        state_store=DeviceStateStore(str(tmp_path / "state.json")),
+    )
+    service.codes = CodeLibrary(str(tmp_path), "light", [LightMode], library_file=str(path))
+    with pytest.raises(IRTransmissionError):
+        asyncio.run(service.set_light_mode(LightMode.ON))
+
+
+def test_converter_imports_existing_recordings(tmp_path, ir_code_dir, capsys):
+    output = tmp_path / "codes.hcir"
+    assert main(["build", str(output), "--device", f"light={ir_code_dir}:38000", "--device", f"ac={ir_code_dir}"]) == 0
+
+    library = IRCodeLibraryFile(str(output))
+    assert len(library) == len(import_mode2_directory(str(ir_code_dir), "light")) + 9
+    expected = parse_mode2((ir_code_dir / "ac_timer_up.txt").read_text())
+    assert library.get("ac", "timer_up").pulses == expected
+    assert library.get("light", "dark").carrier == 38000
+
+
+def test_code_library_serves_from_binary_library(tmp_path, fake_transmitter):
+    path = tmp_path / "codes.hcir"
+    write_library(str(path), [
+        LibraryCode("ac", "off", array("I", [3000, 1500, 400]), 40000, 1),
+        LibraryCode("ac", "heater_on", array("I", [3000, 1500, 800]), 40000, 2),
+    ])
+    library = CodeLibrary(str(tmp_path), "ac", [ACMode, ACTempControl, ACTimerControl], library_file=str(path))
+    assert library.get(ACMode.OFF).pulses.tolist() == [3000, 1500, 400]
+    assert ACMode.AIRCON_ON not in library
+    # Repeat count expands into back-to-back frames
+    assert library.get(ACMode.HEATER_ON).pulses.count(800) == 2
+
+    transmitter = fake_transmitter()
+    service = ACService(
+        scheduler=TransmitScheduler(transmitter, frame_gap=0),
+        state_store=DeviceStateStore(str(tmp_path / "state.json")),
+    )
+    service.codes = library
+    asyncio.run(service.set_ac_mode(ACMode.OFF))
+    assert transmitter.frames[0][:2] == ([3000, 1500, 400], 40000)
+
+
+def test_replaced_library_is_reopened(tmp_path):
+    path = tmp_path / "codes.hcir"
+    write_library(str(path), [LibraryCode("light", "on", array("I", [1]))])
+    library = CodeLibrary(str(tmp_path), "light", [LightMode], library_file=str(path))
+    assert library.get(LightMode.ON).pulses.tolist() == [1]
+
+    write_library(str(path), [LibraryCode("light", "on", array("I", [2]))])
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    previous = library._library
+    assert library.rescan() == [LightMode.ON]
+    assert library.get(LightMode.ON).pulses.tolist() == [2]
+    # The replaced map is closed instead of waiting for garbage collection
+    assert previous._map.closed
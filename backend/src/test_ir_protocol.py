@@ -0,0 +1,187 @@
+import asyncio
+import random
+
+import httpx
+import pytest
+
+from main import app
+from models.ac_model import ACMode
+from services.ac_service import ACProtocolError, ACService
+from services.device_registry import DeviceRegistry
+from services.ir_protocol import (
+    AEHA,
+    NEC,
+    DecodedSignal,
+    FrameLayout,
+    ProtocolError,
+    decode,
+    encode,
+    nec_frame,
+)
+from services.state_store import DeviceStateStore
+from services.transmitter import format_mode2, parse_mode2
+from services.tx_scheduler import TransmitScheduler
+
+# Two-frame AEHA air conditioner command; the second frame carries the state
+AEHA_FRAMES = [
+    bytes.fromhex("2302cb26010000"),
+    bytes.fromhex("2302cb26010020581000000000000000000000"),
+]
+
+LAYOUT = {
+    "name": "aeha",
+    "template": "aircon_on",
+    "fields": {
+        "power": {"byte": 5, "bit": 5, "width": 1, "values": {"off": 0, "on": 1}},
+        "mode": {"byte": 6, "bit": 3, "width": 3, "values": {"aircon_on": 3, "heater_on": 1, "off": 3}},
+        "temperature": {"byte": 7, "width": 4, "base": 16},
+        "timer_hours": {"byte": 9, "width": 4},
+    },
+    "checksum": {"type": "sum", "byte": -1},
+}
+
+
+def jittered(signal: DecodedSignal, seed: int, jitter: float = 0.12) -> list[int]:
+    """Encode a signal and add capture-like jitter to every duration"""
+    rng = random.Random(seed)
+    return [max(1, round(value * rng.uniform(1 - jitter, 1 + jitter))) for value in encode(signal)]
+
+
+def template_signal() -> DecodedSignal:
+    layout = FrameLayout.from_spec(LAYOUT)
+    base = DecodedSignal(AEHA, AEHA_FRAMES, unit=430, frame_gap=13000)
+    return layout.build(base, power="on", mode="aircon_on", temperature=26, timer_hours=0)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_nec_round_trip_within_tolerance(seed):
+    recording = jittered(DecodedSignal(NEC, [nec_frame(0x10, 0x8A)]), seed)
+    decoded = decode(recording)
+
+    assert decoded.protocol is NEC
+    assert decoded.frames == [nec_frame(0x10, 0x8A)]
+    for original, clean in zip(recording, encode(decoded)):
+        assert abs(original - clean) <= original * 0.25
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_aeha_round_trip_within_tolerance(seed):
+    recording = parse_mode2(format_mode2(jittered(template_signal(), seed)))
+    decoded = decode(recording)
+
+    assert decoded.protocol is AEHA
+    assert decoded.frames == template_signal().frames
+    assert abs(decoded.unit - 430) < 30
+    assert abs(decoded.frame_gap - 13000) < 13000 * 0.15
+    clean = encode(decoded)
+    assert len(clean) == len(recording)
+    for original, value in zip(recording, clean):
+        assert abs(original - value) <= original * 0.25
+
+
+def test_unknown_signals_are_rejected():
+    with pytest.raises(ProtocolError):
+        decode([9000, 4500, 560, 560, 560, 1690, 560])  # 2 bits
+    with pytest.raises(ProtocolError):
+        decode([2000, 2000, 560])
+    with pytest.raises(ProtocolError):
+        encode(DecodedSignal(NEC, [b"\x01\x02"]))
+
+
+def test_layout_reads_and_writes_fields_with_checksum():
+    layout = FrameLayout.from_spec(LAYOUT)
+    heater = layout.build(template_signal(), power="on", mode="heater_on", temperature=20, timer_hours=3)
+
+    assert layout.read(decode(encode(heater))) == {
+        "power": "on", "mode": "heater_on", "temperature": 20, "timer_hours": 3
+    }
+    assert heater.frames[0] == AEHA_FRAMES[0]
+
+    corrupted = bytearray(heater.frames[1])
+    corrupted[-1] ^= 0xFF
+    with pytest.raises(ProtocolError):
+        layout.read(heater.with_frames([heater.frames[0], bytes(corrupted)]))
+    with pytest.raises(ValueError):
+        layout.build(heater, temperature=40)
+    with pytest.raises(ValueError):
+        FrameLayout.from_spec({"template": "x", "checksum": {"type": "crc"}})
+
+
+@pytest.fixture
+def ac(fake_transmitter, tmp_path, monkeypatch):
+    (tmp_path / "ac_aircon_on.txt").write_text(format_mode2(jittered(template_signal(), 42)))
+    monkeypatch.setattr("services.ac_service.IR_AC_RESOURCES_PATH", str(tmp_path))
+    transmitter = fake_transmitter()
+    service = ACService(
+        scheduler=TransmitScheduler(transmitter, frame_gap=0),
+        state_store=DeviceStateStore(str(tmp_path / "state.json")),
+    )
+    service.configure_protocol(LAYOUT)
+    return service, transmitter
+
+
+def test_full_state_frame_in_one_transmission(ac):
+    service, transmitter = ac
+    result = asyncio.run(service.set_state(ACMode.HEATER_ON, temperature=19, timer_hours=4))
+
+    assert result["state"].mode == ACMode.HEATER_ON
+    assert service.state.setpoints[ACMode.HEATER_ON] == 19
+    assert service.state.timer_hours == 4
+    assert len(transmitter.frames) == 1
+    pulses, carrier = transmitter.frames[0][:2]
+    assert carrier == AEHA.carrier
+    assert service.layout.read(decode(pulses))["temperature"] == 19
+
+
+def test_setpoints_use_full_state_frames(ac):
+    service, transmitter = ac
+    asyncio.run(service.set_state(ACMode.AIRCON_ON, temperature=27))
+
+    # Lowering the aircon setpoint needs no down button with full-state frames
+    result = asyncio.run(service.set_temperature(22))
+    assert result["presses"] == 1
+    assert service.layout.read(decode(transmitter.frames[-1][0]))["temperature"] == 22
+
+    asyncio.run(service.set_timer(6))
+    assert service.layout.read(decode(transmitter.frames[-1][0])) == {
+        "power": "on", "mode": "aircon_on", "temperature": 22, "timer_hours": 6
+    }
+    assert len(transmitter.frames) == 3
+
+
+def test_state_needs_a_layout(fake_transmitter, tmp_path):
+    service = ACService(
+        scheduler=TransmitScheduler(fake_transmitter(), frame_gap=0),
+        state_store=DeviceStateStore(str(tmp_path / "state.json")),
+    )
+    with pytest.raises(ACProtocolError):
+        asyncio.run(service.set_state(ACMode.AIRCON_ON))
+
+    # The shared conftest recordings are not protocol frames
+    service.configure_protocol(LAYOUT)
+    with pytest.raises(ACProtocolError):
+        service.encode_state(ACMode.AIRCON_ON, 24)
+
+
+def test_manifest_configures_the_layout(ac):
+    service, _ = ac
+    service.configure_protocol(None)
+    DeviceRegistry({"ac": service}).load(
+        {"devices": {"ac": {"service": "ac", "protocol": LAYOUT, "actions": {"off": "off"}}}}
+    )
+    assert service.layout is not None
+
+    with pytest.raises(ValueError):
+        DeviceRegistry({"light": object()}).load(
+            {"devices": {"light": {"service": "light", "protocol": LAYOUT, "actions": {}}}}
+        )
+
+
+def test_state_endpoint_without_layout_is_not_implemented():
+    async def call():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.put("/ac/state", json={"mode": "aircon_on"})
+
+    response = asyncio.run(call())
+    assert response.status_code == 501
@@ -0,0 +1,68 @@
+import asyncio
+
+import httpx
+
+from main import app
+from models.ac_model import ACStatusResponse
+from routers.ac_router import ac_service
+from services.json_response import CachedJSON, etag_matches
+
+
+def _client():
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+def test_cached_body_is_rebuilt_only_when_its_version_changes():
+    builds = []
+    version = [1]
+    cached = CachedJSON(lambda: builds.append(1) or {"builds": len(builds)}, lambda: version[0])
+
+    first = cached.get()
+    assert cached.get() == first
+    version[0] = 2
+    second = cached.get()
+
+    assert len(builds) == 2
+    assert first[0] == b'{"builds":1}' and second[0] == b'{"builds":2}'
+    assert first[1] != second[1]
+    assert etag_matches(f'W/{first[1]}, "other"', first[1])
+    assert etag_matches("*", first[1])
+    assert not etag_matches(None, first[1])
+
+
+def test_read_endpoints_answer_matching_etags_with_304():
+    async def call():
+        async with _client() as client:
+            status = await client.get("/ac/status")
+            etag = status.headers["etag"]
+            unchanged = await client.get("/ac/status", headers={"If-None-Match": etag})
+            await client.post("/ac/heater/on")
+            changed = await client.get("/ac/status", headers={"If-None-Match": etag})
+            paths = ["/", "/light/modes", "/light/status", "/devices"]
+            revalidated = []
+            for path in paths:
+                response = await client.get(path)
+                revalidated.append(await client.get(path, headers={"If-None-Match": response.headers["etag"]}))
+            return status, unchanged, changed, revalidated
+
+    status, unchanged, changed, revalidated = asyncio.run(call())
+    # Same body the response_model used to produce
+    assert status.content == ACStatusResponse.model_validate(status.json()).model_dump_json().encode()
+    assert status.headers["cache-control"] == "no-cache"
+    assert unchanged.status_code == 304
+    assert unchanged.content == b""
+    assert changed.status_code == 200
+    assert changed.json()["state"]["mode"] == "heater_on" == ac_service.state.mode.value
+    assert changed.headers["etag"] != status.headers["etag"]
+    assert [response.status_code for response in revalidated] == [304] * 4
+
+
+def test_commands_are_encoded_without_jsonable_encoder():
+    async def call():
+        async with _client() as client:
+            return await client.post("/light/on")
+
+    response = asyncio.run(call())
+    assert response.headers["content-type"] == "application/json"
+    assert response.json()["mode"] == "on"
+    assert response.json()["success"] is True
@@ -0,0 +1,120 @@
+import asyncio
+import random
+
+import httpx
+import pytest
+
+from main import app
+from services.device_registry import DeviceRegistry
+from services.learn_service import (
+    LearnBusyError,
+    LearnError,
+    LearnService,
+    LearnTimeoutError,
+    align_and_average,
+    mode2_text_events,
+    split_captures,
+)
+from services.state_store import DeviceStateStore
+from services.transmitter import parse_mode2
+from services.tx_scheduler import TransmitScheduler
+
+TRUE_CODE = [9000, 4500] + [560, 560, 560, 1690] * 8 + [560]
+
+
+def noisy(seed: int, jitter: float = 0.1) -> list[int]:
+    rng = random.Random(seed)
+    return [round(value * rng.uniform(1 - jitter, 1 + jitter)) for value in TRUE_CODE]
+
+
+def mode2_stream(captures: list[list[int]]) -> str:
+    """What `ir-ctl -r --mode2` prints while the button is pressed repeatedly"""
+    lines = []
+    for capture in captures:
+        lines.append("space 16777215")
+        for index, value in enumerate(capture):
+            lines.append(f"{'pulse' if index % 2 == 0 else 'space'} {value}")
+        lines.append("timeout 125000")
+    return "\n".join(lines) + "\n"
+
+
+def test_stream_is_split_into_captures_and_blips_dropped():
+    stream = mode2_stream([noisy(1), [300, 200, 150], noisy(2)])
+    captures = list(split_captures(mode2_text_events(stream.splitlines())))
+
+    assert [len(capture) for capture in captures] == [len(TRUE_CODE)] * 2
+    assert captures[0].tolist() == noisy(1)
+
+
+def test_long_space_also_ends_a_capture():
+    events = [("pulse", 9000), ("space", 4500)] + [("pulse", 560), ("space", 560)] * 3 + [("pulse", 560)]
+    captures = list(split_captures(events + [("space", 200000)] + events))
+    assert len(captures) == 2
+
+
+def test_average_rejects_outliers_and_aligns_leading_noise():
+    captures = [noisy(seed) for seed in range(4)]
+    # Half the durations of one capture are way off
+    captures.append([value * (3 if index % 4 == 0 else 1) for index, value in enumerate(noisy(9))])
+    # A stray blip right before the signal
+    captures.append([250, 900] + noisy(10))
+
+    result = align_and_average(captures)
+
+    assert result["used"] == 5
+    assert result["rejected"] == 1
+    assert len(result["pulses"]) == len(TRUE_CODE)
+    for averaged, true in zip(result["pulses"], TRUE_CODE):
+        assert abs(averaged - true) <= true * 0.08
+
+
+def test_disagreeing_captures_are_refused():
+    with pytest.raises(LearnError):
+        align_and_average([noisy(1)])
+    with pytest.raises(LearnError):
+        align_and_average([noisy(1), [value * 2 for value in noisy(2)]])
+
+
+@pytest.fixture
+def learner(fake_transmitter, tmp_path):
+    registry = DeviceRegistry(
+        scheduler=TransmitScheduler(fake_transmitter(), frame_gap=0),
+        state_store=DeviceStateStore(str(tmp_path / "state.json")),
+    )
+    registry.load({"devices": {"tv": {"resources_path": str(tmp_path / "tv"), "actions": {"power": "power"}}}})
+    replay = tmp_path / "lirc1.mode2"
+    return LearnService(registry, str(replay), captures=3, timeout=1), registry, replay
+
+
+def test_learned_code_goes_straight_into_the_library(learner):
+    service, registry, replay = learner
+    replay.write_text(mode2_stream([noisy(seed) for seed in range(5)]))
+
+    result = asyncio.run(service.learn("tv", "power"))
+
+    assert result["captures"] == 3
+    assert result["used"] == 3
+    tv = registry.lookup("tv", "power")
+    code = tv.service.codes.get(tv.member)
+    assert parse_mode2(open(result["file"]).read()) == code.pulses
+    assert len(code.pulses) == len(TRUE_CODE)
+
+
+def test_learn_errors(learner):
+    service, registry, replay = learner
+    replay.write_text("timeout 125000\n")
+    with pytest.raises(LearnTimeoutError):
+        asyncio.run(service.learn("tv", "power"))
+
+    service._busy = True
+    with pytest.raises(LearnBusyError):
+        asyncio.run(service.learn("tv", "power"))
+
+
+def test_learn_endpoint_rejects_unknown_actions():
+    async def call():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/learn/light/disco")
+
+    assert asyncio.run(call()).status_code == 404
@@ -0,0 +1,175 @@
+import asyncio
+import itertools
+from array import array
+
+from services.code_library import IRCode
+from services.learn_service import get_receiver_lock
+from services.transmitter import join_pulse_trains
+from services.loopback import LinkStats, LoopbackVerifier, count_echoes, count_train_echoes, device_label
+from services.tx_scheduler import PRIORITY_ADJUST, TransmitScheduler
+
+PULSES = array("I", [9000, 4500, 560, 560, 560, 1690, 560])
+
+
+def _mode2(pulses, stretch: float = 1.0) -> str:
+    kinds = itertools.cycle(("pulse", "space"))
+    return "".join(f"{kind} {int(value * stretch)}\n" for kind, value in zip(kinds, pulses))
+
+
+class ScriptedVerifier(LoopbackVerifier):
+    """Hears each sent copy of PULSES according to `heard`, a sequence of booleans"""
+
+    def __init__(self, heard, **kwargs):
+        super().__init__(receiver_device=None, **kwargs)
+        self.heard = iter(heard)
+        self.transmitter = None
+
+    async def echo(self, send, airtime):
+        await send()
+        train = self.transmitter.frames[-1][0]
+        copies = (len(train) + 1) // (len(PULSES) + 1)
+        return [array("I", PULSES) for _ in range(copies) if next(self.heard)]
+
+
+def test_echoes_are_found_within_tolerance_and_in_merged_copies():
+    stretched = array("I", (int(value * 1.15) for value in PULSES))
+    merged = array("I", list(PULSES) + [40000] + list(PULSES))
+    assert count_echoes(PULSES, [stretched]) == 1
+    assert count_echoes(PULSES, [merged]) == 2
+    assert count_echoes(PULSES, [array("I", [300, 300]), array("I", [9000, 4500, 560])]) == 0
+    assert device_label("ac_heater_on") == "ac"
+    assert device_label("ac_state:heater:24:0") == "ac"
+
+
+def test_bursts_are_matched_frame_by_frame(ir_code_dir, fake_transmitter):
+    other = array("I", [3400, 1700, 430, 1290, 430])
+    burst = join_pulse_trains([PULSES, other, PULSES], 100_000)
+    # The receiver ends a capture at each frame gap
+    receiver = ir_code_dir / "loopback_burst.txt"
+    receiver.write_text(
+        _mode2(PULSES) + "space 100000\n" + _mode2(other) + "space 100000\n" + _mode2(PULSES) + "timeout 100000\n"
+    )
+    verifier = LoopbackVerifier(str(receiver))
+    transmitter = fake_transmitter()
+
+    assert asyncio.run(verifier.transmit(transmitter, burst, None, "ac_heater_temp_up+ac_heater_temp_up")) is True
+    stats = verifier.get_stats()["ac"]
+    assert (stats["verified"], stats["failed"]) == (1, 0)
+    # One PULSES frame is not a whole burst
+    assert count_train_echoes(burst, [PULSES, other]) == 0
+
+
+def test_repeats_follow_the_miss_rate():
+    stats = LinkStats(max_repeats=3)
+    stats.record_frames(5, 5)
+    stats.tune()
+    assert stats.repeats == 1 and stats.miss_rate is None
+
+    stats.record_frames(20, 16)
+    stats.tune()
+    # 20% of frames missed: two copies miss together 4% of the time, three 0.8%
+    assert round(stats.miss_rate, 3) == 0.16
+    assert stats.repeats == 3
+
+    stats.record_frames(100, 100)
+    stats.tune()
+    assert stats.repeats == 1
+
+
+def test_receiver_file_echo_verifies_in_one_frame(ir_code_dir, fake_transmitter):
+    receiver = ir_code_dir / "loopback_ok.txt"
+    receiver.write_text(_mode2(PULSES, stretch=1.1) + "timeout 100000\n")
+    verifier = LoopbackVerifier(str(receiver))
+    transmitter = fake_transmitter()
+
+    verified = asyncio.run(verifier.transmit(transmitter, PULSES, 38000, "light_on", resendable=True))
+    assert verified is True
+    assert len(transmitter.frames) == 1
+    assert verifier.get_stats()["light"]["verified"] == 1
+
+
+def test_missed_echo_resends_only_resendable_frames(ir_code_dir, fake_transmitter):
+    receiver = ir_code_dir / "loopback_noise.txt"
+    receiver.write_text("pulse 300\nspace 300\npulse 300\n")
+    verifier = LoopbackVerifier(str(receiver), max_resends=2)
+
+    transmitter = fake_transmitter()
+    assert asyncio.run(verifier.transmit(transmitter, PULSES, None, "light_on", resendable=True)) is False
+    assert len(transmitter.frames) == 3
+
+    transmitter = fake_transmitter()
+    assert asyncio.run(verifier.transmit(transmitter, PULSES, None, "ac_heater_temp_up")) is False
+    assert len(transmitter.frames) == 1
+    assert verifier.get_stats()["light"]["resent"] == 2
+    assert verifier.get_stats()["ac"]["failed"] == 1
+
+
+def test_missing_receiver_sends_unverified(ir_code_dir, fake_transmitter):
+    verifier = LoopbackVerifier(str(ir_code_dir / "no_receiver"))
+    transmitter = fake_transmitter()
+
+    assert asyncio.run(verifier.transmit(transmitter, PULSES, None, "light_on", resendable=True)) is False
+    assert len(transmitter.frames) == 1
+    assert verifier.get_stats()["light"]["unverified"] == 1
+
+
+def test_learning_and_verification_share_the_receiver(ir_code_dir, fake_transmitter):
+    receiver = ir_code_dir / "loopback_shared.txt"
+    receiver.write_text(_mode2(PULSES) + "timeout 100000\n")
+    verifier = LoopbackVerifier(str(receiver))
+    shared = get_receiver_lock()
+
+    async def scenario():
+        transmitter = fake_transmitter()
+        async with shared.lock():
+            waiting = asyncio.create_task(verifier.transmit(transmitter, PULSES, None, "light_on"))
+            await asyncio.sleep(0.05)
+            # Another reader holds the receiver, nothing is sent yet
+            held = len(transmitter.frames)
+        verified = await waiting
+
+        learning = fake_transmitter()
+        async with shared.lock():
+            shared.learning = True
+            try:
+                unverified = await asyncio.wait_for(verifier.transmit(learning, PULSES, None, "light_on"), 1)
+            finally:
+                shared.learning = False
+        return held, verified, unverified, len(learning.frames)
+
+    assert asyncio.run(scenario()) == (0, True, False, 1)
+    assert verifier.get_stats()["light"]["unverified"] == 1
+
+
+def test_flaky_link_gets_more_copies_and_recovers(fake_transmitter):
+    # Every other frame is lost for a while, then the link is clean
+    verifier = ScriptedVerifier(itertools.chain([True, False] * 10, itertools.repeat(True)), max_repeats=3)
+    verifier.transmitter = transmitter = fake_transmitter()
+
+    async def scenario():
+        for _ in range(60):
+            await verifier.transmit(transmitter, PULSES, None, "light_on", gap_us=40000, resendable=True)
+
+    asyncio.run(scenario())
+    stats = verifier.stats_for("light")
+    assert stats.failed == 0
+    assert stats.repeats == 1
+    # The burst of misses raised the copies per command before clean echoes brought them back down
+    assert max(len(frame[0]) for frame in transmitter.frames) == 3 * len(PULSES) + 2
+
+
+def test_scheduler_resends_modes_but_not_increments(fake_transmitter):
+    verifier = ScriptedVerifier([False, True, False], max_resends=2)
+    verifier.transmitter = transmitter = fake_transmitter()
+    scheduler = TransmitScheduler(transmitter, frame_gap=0.001, verifier=verifier)
+
+    async def scenario():
+        mode = await scheduler.submit(IRCode("light_on", PULSES), coalesce_key="light:mode")
+        step = await scheduler.submit(IRCode("ac_heater_temp_up", PULSES), priority=PRIORITY_ADJUST,
+                                      coalesce_key="ac:heater/temp/up", accumulate=True)
+        return mode, step
+
+    mode, step = asyncio.run(scenario())
+    assert mode.verified is True
+    assert step.verified is False
+    assert len(transmitter.frames) == 3
@@ -0,0 +1,66 @@
+import asyncio
+import threading
+
+import httpx
+
+from main import app
+from services.metrics import MetricsRegistry, code_label
+
+
+def test_thread_shards_are_merged_on_render():
+    registry = MetricsRegistry()
+    counter = registry.counter("jobs_total", "Jobs", ("kind",))
+    histogram = registry.histogram("job_seconds", "Job time", buckets=(0.1, 1.0))
+
+    def work():
+        for _ in range(1000):
+            counter.inc("a")
+        histogram.observe(0.5)
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    histogram.observe(0.05)
+    histogram.observe(7)
+
+    assert counter.value("a") == 4000
+    text = registry.render()
+    assert 'jobs_total{kind="a"} 4000' in text
+    assert 'job_seconds_bucket{le="0.1"} 1' in text
+    assert 'job_seconds_bucket{le="1"} 5' in text
+    assert 'job_seconds_bucket{le="+Inf"} 6' in text
+    assert "job_seconds_count 6" in text
+    assert "# TYPE job_seconds histogram" in text
+
+
+def test_label_values_are_escaped_and_gauges_can_be_computed():
+    registry = MetricsRegistry()
+    registry.counter("errors_total", "Errors", ("message",)).inc('say "hi"\n')
+    registry.gauge("depth", "Depth", function=lambda: 3)
+
+    text = registry.render()
+    assert 'errors_total{message="say \\"hi\\"\\n"} 1' in text
+    assert "depth 3" in text
+    assert code_label("batch:light_on+ac_off") == "batch"
+    assert code_label("ac_timer_up+ac_timer_up") == "ac_timer_up"
+
+
+def test_metrics_endpoint_reports_requests_frames_and_errors():
+    async def call():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            assert (await client.post("/light/on")).status_code == 200
+            assert (await client.post("/light/disco")).status_code == 404
+            return await client.get("/metrics")
+
+    response = asyncio.run(call())
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+    assert 'http_requests_total{method="POST",route="/{device}/{action:path}",status="200"}' in text
+    assert 'http_exceptions_total{exception="UnknownDeviceActionError"}' in text
+    assert 'ir_frames_total{code="light_on",outcome="sent"}' in text
+    assert 'ir_transmit_seconds_count{backend="ir-ctl"}' in text
+    assert "http_requests_in_flight 1" in text
+    assert "ir_queue_depth 0" in text
@@ -0,0 +1,12 @@
+from services.primary_worker import PrimaryWorkerLock
+
+
+def test_only_one_worker_is_primary_until_it_releases(tmp_path):
+    path = str(tmp_path / "primary.lock")
+    first, second = PrimaryWorkerLock(path), PrimaryWorkerLock(path)
+
+    assert first.acquire() and first.acquire()
+    assert not second.acquire() and not second.held
+    first.release()
+    assert second.acquire()
+    second.release()
@@ -0,0 +1,132 @@
+import asyncio
+import json
+import logging
+from array import array
+
+import httpx
+
+from main import app
+from services.code_library import IRCode
+from services.request_log import (
+    JSONFormatter,
+    RequestContextFilter,
+    RequestLog,
+    RequestLogMiddleware,
+    current_request_id,
+    get_request_log
+)
+from services.transmitter import TransmitterError
+from services.tx_scheduler import TransmitScheduler
+
+
+def _client():
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+def test_requests_are_kept_with_their_transmits():
+    async def call():
+        async with _client() as client:
+            command = await client.post("/light/on", headers={"X-Request-ID": "tap-42"})
+            generated = await client.get("/light/status")
+            debug = await client.get("/debug/requests", params={"limit": 5})
+            return command, generated, debug.json()
+
+    command, generated, debug = asyncio.run(call())
+    assert command.headers["x-request-id"] == "tap-42"
+    assert len(generated.headers["x-request-id"]) == 32
+
+    entries = {entry["id"]: entry for entry in debug["requests"]}
+    entry = entries["tap-42"]
+    assert entry["route"] == "/{device}/{action:path}" and entry["status"] == 200
+    assert entry["duration_ms"] > 0
+    [transmit] = entry["transmits"]
+    assert transmit["code"] == "light_on"
+    assert transmit["backend"] == "ir-ctl"
+    assert transmit["queue_wait_ms"] >= 0
+    # Newest first, the /debug request itself is still running and not listed
+    assert debug["requests"][0]["id"] == generated.headers["x-request-id"]
+    assert debug["size"] == get_request_log().entries.maxlen
+
+
+def test_ring_buffer_is_bounded_and_filters_slow_requests():
+    log = RequestLog(size=3, slow_ms=100)
+    for index, duration in enumerate([5, 250, 10, 120, 1]):
+        log.add({"id": str(index), "duration_ms": duration})
+
+    assert [entry["id"] for entry in log.recent()] == ["4", "3", "2"]
+    assert [entry["id"] for entry in log.recent(min_duration_ms=100)] == ["3"]
+    assert [entry["id"] for entry in log.recent(limit=1)] == ["4"]
+
+
+def test_records_carry_the_request_id_and_extra_fields():
+    formatted = []
+
+    class Capture(logging.Handler):
+        def emit(self, record):
+            formatted.append(JSONFormatter().format(record))
+
+    handler = Capture()
+    handler.addFilter(RequestContextFilter())
+    test_logger = logging.getLogger("test_request_log")
+    test_logger.addHandler(handler)
+    test_logger.propagate = False
+
+    async def inner(scope, receive, send):
+        test_logger.warning("sending", extra={"action": "on", "backend": "lirc"})
+        await send({"type": "http.response.start", "status": 204, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def send(message):
+        pass
+
+    scope = {"type": "http", "method": "POST", "path": "/light/on", "headers": [(b"x-request-id", b"abc")]}
+    try:
+        asyncio.run(RequestLogMiddleware(inner, RequestLog())(scope, None, send))
+        test_logger.warning("idle")
+    finally:
+        test_logger.removeHandler(handler)
+
+    inside, outside = (json.loads(line) for line in formatted)
+    assert inside["request_id"] == "abc"
+    assert inside["action"] == "on" and inside["backend"] == "lirc"
+    assert inside["message"] == "sending" and inside["level"] == "WARNING"
+    assert outside["request_id"] is None
+
+
+def test_workers_do_not_keep_the_request_that_started_them(fake_transmitter):
+    transmitter = fake_transmitter(fail=True)
+    seen = []
+    original = transmitter.send
+
+    async def send(pulses, carrier=None, source=None):
+        seen.append(current_request_id())
+        await original(pulses, carrier, source)
+
+    transmitter.send = send
+    scheduler = TransmitScheduler(transmitter, frame_gap=0)
+    log = RequestLog()
+
+    async def inner(scope, receive, send):
+        try:
+            await scheduler.submit(IRCode("light_on", array("I", [9000, 4500, 560])))
+        except TransmitterError:
+            pass
+        await send({"type": "http.response.start", "status": 502, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def respond(message):
+        pass
+
+    async def scenario():
+        middleware = RequestLogMiddleware(inner, log)
+        for request_id in (b"first", b"second"):
+            scope = {"type": "http", "method": "POST", "path": "/light/on", "headers": [(b"x-request-id", request_id)]}
+            await middleware(scope, None, respond)
+
+    asyncio.run(scenario())
+    # The worker started by the first request runs outside of any request
+    assert seen == [None, None]
+    for entry in log.recent():
+        [transmit] = entry["transmits"]
+        assert transmit["code"] == "light_on"
+        assert transmit["error"] == "fake transmitter failure"
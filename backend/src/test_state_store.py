@@ -0,0 +1,86 @@
+import asyncio
+import json
+
+import httpx
+
+from main import app
+from models.ac_model import ACMode, ACTempControl
+from models.light_model import LightMode
+from services.ac_service import ACService
+from services.light_service import LightService
+from services.state_store import DeviceStateStore
+from services.tx_scheduler import TransmitScheduler
+
+
+def _services(tmp_path, transmitter):
+    store = DeviceStateStore(str(tmp_path / "state.json"))
+    scheduler = TransmitScheduler(transmitter, frame_gap=0)
+    return store, LightService(scheduler=scheduler, state_store=store), ACService(scheduler=scheduler, state_store=store)
+
+
+def test_transmits_update_state_and_snapshot(tmp_path, fake_transmitter):
+    store, light, ac = _services(tmp_path, fake_transmitter())
+
+    async def scenario():
+        await light.set_light_mode(LightMode.DARK)
+        await ac.set_ac_mode(ACMode.HEATER_ON)
+        await ac.control_temperature(ACTempControl.HEATER_TEMP_UP)
+        await store.flush()
+
+    asyncio.run(scenario())
+
+    snapshot = json.loads((tmp_path / "state.json").read_text())
+    assert snapshot["light"]["mode"] == "dark"
+    assert snapshot["ac"]["mode"] == "heater_on"
+    assert snapshot["ac"]["setpoints"]["heater_on"] == 23
+    assert not list(tmp_path.glob(".state_*"))
+
+
+def test_restart_restores_state_from_snapshot(tmp_path, fake_transmitter):
+    store, light, ac = _services(tmp_path, fake_transmitter())
+    asyncio.run(ac.set_ac_mode(ACMode.AIRCON_ON))
+    store.save()
+
+    _, light_again, ac_again = _services(tmp_path, fake_transmitter())
+    assert ac_again.state.mode == ACMode.AIRCON_ON
+    assert ac_again.plan_temperature(27) == [ACTempControl.AIRCON_TEMP_UP]
+    assert light_again.state.mode is None
+
+
+def test_failed_transmit_leaves_state_untouched(tmp_path, fake_transmitter):
+    store, light, _ = _services(tmp_path, fake_transmitter(fail=True))
+    try:
+        asyncio.run(light.set_light_mode(LightMode.ON))
+    except Exception:
+        pass
+    assert light.state.mode is None
+    assert store.version == 0
+
+
+def test_corrupt_snapshot_is_ignored(tmp_path):
+    (tmp_path / "state.json").write_text("{not json")
+    store = DeviceStateStore(str(tmp_path / "state.json"))
+    assert store.ac.mode is None
+
+
+def test_snapshot_failures_outside_a_loop_are_logged(tmp_path, caplog):
+    # A regular file where the snapshot directory should be makes every write fail
+    (tmp_path / "blocked").write_text("")
+    store = DeviceStateStore(str(tmp_path / "blocked" / "state.json"))
+    store.ac.mode = ACMode.OFF
+    store.changed("ac")
+    assert store.version == 1
+    assert "Failed to write state snapshot" in caplog.text
+
+
+def test_status_endpoints_serve_tracked_state():
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            await client.post("/light/bright")
+            await client.post("/ac/aircon/on")
+            return await client.get("/light/status"), await client.get("/ac/status")
+
+    light, ac = asyncio.run(scenario())
+    assert light.json()["state"]["mode"] == "bright"
+    assert ac.json()["state"]["mode"] == "aircon_on"
+    assert "available_modes" in ac.json()
@@ -0,0 +1,149 @@
+import asyncio
+import os
+import time
+from array import array
+
+import pytest
+
+from models.light_model import LightMode
+from services.light_service import LightService
+from services.transmitter import (
+    LircTransmitter,
+    SimulatedTransmitter,
+    TransmitterError,
+    IrCtlTransmitter,
+    create_transmitter,
+    format_mode2,
+    parse_mode2,
+)
+
+
+def test_parse_mode2_merges_and_trims():
+    text = "space 12000\npulse 9000\nspace 4500\nspace 10\npulse 560\ntimeout 125000\nspace 40000\n"
+    assert parse_mode2(text).tolist() == [9000, 4510, 560]
+
+
+def test_parse_mode2_accepts_raw_format():
+    assert parse_mode2("+9000 -4500 +560\n").tolist() == [9000, 4500, 560]
+
+
+def test_format_mode2_round_trips():
+    pulses = array("I", [9000, 4500, 560, 1690, 560])
+    assert parse_mode2(format_mode2(pulses)) == pulses
+
+
+def test_lirc_backend_writes_packed_u32_to_regular_file(tmp_path):
+    device = tmp_path / "lirc0"
+    device.touch()
+    transmitter = LircTransmitter(str(device))
+    pulses = array("I", [9000, 4500, 560])
+
+    asyncio.run(transmitter.send(pulses, 38000))
+    asyncio.run(transmitter.send(pulses, 38000))
+    transmitter.close()
+
+    written = array("I")
+    written.frombytes(device.read_bytes())
+    assert written.tolist() == pulses.tolist() * 2
+
+
+def test_lirc_backend_keeps_device_open(tmp_path):
+    device = tmp_path / "lirc0"
+    device.touch()
+    transmitter = LircTransmitter(str(device))
+    asyncio.run(transmitter.send(array("I", [100]), None))
+    fd = transmitter._fd
+    asyncio.run(transmitter.send(array("I", [200]), None))
+    assert transmitter._fd == fd
+    transmitter.close()
+
+
+def test_lirc_backend_writes_each_frame_in_one_write_to_fifo(tmp_path):
+    device = tmp_path / "lirc0"
+    os.mkfifo(device)
+    reader = os.open(device, os.O_RDONLY | os.O_NONBLOCK)
+    try:
+        transmitter = LircTransmitter(str(device))
+        pulses = array("I", [9000, 4500, 560, 560, 560])
+        asyncio.run(transmitter.send(pulses, 38000))
+        data = os.read(reader, 1024)
+        transmitter.close()
+    finally:
+        os.close(reader)
+    assert data == pulses.tobytes()
+
+
+def test_lirc_backend_rejects_train_ending_in_space(tmp_path):
+    device = tmp_path / "lirc0"
+    device.touch()
+    with pytest.raises(TransmitterError):
+        asyncio.run(LircTransmitter(str(device)).send(array("I", [100, 200]), None))
+
+
+def test_auto_backend_falls_back_to_ir_ctl(tmp_path):
+    assert isinstance(create_transmitter("auto", str(tmp_path / "missing")), IrCtlTransmitter)
+    (tmp_path / "lirc0").touch()
+    transmitter = create_transmitter("auto", str(tmp_path / "lirc0"))
+    assert isinstance(transmitter, LircTransmitter)
+    transmitter.close()
+
+
+def test_service_sends_parsed_code_through_lirc_backend(tmp_path, ir_code_dir):
+    device = tmp_path / "lirc0"
+    device.touch()
+    transmitter = LircTransmitter(str(device))
+    service = LightService(transmitter=transmitter)
+
+    result = asyncio.run(service.set_light_mode(LightMode.ON))
+    transmitter.close()
+
+    assert result["success"] is True
+    written = array("I")
+    written.frombytes(device.read_bytes())
+    assert written == parse_mode2((ir_code_dir / "light_on.txt").read_text())
+
+
+def test_simulated_backend_blocks_for_the_airtime_of_the_recording(tmp_path, ir_code_dir):
+    transmitter = create_transmitter("simulated", str(tmp_path / "sim_airtime"))
+    assert isinstance(transmitter, SimulatedTransmitter)
+    service = LightService(transmitter=transmitter)
+
+    started = time.perf_counter()
+    result = asyncio.run(service.set_light_mode(LightMode.ON))
+    elapsed = time.perf_counter() - started
+
+    airtime = sum(parse_mode2((ir_code_dir / "light_on.txt").read_text())) / 1_000_000
+    assert result["success"] is True
+    assert transmitter.frames == 1
+    assert transmitter.airtime == pytest.approx(airtime)
+    assert elapsed >= airtime
+
+
+def test_simulated_backend_serializes_frames_on_one_device(tmp_path):
+    device = str(tmp_path / "sim_shared")
+    first, second = SimulatedTransmitter(device), SimulatedTransmitter(device)
+    pulses = array("I", [30000, 500, 560])
+
+    async def scenario():
+        started = time.perf_counter()
+        await asyncio.gather(first.send(pulses), second.send(pulses))
+        return time.perf_counter() - started
+
+    assert asyncio.run(scenario()) >= 2 * 0.03106
+    assert first.contended + second.contended == 1
+
+
+def test_simulated_backend_injects_failures_and_timeouts(tmp_path):
+    failing = SimulatedTransmitter(str(tmp_path / "sim_fail"), failure_rate=1)
+    with pytest.raises(TransmitterError, match="Command failed with code 1"):
+        asyncio.run(failing.send(array("I", [560])))
+
+    hanging = SimulatedTransmitter(str(tmp_path / "sim_hang"), timeout_rate=1, timeout=0.02)
+    started = time.perf_counter()
+    with pytest.raises(TransmitterError, match="timed out"):
+        asyncio.run(hanging.send(array("I", [560])))
+    assert time.perf_counter() - started >= 0.02
+
+    # The recording is read like ir-ctl would, so a missing file fails the frame
+    with pytest.raises(TransmitterError, match="Command failed"):
+        asyncio.run(SimulatedTransmitter(str(tmp_path / "sim_src")).send(array("I", [560]), source=tmp_path / "gone.txt"))
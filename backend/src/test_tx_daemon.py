@@ -0,0 +1,124 @@
+import asyncio
+import os
+import tempfile
+from array import array
+from pathlib import Path
+
+import pytest
+
+from services.transmitter import DaemonTransmitter, TransmitterError, parse_mode2
+from services.tx_daemon import TransmitterDaemon
+
+PULSES = array("I", [9000, 4500, 560])
+
+
+@pytest.fixture
+def socket_path():
+    # Unix socket paths are limited to about 100 bytes, so stay clear of long tmp_path names
+    return os.path.join(tempfile.mkdtemp(prefix="txd"), "tx.sock")
+
+
+def test_workers_share_one_emitter_without_overlap(socket_path, fake_transmitter):
+    transmitter = fake_transmitter(airtime=0.02)
+    daemon = TransmitterDaemon(socket_path, transmitter_factory=lambda device: transmitter)
+    workers = [DaemonTransmitter("/dev/lirc0", socket_path, pool_size=2) for _ in range(3)]
+
+    async def scenario():
+        await daemon.start()
+        try:
+            await asyncio.gather(*(worker.send(PULSES, 38000) for worker in workers for _ in range(3)))
+            status = await workers[0]._request({"op": "status"})
+        finally:
+            for worker in workers:
+                await worker.close()
+            await daemon.stop()
+        return status
+
+    status = asyncio.run(scenario())
+    assert len(transmitter.frames) == 9
+    assert transmitter.max_active == 1
+    assert all(frame[0] == PULSES.tolist() and frame[1] == 38000 for frame in transmitter.frames)
+    assert status["emitters"][0]["transmitted"] == 9
+    assert not Path(socket_path).exists()
+
+
+def test_recordings_are_sent_by_path_and_cached(socket_path, fake_transmitter, ir_code_dir):
+    transmitter = fake_transmitter()
+    daemon = TransmitterDaemon(socket_path, transmitter_factory=lambda device: transmitter)
+    worker = DaemonTransmitter("/dev/lirc0", socket_path)
+    source = ir_code_dir / "light_on.txt"
+
+    async def scenario():
+        await daemon.start()
+        try:
+            await worker.send(PULSES, source=source)
+            await worker.send(PULSES, source=source)
+            # A recording the daemon cannot read is sent as durations instead
+            await worker.send(PULSES, source=ir_code_dir / "not_recorded.txt")
+        finally:
+            await worker.close()
+            await daemon.stop()
+
+    asyncio.run(scenario())
+    recorded = parse_mode2(source.read_text()).tolist()
+    assert [frame[0] for frame in transmitter.frames] == [recorded, recorded, PULSES.tolist()]
+    assert daemon.code_loads == 1
+
+
+def test_failures_and_restarts_reach_the_worker(socket_path, fake_transmitter):
+    failing = TransmitterDaemon(socket_path, transmitter_factory=lambda device: fake_transmitter(fail=True))
+    transmitter = fake_transmitter()
+    working = TransmitterDaemon(socket_path, transmitter_factory=lambda device: transmitter)
+    worker = DaemonTransmitter("/dev/lirc0", socket_path)
+
+    async def scenario():
+        with pytest.raises(TransmitterError, match="not reachable"):
+            await worker.send(PULSES)
+
+        await failing.start()
+        with pytest.raises(TransmitterError, match="fake transmitter failure"):
+            await worker.send(PULSES)
+        await failing.stop()
+
+        # The idle connection to the stopped daemon is replaced transparently
+        await working.start()
+        try:
+            await worker.send(PULSES)
+        finally:
+            await worker.close()
+            await working.stop()
+
+    asyncio.run(scenario())
+    assert len(transmitter.frames) == 1
+
+
+def test_cancelled_requests_close_their_connection(socket_path, fake_transmitter, monkeypatch):
+    transmitter = fake_transmitter(airtime=0.2)
+    daemon = TransmitterDaemon(socket_path, transmitter_factory=lambda device: transmitter)
+    worker = DaemonTransmitter("/dev/lirc0", socket_path)
+    opened = []
+    open_unix_connection = asyncio.open_unix_connection
+
+    async def tracked_connection(*args, **kwargs):
+        opened.append(await open_unix_connection(*args, **kwargs))
+        return opened[-1]
+
+    monkeypatch.setattr(asyncio, "open_unix_connection", tracked_connection)
+
+    async def scenario():
+        await daemon.start()
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(worker.send(PULSES), 0.05)
+            closed = opened[0][1].is_closing()
+            # The next request gets its own reply, not the late one
+            status = await worker._request({"op": "status"})
+        finally:
+            await worker.close()
+            await daemon.stop()
+        return closed, status
+
+    closed, status = asyncio.run(scenario())
+    assert closed
+    assert len(opened) == 2
+    assert "emitters" in status
@@ -0,0 +1,129 @@
+import asyncio
+from array import array
+
+import pytest
+
+from models.ac_model import ACMode, ACTempControl
+from services.ac_service import ACService, IRTransmissionError
+from services.code_library import IRCode
+from services.tx_scheduler import PRIORITY_ADJUST, PRIORITY_MODE, TransmitScheduler
+
+
+def _code(name: str, first: int) -> IRCode:
+    return IRCode(name, array("I", [first, 500, 560]))
+
+
+def test_frames_never_overlap_and_keep_the_gap(fake_transmitter):
+    transmitter = fake_transmitter(airtime=0.05)
+    scheduler = TransmitScheduler(transmitter, frame_gap=0.03)
+
+    async def scenario():
+        await asyncio.gather(*(scheduler.submit(_code(f"c{i}", 1000 + i)) for i in range(4)))
+
+    asyncio.run(scenario())
+    assert transmitter.max_active == 1
+    assert len(transmitter.frames) == 4
+    for (_, _, _, previous_end), (_, _, next_start, _) in zip(transmitter.frames, transmitter.frames[1:]):
+        assert next_start - previous_end >= 0.029
+
+
+def test_mode_changes_jump_ahead_of_increments(fake_transmitter):
+    transmitter = fake_transmitter(airtime=0.05)
+    scheduler = TransmitScheduler(transmitter, frame_gap=0)
+
+    async def scenario():
+        first = asyncio.create_task(scheduler.submit(_code("first", 1)))
+        await asyncio.sleep(0.01)
+        increments = [
+            asyncio.create_task(scheduler.submit(_code(f"up{i}", 10 + i), priority=PRIORITY_ADJUST))
+            for i in range(2)
+        ]
+        await asyncio.sleep(0)
+        off = asyncio.create_task(scheduler.submit(_code("off", 99), priority=PRIORITY_MODE))
+        await asyncio.gather(first, off, *increments)
+
+    asyncio.run(scenario())
+    assert [frame[0][0] for frame in transmitter.frames] == [1, 99, 10, 11]
+
+
+def test_superseded_mode_commands_are_latest_wins(fake_transmitter):
+    transmitter = fake_transmitter(airtime=0.05)
+    scheduler = TransmitScheduler(transmitter, frame_gap=0)
+
+    async def scenario():
+        busy = asyncio.create_task(scheduler.submit(_code("busy", 1)))
+        await asyncio.sleep(0.01)
+        heater = asyncio.create_task(scheduler.submit(_code("heater_on", 2), coalesce_key="ac:mode"))
+        await asyncio.sleep(0)
+        off = asyncio.create_task(scheduler.submit(_code("off", 3), coalesce_key="ac:mode"))
+        await busy
+        return await heater, await off
+
+    heater, off = asyncio.run(scenario())
+    assert [frame[0][0] for frame in transmitter.frames] == [1, 3]
+    assert heater.code_name == off.code_name == "off"
+    assert scheduler.coalesced == 1
+
+
+def test_repeated_increments_go_out_as_one_burst(fake_transmitter):
+    transmitter = fake_transmitter(airtime=0.05)
+    scheduler = TransmitScheduler(transmitter, frame_gap=0.02)
+
+    async def scenario():
+        busy = asyncio.create_task(scheduler.submit(_code("busy", 1)))
+        await asyncio.sleep(0.01)
+        presses = [
+            scheduler.submit(_code("up", 7), priority=PRIORITY_ADJUST, coalesce_key="ac:up", accumulate=True)
+            for _ in range(3)
+        ]
+        return await asyncio.gather(busy, *presses)
+
+    receipts = asyncio.run(scenario())
+    assert len(transmitter.frames) == 2
+    assert transmitter.frames[1][0] == [7, 500, 560, 20000, 7, 500, 560, 20000, 7, 500, 560]
+    assert [receipt.repeat for receipt in receipts[1:]] == [3, 3, 3]
+
+
+def test_queue_depth_and_wait_are_reported(fake_transmitter):
+    transmitter = fake_transmitter(airtime=0.05)
+    scheduler = TransmitScheduler(transmitter, frame_gap=0)
+
+    async def scenario():
+        tasks = [asyncio.create_task(scheduler.submit(_code(f"c{i}", i + 1))) for i in range(3)]
+        await asyncio.sleep(0.01)
+        depth = scheduler.queue_depth
+        receipts = await asyncio.gather(*tasks)
+        return depth, receipts
+
+    depth, receipts = asyncio.run(scenario())
+    assert depth == 2
+    assert receipts[0].wait < 0.01
+    assert receipts[2].wait >= 0.09
+    stats = scheduler.stats()
+    assert stats["queue_depth"] == 0
+    assert stats["transmitted"] == 3
+    assert stats["max_wait_ms"] >= 90
+
+
+def test_failures_reach_every_waiter_and_map_to_service_error(fake_transmitter):
+    service = ACService(transmitter=fake_transmitter(airtime=0, fail=True))
+
+    with pytest.raises(IRTransmissionError):
+        asyncio.run(service.set_ac_mode(ACMode.OFF))
+
+
+def test_service_reports_superseded_mode(fake_transmitter):
+    service = ACService(transmitter=fake_transmitter(airtime=0.05))
+
+    async def scenario():
+        busy = asyncio.create_task(service.control_temperature(ACTempControl.HEATER_TEMP_UP))
+        await asyncio.sleep(0.01)
+        return await asyncio.gather(
+            busy,
+            service.set_ac_mode(ACMode.HEATER_ON),
+            service.set_ac_mode(ACMode.OFF),
+        )
+
+    _, heater, off = asyncio.run(scenario())
+    assert "superseded by ac_off" in heater["message"]
+    assert off["message"] == "AC set to off mode successfully"
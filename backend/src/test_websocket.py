@@ -0,0 +1,141 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from main import app
+from routers.device_router import registry
+from routers.ws_router import websocket_endpoint
+from services.event_bus import EventBus, get_event_bus
+
+
+def receive_until(websocket, kind, **match):
+    while True:
+        message = websocket.receive_json()
+        if message["type"] == kind and all(message.get(key) == value for key, value in match.items()):
+            return message
+
+
+def test_commands_and_events_reach_every_client():
+    client = TestClient(app)
+    with client.websocket_connect("/ws") as sender, client.websocket_connect("/ws") as watcher:
+        assert sender.receive_json()["type"] == "snapshot"
+        assert "light" in watcher.receive_json()["state"]
+
+        sender.send_json({"id": 7, "device": "light", "action": "dark"})
+        result = receive_until(sender, "result", id=7)
+        assert result["ok"] is True
+        assert result["result"]["mode"] == "dark"
+
+        # The other phone learns about the change without polling
+        events = {}
+        while len(events) < 2:
+            message = watcher.receive_json()
+            events[message["type"]] = message
+        assert events["transmitted"]["code"] == "light_dark"
+        assert events["transmitted"]["success"] is True
+        assert events["state"] == {"type": "state", "device": "light", "state": events["state"]["state"]}
+        assert events["state"]["state"]["mode"] == "dark"
+
+
+def test_bad_frames_get_errors_and_ping_gets_pong():
+    client = TestClient(app)
+    with client.websocket_connect("/ws") as websocket:
+        websocket.receive_json()
+        websocket.send_text("not json")
+        assert websocket.receive_json()["type"] == "error"
+        websocket.send_bytes(b'{"type": "ping"}')
+        assert websocket.receive_json()["type"] == "error"
+        for not_an_object in ("[]", "1"):
+            websocket.send_text(not_an_object)
+            assert websocket.receive_json()["type"] == "error"
+        websocket.send_json({"type": "ping"})
+        assert websocket.receive_json() == {"type": "pong"}
+        websocket.send_json({"id": "x", "device": "light", "action": "disco"})
+        result = receive_until(websocket, "result", id="x")
+        assert (result["ok"], result["status"]) == (False, 404)
+
+
+def test_unexpected_command_errors_are_answered(monkeypatch):
+    def broken_lookup(device, action):
+        raise ValueError("malformed command")
+
+    monkeypatch.setattr(registry, "lookup", broken_lookup)
+    client = TestClient(app)
+    with client.websocket_connect("/ws") as websocket:
+        websocket.receive_json()
+        websocket.send_json({"id": 3, "device": "light", "action": "on"})
+        result = receive_until(websocket, "result", id=3)
+        assert (result["ok"], result["status"]) == (False, 500)
+        # The connection survives the failed command
+        websocket.send_json({"type": "ping"})
+        assert receive_until(websocket, "pong") == {"type": "pong"}
+
+
+class SlowSocket:
+    """Just enough of a WebSocket to see how many frames are being written at once"""
+
+    client = None
+
+    def __init__(self, frames):
+        self.frames = list(frames)
+        self.sent = []
+        self.writing = 0
+        self.max_writing = 0
+
+    async def accept(self):
+        pass
+
+    async def receive(self):
+        if self.frames:
+            return {"type": "websocket.receive", "text": self.frames.pop(0)}
+        # Stay connected until the commands are being answered
+        await asyncio.sleep(0.01)
+        return {"type": "websocket.disconnect", "code": 1000}
+
+    async def send_text(self, text):
+        self.writing += 1
+        self.max_writing = max(self.max_writing, self.writing)
+        await asyncio.sleep(0.001)
+        self.sent.append(text)
+        self.writing -= 1
+
+
+def test_frames_have_one_writer_and_commands_finish_on_close(monkeypatch):
+    finished = []
+
+    class Entry:
+        device = "light"
+
+        @staticmethod
+        async def handler():
+            get_event_bus().publish({"type": "state", "device": "light"})
+            await asyncio.sleep(0.02)
+            finished.append(True)
+            return {"mode": "on"}
+
+    monkeypatch.setattr(registry, "lookup", lambda device, action: Entry)
+    websocket = SlowSocket(['{"id": %d, "device": "light", "action": "on"}' % index for index in range(5)] + ["[]"])
+
+    async def scenario():
+        await websocket_endpoint(websocket)
+        return [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+
+    assert asyncio.run(scenario()) == []
+    assert websocket.max_writing == 1
+    # Closing the socket waited for the commands instead of abandoning them
+    assert len(finished) == 5
+
+
+def test_slow_subscribers_drop_oldest_events():
+    async def scenario():
+        bus = EventBus(queue_size=2)
+        queue = bus.subscribe()
+        for index in range(5):
+            bus.publish({"index": index})
+        bus.unsubscribe(queue)
+        bus.publish({"index": 5})
+        return [queue.get_nowait() for _ in range(queue.qsize())], bus
+
+    received, bus = asyncio.run(scenario())
+    assert received == ['{"index":3}', '{"index":4}']
+    assert (bus.published, bus.dropped, bus.subscribers) == (5, 3, 0)